@@ -0,0 +1,30 @@
+"""Add index for login history cursor pagination
+
+Revision ID: 180fa445663a
+Revises: 409dd4ea6da2
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '180fa445663a'
+down_revision: Union[str, None] = '409dd4ea6da2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_user_login_history_user_id_login_at_id',
+        'user_login_history',
+        ['user_id', 'login_at', 'id'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_user_login_history_user_id_login_at_id', table_name='user_login_history')
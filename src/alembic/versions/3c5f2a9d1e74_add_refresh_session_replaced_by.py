@@ -0,0 +1,28 @@
+"""Add replaced_by to refresh sessions
+
+Revision ID: 3c5f2a9d1e74
+Revises: 8d07c764a787
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c5f2a9d1e74'
+down_revision: Union[str, None] = '8d07c764a787'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # jti токена, которым сессия заменена при ротации. Сессии, закрытые выходом,
+    # лимитом сессий или сменой пароля, его не получают
+    op.add_column('refresh_sessions', sa.Column('replaced_by', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('refresh_sessions', 'replaced_by')
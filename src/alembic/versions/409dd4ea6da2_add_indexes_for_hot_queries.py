@@ -0,0 +1,59 @@
+"""Add indexes for hot queries and primary keys on association tables
+
+Revision ID: 409dd4ea6da2
+Revises: 7e6efc96b8a8
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '409dd4ea6da2'
+down_revision: Union[str, None] = '7e6efc96b8a8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+ASSOCIATION_TABLES = {
+    'groups_users': ('group_id', 'user_id'),
+    'groups_permissions': ('group_id', 'permission_id'),
+}
+
+
+def upgrade() -> None:
+    # перед созданием первичных ключей удаляем неполные строки и дубликаты
+    for table, (first_column, second_column) in ASSOCIATION_TABLES.items():
+        op.execute(f'DELETE FROM {table} WHERE {first_column} IS NULL OR {second_column} IS NULL')
+        op.execute(
+            f'DELETE FROM {table} a USING {table} b '
+            f'WHERE a.ctid < b.ctid '
+            f'AND a.{first_column} = b.{first_column} AND a.{second_column} = b.{second_column}'
+        )
+        op.alter_column(table, first_column, nullable=False)
+        op.alter_column(table, second_column, nullable=False)
+        op.create_primary_key(f'{table}_pkey', table, [first_column, second_column])
+
+    op.create_index('ix_groups_users_user_id', 'groups_users', ['user_id'], unique=False)
+    op.create_index('ix_groups_permissions_permission_id', 'groups_permissions', ['permission_id'], unique=False)
+    op.create_index('ix_refresh_sessions_refresh_jti', 'refresh_sessions', ['refresh_jti'], unique=True)
+    op.create_index(
+        'ix_user_login_history_user_id_user_agent_logout_at',
+        'user_login_history',
+        ['user_id', 'user_agent', 'logout_at'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_user_login_history_user_id_user_agent_logout_at', table_name='user_login_history')
+    op.drop_index('ix_refresh_sessions_refresh_jti', table_name='refresh_sessions')
+    op.drop_index('ix_groups_permissions_permission_id', table_name='groups_permissions')
+    op.drop_index('ix_groups_users_user_id', table_name='groups_users')
+
+    for table, (first_column, second_column) in ASSOCIATION_TABLES.items():
+        op.drop_constraint(f'{table}_pkey', table, type_='primary')
+        op.alter_column(table, first_column, nullable=True)
+        op.alter_column(table, second_column, nullable=True)
@@ -0,0 +1,34 @@
+"""Add partial index on active refresh sessions
+
+Revision ID: 7e6efc96b8a8
+Revises: 7791c7ec62c5
+Create Date: 2026-10-18 12:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7e6efc96b8a8'
+down_revision: Union[str, None] = '7791c7ec62c5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # индекс содержит только открытые сессии, поэтому его размер не растет
+    # вместе с историей входов пользователя
+    op.create_index(
+        'ix_refresh_sessions_user_id_active',
+        'refresh_sessions',
+        ['user_id'],
+        unique=False,
+        postgresql_where=sa.text('is_active'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_refresh_sessions_user_id_active', table_name='refresh_sessions')
@@ -0,0 +1,83 @@
+"""Partition user_login_history by month
+
+Revision ID: 8d07c764a787
+Revises: 180fa445663a
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from core.config import settings
+from db.partitions import (
+    add_months,
+    get_create_default_partition_sql,
+    get_create_partition_sql,
+    get_month_start,
+)
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d07c764a787'
+down_revision: Union[str, None] = '180fa445663a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+TABLE = 'user_login_history'
+COLUMNS = 'id, user_id, user_agent, login_at, logout_at'
+INDEXES = {
+    'ix_user_login_history_user_id_user_agent_logout_at': '(user_id, user_agent, logout_at)',
+    'ix_user_login_history_user_id_login_at_id': '(user_id, login_at, id)',
+}
+
+
+def create_constraints_and_indexes(primary_key: list[str]) -> None:
+    op.create_primary_key(f'{TABLE}_pkey', TABLE, primary_key)
+    op.create_foreign_key(f'{TABLE}_user_id_fkey', TABLE, 'users', ['user_id'], ['id'])
+    for name, columns in INDEXES.items():
+        op.execute(f'CREATE INDEX {name} ON {TABLE} {columns}')
+
+
+def create_table(partition_by: str = '') -> None:
+    op.execute(
+        f'CREATE TABLE {TABLE} ('
+        f'id UUID NOT NULL, '
+        f'user_id UUID, '
+        f'user_agent VARCHAR(255) NOT NULL, '
+        f'login_at TIMESTAMP WITHOUT TIME ZONE NOT NULL, '
+        f'logout_at TIMESTAMP WITHOUT TIME ZONE'
+        f') {partition_by}'
+    )
+
+
+def upgrade() -> None:
+    # имена ограничений и индексов освобождаются после удаления старой таблицы
+    op.rename_table(TABLE, f'{TABLE}_old')
+    create_table('PARTITION BY RANGE (login_at)')
+
+    # партиции от самой старой записи до LOGIN_HISTORY_PARTITIONS_AHEAD месяцев вперед
+    current_month = get_month_start(date.today())
+    first_login_at = op.get_bind().execute(sa.text(f'SELECT min(login_at) FROM {TABLE}_old')).scalar()
+    month = get_month_start(first_login_at.date()) if first_login_at else current_month
+    while month <= add_months(current_month, settings.LOGIN_HISTORY_PARTITIONS_AHEAD):
+        op.execute(get_create_partition_sql(TABLE, month))
+        month = add_months(month, 1)
+    op.execute(get_create_default_partition_sql(TABLE))
+
+    op.execute(f'INSERT INTO {TABLE} ({COLUMNS}) SELECT {COLUMNS} FROM {TABLE}_old')
+    op.drop_table(f'{TABLE}_old')
+    create_constraints_and_indexes(['id', 'login_at'])
+
+
+def downgrade() -> None:
+    op.rename_table(TABLE, f'{TABLE}_partitioned')
+    create_table()
+    op.execute(f'INSERT INTO {TABLE} ({COLUMNS}) SELECT {COLUMNS} FROM {TABLE}_partitioned')
+    # родительская таблица удаляется вместе со всеми партициями
+    op.drop_table(f'{TABLE}_partitioned')
+    create_constraints_and_indexes(['id'])
+    op.create_unique_constraint(f'{TABLE}_id_key', TABLE, ['id'])
@@ -6,7 +6,7 @@ from async_fastapi_jwt_auth import AuthJWT
 from fastapi.security import HTTPBearer
 from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse, Response
-from fastapi import APIRouter, Depends, Header, HTTPException, Path, Body, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Path, Body, Query, Request
 
 from core.config import JWTSettings
 from schemas.entity import (
@@ -21,6 +21,8 @@ from schemas.entity import (
 from services.user_services import get_user_service, UserService
 from services.user import UserPermissionsService, get_user_permissions_service
 from services.authorization import AuthorizationChecker
+from services.rate_limiter import RateLimiter, get_rate_limiter
+from services.tokens import RequestAuthJWT
 
 MAX_SESSION_NUMBER = 5
 
@@ -93,9 +95,15 @@ async def delete_group(
     status_code=HTTPStatus.CREATED
 )
 async def create_user(
+        request: Request,
         user_create: UserCreate,
         user_service: UserService = Depends(get_user_service),
+        rate_limiter: RateLimiter | None = Depends(get_rate_limiter),
 ) -> UserInDB | HTTPException:
+    # лимит проверяется до хеширования пароля
+    if rate_limiter:
+        await rate_limiter.check('signup', rate_limiter.get_client_ip(request), user_create.username)
+
     user_dto = jsonable_encoder(user_create)
 
     repeated_pass_true = await user_service.check_repeated_password(user_dto.get('password'), user_dto.get('password'))
@@ -126,8 +134,8 @@ async def change_password(
     updated_user = await user_service.update_password(user_dto)
     if updated_user:
         # при смене пароля разлогиниваем все устройства
-        user = await user_service.get_user_by_username(user_dto.get('username'))
-        await user_service.del_all_refresh_sessions_in_db(user)
+        await user_service.del_all_refresh_sessions_in_db(updated_user)
+        await user_service.token_handler.revoke_user_tokens(updated_user.id)
 
         return updated_user
     else:
@@ -143,10 +151,12 @@ async def change_password(
     response_description='Аутентификация пользователя по логину и паролю'
 )
 async def login(
+        request: Request,
         user_signin: UserSighIn,
         user_service: UserService = Depends(get_user_service),
-        Authorize: AuthJWT = Depends(),
+        Authorize: RequestAuthJWT = Depends(),
         user_agent: Annotated[str | None, Header()] = None,
+        rate_limiter: RateLimiter | None = Depends(get_rate_limiter),
 ):
     """Вход пользователя в аккаунт."""
     if not user_agent:
@@ -155,50 +165,22 @@ async def login(
             detail='Вы пытаетесь зайти с неизвестного устройства'
         )
 
-    # проверяем валидность имени пользователя и пароля
-    user = await user_service.get_user_by_username(user_signin.username)
-    if not user or not user.check_password(user_signin.password):
-        raise HTTPException(
-            status_code=HTTPStatus.UNAUTHORIZED,
-            detail="Неверное имя пользователя или пароль"
-        )
-
-    # проверяем, что пользователь уже не вошел с данного устройства
-    active_user_login = await user_service.check_if_user_login(str(user.id), user_agent)
-    if active_user_login:
-        return JSONResponse(
-            status_code=HTTPStatus.BAD_REQUEST,
-            content={'detail': 'Данный пользователь уже совершил вход с данного устройства'})
-
-    user_claims = {
-        'user_id': str(user.id),
-        'permissions': await user_service.get_user_permissions(user.id)
-    }
-
-    # создаем пару access и refresh токенов
-    access_token = await Authorize.create_access_token(
-        subject=user.username,
-        user_claims=user_claims
-    )
-    refresh_token = await Authorize.create_refresh_token(
-        subject=user.username,
-        user_claims=user_claims
+    # лимит проверяется до проверки пароля
+    if rate_limiter:
+        await rate_limiter.check('signin', rate_limiter.get_client_ip(request), user_signin.username)
+
+    # проверка пароля, лимит сессий, refresh сессия и история входа в одной транзакции
+    token_pair = await user_service.signin(
+        user_signin.username,
+        user_signin.password,
+        user_agent,
+        Authorize,
+        max_sessions=MAX_SESSION_NUMBER,
     )
 
-    # защита от превышения максимально возможного количества сессий
-    session_number = await user_service.count_refresh_sessions(str(user.id))
-    if session_number > MAX_SESSION_NUMBER:
-        await user_service.del_all_refresh_sessions_in_db(user)
-
-    decrypted_token = await Authorize.get_raw_jwt(refresh_token)
-    await user_service.put_refresh_session_in_db(str(user.id), user_agent, decrypted_token)
-
-    # записываем историю входа в аккаунт
-    await user_service.put_login_history_in_db(str(user.id), user_agent)
-
     return JSONResponse(content={
-        'access_token': access_token,
-        'refresh_token': refresh_token
+        'access_token': token_pair.access_token,
+        'refresh_token': token_pair.refresh_token
     })
 
 
@@ -210,7 +192,7 @@ async def login(
 )
 async def logout(
         user_service: UserService = Depends(get_user_service),
-        Authorize: AuthJWT = Depends(),
+        Authorize: RequestAuthJWT = Depends(),
         user_agent: Annotated[str | None, Header()] = None,
         authorization: str = Depends(security)
 ):
@@ -219,10 +201,9 @@ async def logout(
         raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail='Вы пытаетесь зайти с неизвестного устройства')
 
     # проверяем наличие и валидность access токена
-    await Authorize.jwt_required()
+    decrypted_token = await Authorize.get_access_claims()
 
     # проверяем, что access токен не в списке невалидных токенов
-    decrypted_token = await Authorize.get_raw_jwt()
     await user_service.token_handler.check_if_token_is_valid(decrypted_token)
 
     # записываем текущий access токен в список невалидных токенов
@@ -249,7 +230,7 @@ async def logout(
 )
 async def refresh(
         user_service: UserService = Depends(get_user_service),
-        Authorize: AuthJWT = Depends(),
+        Authorize: RequestAuthJWT = Depends(),
         user_agent: Annotated[str | None, Header()] = None,
         authorization: str = Depends(security),
 ):
@@ -261,46 +242,31 @@ async def refresh(
         )
 
     # проверяем наличие и валидность refresh токена
-    await Authorize.jwt_refresh_token_required()
-
-    decrypted_token = await Authorize.get_raw_jwt()
+    decrypted_token = await Authorize.get_refresh_claims()
     user_id = decrypted_token['user_id']
 
-    # удаляем сессию из таблицы refresh_sessions
-    session_exist = await user_service.check_if_session_exist(user_id, user_agent)
-    if session_exist:
-        await user_service.del_refresh_session_in_db(user_id, user_agent)
-    else:
-        raise HTTPException(
-            status_code=HTTPStatus.UNAUTHORIZED,
-            detail='Невалидный токен для данного устройства',
-        )
-
     # создаем пару access и refresh токенов
-    username = await Authorize.get_jwt_subject()
     user_claims = {
         'user_id': user_id,
         'permissions': await user_service.get_user_permissions(user_id)
     }
+    token_pair = await Authorize.create_token_pair(decrypted_token['sub'], user_claims)
 
-    access_token = await Authorize.create_access_token(
-        subject=username,
-        user_claims=user_claims
-    )
-    refresh_token = await Authorize.create_refresh_token(
-        subject=username,
-        user_claims=user_claims
+    # заменяем сессию устройства сессией нового refresh токена
+    is_rotated = await user_service.rotate_refresh_session(
+        user_id, user_agent, decrypted_token['jti'], token_pair.refresh_claims,
     )
-
-    # сохраняем refresh токен и информацию об устройстве, с которого был совершен вход, в базу данных
-    new_decrypted_token = await Authorize.get_raw_jwt(refresh_token)
-    await user_service.put_refresh_session_in_db(user_id, user_agent, new_decrypted_token)
+    if not is_rotated:
+        raise HTTPException(
+            status_code=HTTPStatus.UNAUTHORIZED,
+            detail='Невалидный токен для данного устройства',
+        )
 
     return JSONResponse(
         status_code=HTTPStatus.OK,
         content={
-            'access_token': access_token,
-            'refresh_token': refresh_token,
+            'access_token': token_pair.access_token,
+            'refresh_token': token_pair.refresh_token,
         })
 
 
@@ -313,16 +279,21 @@ async def get_history(
         user_id: UUID,
         page_size: int = Query(ge=1, default=2),
         page_number: int = Query(ge=1, default=1),
+        cursor: str | None = Query(default=None, description='Курсор next_cursor из предыдущего ответа'),
+        with_total: bool = Query(default=False, description='Вернуть общее число записей'),
         user_service: UserService = Depends(get_user_service),
 ):
-    history = await user_service.get_login_history(user_id, page_size, page_number)
-    count = await user_service.get_login_history_count(user_id)
-    previous, next_page = await user_service.calc_previous_and_next_pages(page_number, page_size, count)
+    history, next_cursor = await user_service.get_login_history(user_id, page_size, page_number, cursor)
 
     result = {
-        'previous': previous,
-        'next': next_page,
+        'next_cursor': next_cursor,
         'items': history
     }
+    # номера страниц возвращаются только в режиме совместимости без курсора
+    if not cursor:
+        result['previous'] = page_number - 1 if page_number != 1 else None
+        result['next'] = page_number + 1 if next_cursor else None
+    if with_total:
+        result['total'] = await user_service.get_login_history_count(user_id)
 
     return result
@@ -0,0 +1,32 @@
+from http import HTTPStatus
+from typing import Annotated
+
+from fastapi import APIRouter, Header
+from fastapi.responses import Response
+
+from core import jwt_keys
+from core.config import settings
+
+
+router = APIRouter()
+
+
+@router.get(
+    '/jwks.json',
+    summary='Открытые ключи подписи токенов',
+    description='JWKS с открытыми ключами, которыми другие сервисы проверяют подпись access токенов',
+    response_description='Набор открытых ключей в формате JWK',
+)
+async def get_jwks(
+        if_none_match: Annotated[str | None, Header()] = None,
+) -> Response:
+    """Набор открытых ключей подписи токенов."""
+    key_set = jwt_keys.jwt_key_set
+    headers = {
+        'ETag': key_set.jwks_etag,
+        'Cache-Control': f'public, max-age={settings.JWKS_CACHE_MAX_AGE}',
+    }
+    if if_none_match == key_set.jwks_etag:
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=headers)
+
+    return Response(content=key_set.jwks, media_type='application/json', headers=headers)
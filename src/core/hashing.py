@@ -0,0 +1,260 @@
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from core.config import Settings, settings
+from core.metrics import (
+	PASSWORD_HASH_DURATION,
+	PASSWORD_HASH_IN_FLIGHT,
+	PASSWORD_HASH_QUEUE_WAIT,
+	PASSWORD_HASH_REJECTED,
+)
+
+
+class BaseHasher(ABC):
+	"""Схема хеширования паролей с фиксированным профилем стоимости."""
+	scheme: str
+
+	@abstractmethod
+	def identify(self, password_hash: str) -> bool:
+		"""Проверяет, что хеш был получен этой схемой."""
+
+	@abstractmethod
+	def hash(self, password: str) -> str:
+		pass
+
+	@abstractmethod
+	def verify(self, password_hash: str, password: str) -> bool:
+		pass
+
+	@abstractmethod
+	def needs_rehash(self, password_hash: str) -> bool:
+		"""Проверяет, что параметры хеша отличаются от текущего профиля."""
+
+
+class WerkzeugHasher(BaseHasher):
+	"""Схемы werkzeug хранят параметры в префиксе хеша: `method:args$salt$hash`."""
+
+	@property
+	@abstractmethod
+	def method(self) -> str:
+		pass
+
+	def identify(self, password_hash: str) -> bool:
+		return password_hash.split(':', 1)[0] == self.scheme
+
+	def hash(self, password: str) -> str:
+		return generate_password_hash(password, method=self.method)
+
+	def verify(self, password_hash: str, password: str) -> bool:
+		return check_password_hash(password_hash, password)
+
+	def needs_rehash(self, password_hash: str) -> bool:
+		return password_hash.split('$', 1)[0] != self.method
+
+
+class Pbkdf2Hasher(WerkzeugHasher):
+	scheme = 'pbkdf2'
+
+	def __init__(self, hash_name: str = 'sha256', iterations: int = 600000) -> None:
+		self.hash_name = hash_name
+		self.iterations = iterations
+
+	@property
+	def method(self) -> str:
+		return f'pbkdf2:{self.hash_name}:{self.iterations}'
+
+
+class ScryptHasher(WerkzeugHasher):
+	scheme = 'scrypt'
+
+	def __init__(self, n: int = 2 ** 15, r: int = 8, p: int = 1) -> None:
+		self.n = n
+		self.r = r
+		self.p = p
+
+	@property
+	def method(self) -> str:
+		return f'scrypt:{self.n}:{self.r}:{self.p}'
+
+
+class Argon2Hasher(BaseHasher):
+	"""Argon2id, требует установленного пакета argon2-cffi."""
+	scheme = 'argon2'
+
+	def __init__(self, time_cost: int = 3, memory_cost: int = 65536, parallelism: int = 4) -> None:
+		self.time_cost = time_cost
+		self.memory_cost = memory_cost
+		self.parallelism = parallelism
+
+	def _hasher(self):
+		try:
+			from argon2 import PasswordHasher as Argon2PasswordHasher
+		except ImportError:
+			raise RuntimeError('argon2-cffi must be installed to use the argon2 password hash scheme')
+		return Argon2PasswordHasher(
+			time_cost=self.time_cost,
+			memory_cost=self.memory_cost,
+			parallelism=self.parallelism,
+		)
+
+	def identify(self, password_hash: str) -> bool:
+		return password_hash.startswith('$argon2')
+
+	def hash(self, password: str) -> str:
+		return self._hasher().hash(password)
+
+	def verify(self, password_hash: str, password: str) -> bool:
+		# _hasher сообщает об отсутствии argon2-cffi раньше импорта исключений пакета
+		hasher = self._hasher()
+		from argon2.exceptions import InvalidHashError, VerificationError
+
+		try:
+			return hasher.verify(password_hash, password)
+		except (VerificationError, InvalidHashError):
+			return False
+
+	def needs_rehash(self, password_hash: str) -> bool:
+		return self._hasher().check_needs_rehash(password_hash)
+
+
+class PasswordHashContext:
+	"""Реестр схем хеширования.
+
+	Новые хеши строятся схемой по умолчанию, а проверка выполняется той схемой,
+	которой был получен сохраненный хеш. Хеш, полученный другой схемой
+	или с другими параметрами, нужно пересчитать при следующем входе.
+	"""
+
+	def __init__(self, default: BaseHasher, hashers: list[BaseHasher]) -> None:
+		self.default = default
+		self.hashers = [default] + [hasher for hasher in hashers if hasher.scheme != default.scheme]
+
+	def identify(self, password_hash: str) -> BaseHasher | None:
+		for hasher in self.hashers:
+			if hasher.identify(password_hash):
+				return hasher
+		return None
+
+	def hash(self, password: str) -> str:
+		return self.default.hash(password)
+
+	def verify(self, password_hash: str, password: str) -> bool:
+		hasher = self.identify(password_hash)
+		if not hasher:
+			return False
+		return hasher.verify(password_hash, password)
+
+	def needs_rehash(self, password_hash: str) -> bool:
+		hasher = self.identify(password_hash)
+		return hasher is not self.default or hasher.needs_rehash(password_hash)
+
+
+def create_hash_context(settings: Settings) -> PasswordHashContext:
+	hashers = {
+		Pbkdf2Hasher.scheme: Pbkdf2Hasher(
+			hash_name=settings.PASSWORD_PBKDF2_HASH_NAME,
+			iterations=settings.PASSWORD_PBKDF2_ITERATIONS,
+		),
+		ScryptHasher.scheme: ScryptHasher(
+			n=settings.PASSWORD_SCRYPT_N,
+			r=settings.PASSWORD_SCRYPT_R,
+			p=settings.PASSWORD_SCRYPT_P,
+		),
+		Argon2Hasher.scheme: Argon2Hasher(
+			time_cost=settings.PASSWORD_ARGON2_TIME_COST,
+			memory_cost=settings.PASSWORD_ARGON2_MEMORY_COST,
+			parallelism=settings.PASSWORD_ARGON2_PARALLELISM,
+		),
+	}
+	return PasswordHashContext(
+		hashers[settings.PASSWORD_HASH_SCHEME],
+		list(hashers.values()),
+	)
+
+
+hash_context = create_hash_context(settings)
+
+
+class PasswordHasherOverloaded(Exception):
+	"""Очередь пула хеширования паролей переполнена."""
+
+
+def _timed_call(func: Callable, *args) -> tuple[Any, float, float]:
+	"""Выполняется в воркере: возвращает результат и моменты начала и конца работы."""
+	started_at = time.time()
+	result = func(*args)
+	return result, started_at, time.time()
+
+
+class PasswordHasher:
+	"""Асинхронное хеширование паролей в ограниченном пуле потоков или процессов.
+
+	Хеширование выполняется вне event loop, поэтому вход одного пользователя
+	не блокирует обработку остальных запросов. Если число задач в очереди
+	и в работе превышает max_workers + max_queue_size, новая задача
+	отклоняется исключением PasswordHasherOverloaded.
+	"""
+
+	def __init__(
+		self,
+		context: PasswordHashContext,
+		executor: str = 'thread',
+		max_workers: int = 4,
+		max_queue_size: int = 64,
+	) -> None:
+		self.context = context
+		self._executor = self._create_executor(executor, max_workers)
+		self._max_in_flight = max_workers + max_queue_size
+		self._in_flight = 0
+
+	@staticmethod
+	def _create_executor(executor: str, max_workers: int) -> Executor:
+		if executor == 'process':
+			return ProcessPoolExecutor(max_workers=max_workers)
+		if executor == 'thread':
+			return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='password-hasher')
+		raise ValueError(f'Unknown password hasher executor: {executor}')
+
+	async def _run(self, operation: str, func: Callable, *args) -> Any:
+		if self._in_flight >= self._max_in_flight:
+			PASSWORD_HASH_REJECTED.labels(operation).inc()
+			raise PasswordHasherOverloaded()
+
+		self._in_flight += 1
+		PASSWORD_HASH_IN_FLIGHT.inc()
+		submitted_at = time.time()
+		try:
+			result, started_at, finished_at = await asyncio.get_running_loop().run_in_executor(
+				self._executor, _timed_call, func, *args
+			)
+		finally:
+			self._in_flight -= 1
+			PASSWORD_HASH_IN_FLIGHT.dec()
+
+		PASSWORD_HASH_QUEUE_WAIT.labels(operation).observe(max(started_at - submitted_at, 0))
+		PASSWORD_HASH_DURATION.labels(operation).observe(finished_at - started_at)
+		return result
+
+	async def hash(self, password: str) -> str:
+		return await self._run('hash', self.context.hash, password)
+
+	async def verify(self, password_hash: str, password: str) -> bool:
+		return await self._run('verify', self.context.verify, password_hash, password)
+
+	def needs_rehash(self, password_hash: str) -> bool:
+		return self.context.needs_rehash(password_hash)
+
+	def shutdown(self) -> None:
+		self._executor.shutdown(wait=True)
+
+
+password_hasher: PasswordHasher | None = None
+
+
+async def get_password_hasher() -> PasswordHasher:
+	return password_hasher
@@ -0,0 +1,115 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import Any
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+
+from core.config import Settings, settings
+
+
+ASYMMETRIC_ALGORITHMS = ('RS256', 'EdDSA')
+
+
+def get_key_algorithm(key: Any) -> str:
+	"""Определяет алгоритм подписи по типу ключа."""
+	if isinstance(key, (rsa.RSAPrivateKey, rsa.RSAPublicKey)):
+		return 'RS256'
+	if isinstance(key, (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey)):
+		return 'EdDSA'
+	raise ValueError(f'Неподдерживаемый тип ключа {type(key).__name__}')
+
+
+def generate_private_key(algorithm: str) -> bytes:
+	"""Создает закрытый ключ для алгоритма и возвращает его в формате PEM."""
+	if algorithm == 'RS256':
+		private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+	elif algorithm == 'EdDSA':
+		private_key = ed25519.Ed25519PrivateKey.generate()
+	else:
+		raise ValueError(f'Алгоритм {algorithm} не использует пару ключей')
+
+	return private_key.private_bytes(
+		encoding=serialization.Encoding.PEM,
+		format=serialization.PrivateFormat.PKCS8,
+		encryption_algorithm=serialization.NoEncryption(),
+	)
+
+
+class JWTKey:
+	"""Ключ подписи JWT с идентификатором kid, который пишется в заголовок токена."""
+
+	def __init__(self, kid: str, public_key: Any, private_key: Any = None) -> None:
+		self.kid = kid
+		self.public_key = public_key
+		self.private_key = private_key
+		self.algorithm = get_key_algorithm(public_key)
+
+	def to_jwk(self) -> dict:
+		jwk = jwt.get_algorithm_by_name(self.algorithm).to_jwk(self.public_key, as_dict=True)
+		jwk.update(kid=self.kid, alg=self.algorithm, use='sig')
+		return jwk
+
+
+class JWTKeySet:
+	"""Набор ключей подписи JWT.
+
+	Новые токены подписываются активным ключом. Остальные ключи после ротации
+	только проверяют подпись, пока не истекут выпущенные ими токены.
+	Открытые ключи публикуются в JWKS, чтобы другие сервисы проверяли
+	токены сами, без обращения к сервису авторизации.
+	"""
+
+	def __init__(self, algorithm: str, keys: list[JWTKey], active_kid: str | None = None) -> None:
+		self.algorithm = algorithm
+		self._keys = {key.kid: key for key in keys}
+		self.signing_key = None
+
+		if self.is_asymmetric:
+			self.signing_key = self._keys.get(active_kid)
+			if self.signing_key is None or self.signing_key.private_key is None:
+				raise ValueError(f'Не найден закрытый ключ с kid {active_kid}')
+			if self.signing_key.algorithm != algorithm:
+				raise ValueError(f'Ключ {active_kid} не подходит для алгоритма {algorithm}')
+
+		# документ JWKS неизменен до перезапуска сервиса, сериализуем его один раз
+		self.jwks = json.dumps(
+			{'keys': [key.to_jwk() for key in self._keys.values()]},
+			separators=(',', ':'),
+		).encode()
+		self.jwks_etag = f'"{hashlib.sha256(self.jwks).hexdigest()[:32]}"'
+
+	@property
+	def is_asymmetric(self) -> bool:
+		return self.algorithm in ASYMMETRIC_ALGORITHMS
+
+	def get_verification_key(self, kid: str | None) -> JWTKey | None:
+		return self._keys.get(kid)
+
+
+def load_keys(keys_dir: str) -> list[JWTKey]:
+	"""Загружает ключи из файлов <kid>.pem, закрытые или только открытые."""
+	keys = []
+	for path in sorted(Path(keys_dir).glob('*.pem')):
+		data = path.read_bytes()
+		if b'PRIVATE KEY' in data:
+			private_key = serialization.load_pem_private_key(data, password=None)
+			keys.append(JWTKey(path.stem, private_key.public_key(), private_key))
+		else:
+			keys.append(JWTKey(path.stem, serialization.load_pem_public_key(data)))
+	return keys
+
+
+def create_key_set(settings: Settings) -> JWTKeySet:
+	if settings.JWT_ALGORITHM not in ASYMMETRIC_ALGORITHMS:
+		return JWTKeySet(settings.JWT_ALGORITHM, [])
+	return JWTKeySet(
+		settings.JWT_ALGORITHM,
+		load_keys(settings.JWT_KEYS_DIR),
+		settings.JWT_ACTIVE_KID,
+	)
+
+
+jwt_key_set = create_key_set(settings)
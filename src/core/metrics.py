@@ -0,0 +1,139 @@
+import os
+
+from prometheus_client import (
+	CollectorRegistry,
+	Counter,
+	Gauge,
+	Histogram,
+	make_asgi_app,
+	multiprocess,
+)
+
+
+# Хеширование паролей
+PASSWORD_HASH_QUEUE_WAIT = Histogram(
+	'password_hash_queue_wait_seconds',
+	'Время ожидания задачи хеширования в очереди пула',
+	['operation'],
+)
+PASSWORD_HASH_DURATION = Histogram(
+	'password_hash_duration_seconds',
+	'Время вычисления хеша пароля в воркере',
+	['operation'],
+)
+PASSWORD_HASH_IN_FLIGHT = Gauge(
+	'password_hash_in_flight',
+	'Число задач хеширования в очереди и в работе',
+	multiprocess_mode='livesum',
+)
+PASSWORD_HASH_REJECTED = Counter(
+	'password_hash_rejected_total',
+	'Число задач хеширования, отклоненных из-за переполнения пула',
+	['operation'],
+)
+
+# Кеш привилегий пользователей
+PERMISSIONS_CACHE_HITS = Counter(
+	'permissions_cache_hits_total',
+	'Число чтений привилегий пользователя из кеша',
+)
+PERMISSIONS_CACHE_MISSES = Counter(
+	'permissions_cache_misses_total',
+	'Число чтений привилегий пользователя из базы данных',
+)
+
+# Список отозванных токенов
+DENYLIST_LOOKUPS = Counter(
+	'token_denylist_lookups_total',
+	'Число проверок jti по списку отозванных токенов',
+	['source'],
+)
+
+# Отложенная запись в базу данных: история входов, копия refresh сессий
+BATCH_WRITER_QUEUE_SIZE = Gauge(
+	'batch_writer_queue_size',
+	'Число событий, ожидающих записи в базу данных',
+	['writer'],
+	multiprocess_mode='livesum',
+)
+BATCH_WRITER_BATCH_SIZE = Histogram(
+	'batch_writer_batch_size',
+	'Число событий, записанных одной транзакцией',
+	['writer'],
+	buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+BATCH_WRITER_LAG = Histogram(
+	'batch_writer_lag_seconds',
+	'Время от постановки события в очередь до его записи',
+	['writer'],
+)
+BATCH_WRITER_DROPPED = Counter(
+	'batch_writer_dropped_total',
+	'Число событий, потерянных из-за переполнения очереди или ошибок записи',
+	['writer', 'reason'],
+)
+
+# Пул соединений с Postgres
+POSTGRES_POOL_CHECKED_OUT = Gauge(
+	'postgres_pool_checked_out',
+	'Число соединений с Postgres, выданных из пула',
+	multiprocess_mode='livesum',
+)
+POSTGRES_POOL_WAIT = Histogram(
+	'postgres_pool_wait_seconds',
+	'Время ожидания соединения из пула',
+	buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30),
+)
+POSTGRES_POOL_OVERFLOW = Counter(
+	'postgres_pool_overflow_total',
+	'Число соединений, открытых сверх размера пула',
+)
+POSTGRES_POOL_TIMEOUTS = Counter(
+	'postgres_pool_timeouts_total',
+	'Число запросов, не дождавшихся соединения из пула',
+)
+
+# Пул соединений с Redis
+REDIS_POOL_IN_USE = Gauge(
+	'redis_pool_in_use',
+	'Число соединений с Redis, выданных из пула',
+	multiprocess_mode='livesum',
+)
+REDIS_POOL_WAIT = Histogram(
+	'redis_pool_wait_seconds',
+	'Время получения соединения с Redis из пула',
+	buckets=(.0005, .001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5),
+)
+REDIS_POOL_ERRORS = Counter(
+	'redis_pool_errors_total',
+	'Число запросов, не получивших соединение с Redis: пул исчерпан или Redis недоступен',
+)
+DENYLIST_REDIS_FAILURES = Counter(
+	'token_denylist_redis_failures_total',
+	'Число проверок токена, при которых Redis не ответил вовремя',
+	['policy'],
+)
+
+# Ограничение частоты входов и регистраций
+RATE_LIMIT_REJECTED = Counter(
+	'rate_limit_rejected_total',
+	'Число запросов, отклоненных из-за превышения лимита',
+	['action', 'scope', 'source'],
+)
+RATE_LIMIT_REDIS_FAILURES = Counter(
+	'rate_limit_redis_failures_total',
+	'Число проверок лимитов, при которых Redis не ответил и действовали только лимиты воркера',
+)
+
+
+def make_metrics_app():
+	"""Возвращает ASGI-приложение для отдачи метрик в формате Prometheus.
+
+	При запуске под gunicorn с несколькими воркерами метрики собираются
+	из каталога PROMETHEUS_MULTIPROC_DIR.
+	"""
+	if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+		registry = CollectorRegistry()
+		multiprocess.MultiProcessCollector(registry)
+		return make_asgi_app(registry=registry)
+	return make_asgi_app()
@@ -0,0 +1,70 @@
+import hashlib
+import math
+import time
+
+
+class BloomFilter:
+	"""Фильтр Блума: отвечает «точно нет» или «возможно есть»."""
+
+	def __init__(self, capacity: int, error_rate: float) -> None:
+		self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+		self.hash_count = max(round(self.size / capacity * math.log(2)), 1)
+		self.bits = bytearray(math.ceil(self.size / 8))
+
+	def _get_positions(self, key: str) -> list[int]:
+		# двойное хеширование: k позиций из двух независимых 64-битных хешей
+		digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+		first, second = int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big') | 1
+		return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+	def add(self, key: str) -> None:
+		for position in self._get_positions(key):
+			self.bits[position >> 3] |= 1 << (position & 7)
+
+	def __contains__(self, key: str) -> bool:
+		return all(
+			self.bits[position >> 3] & (1 << (position & 7))
+			for position in self._get_positions(key)
+		)
+
+
+class TimeBucketedBloomFilter:
+	"""Набор фильтров Блума по окнам времени истечения токена.
+
+	Токен попадает в фильтр окна, в которое приходится его exp. Когда окно
+	заканчивается, все токены из него уже истекли, и фильтр удаляется целиком,
+	поэтому доля ложных срабатываний не растет со временем.
+	"""
+
+	def __init__(self, window: int, capacity: int, error_rate: float) -> None:
+		self.window = window
+		self.capacity = capacity
+		self.error_rate = error_rate
+		self._filters: dict[int, BloomFilter] = {}
+
+	def get_bucket(self, exp: int) -> int:
+		return exp // self.window
+
+	def get_active_buckets(self) -> range:
+		"""Окна, в которые могут попасть exp еще не истекших токенов."""
+		now = int(time.time())
+		return range(self.get_bucket(now), self.get_bucket(now + self.window) + 1)
+
+	def rotate(self) -> None:
+		current_bucket = self.get_bucket(int(time.time()))
+		for bucket in [bucket for bucket in self._filters if bucket < current_bucket]:
+			del self._filters[bucket]
+
+	def add(self, key: str, exp: int) -> None:
+		self.rotate()
+		bucket = self.get_bucket(exp)
+		if bucket not in self._filters:
+			self._filters[bucket] = BloomFilter(self.capacity, self.error_rate)
+		self._filters[bucket].add(key)
+
+	def might_contain(self, key: str, exp: int) -> bool:
+		bloom_filter = self._filters.get(self.get_bucket(exp))
+		return bloom_filter is not None and key in bloom_filter
+
+	def clear(self) -> None:
+		self._filters.clear()
@@ -0,0 +1,43 @@
+import time
+from collections import OrderedDict
+from typing import Any
+
+
+class LocalTTLCache:
+	"""Ограниченный LRU-кеш в памяти процесса, у каждой записи свое время жизни."""
+
+	def __init__(self, maxsize: int) -> None:
+		self.maxsize = maxsize
+		self._data: OrderedDict[str, tuple[Any, float]] = OrderedDict()
+
+	def get(self, key: str, default: Any = None) -> Any:
+		item = self._data.get(key)
+		if item is None:
+			return default
+
+		value, expires_at = item
+		if expires_at <= time.monotonic():
+			del self._data[key]
+			return default
+
+		self._data.move_to_end(key)
+		return value
+
+	def set(self, key: str, value: Any, ttl: float) -> None:
+		if ttl <= 0:
+			self._data.pop(key, None)
+			return
+
+		self._data[key] = (value, time.monotonic() + ttl)
+		self._data.move_to_end(key)
+		while len(self._data) > self.maxsize:
+			self._data.popitem(last=False)
+
+	def delete(self, key: str) -> None:
+		self._data.pop(key, None)
+
+	def clear(self) -> None:
+		self._data.clear()
+
+	def __len__(self) -> int:
+		return len(self._data)
@@ -0,0 +1,130 @@
+import gzip
+import re
+from datetime import date
+from pathlib import Path
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def get_month_start(day: date) -> date:
+	return day.replace(day=1)
+
+
+def add_months(month: date, months: int) -> date:
+	index = month.year * 12 + month.month - 1 + months
+	return date(index // 12, index % 12 + 1, 1)
+
+
+def get_partition_name(table: str, month: date) -> str:
+	return f'{table}_y{month.year}m{month.month:02d}'
+
+
+def get_default_partition_name(table: str) -> str:
+	return f'{table}_default'
+
+
+def get_partition_bounds(month: date) -> str:
+	return f"FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+
+
+def get_create_partition_sql(table: str, month: date) -> str:
+	return (
+		f'CREATE TABLE IF NOT EXISTS {get_partition_name(table, month)} '
+		f'PARTITION OF {table} FOR VALUES {get_partition_bounds(month)}'
+	)
+
+
+def get_create_default_partition_sql(table: str) -> str:
+	return f'CREATE TABLE IF NOT EXISTS {get_default_partition_name(table)} PARTITION OF {table} DEFAULT'
+
+
+class MonthlyPartitions:
+	"""Помесячные партиции таблицы, разбитой по диапазону значений колонки.
+
+	Строки, для которых не создана партиция, попадают в партицию по умолчанию,
+	поэтому вставка не падает, даже если партиции не созданы заранее.
+	"""
+
+	def __init__(self, session: AsyncSession, table: str, column: str) -> None:
+		self.session = session
+		self.table = table
+		self.column = column
+
+	async def get_months(self) -> list[date]:
+		"""Возвращает месяцы, для которых созданы партиции."""
+		result = await self.session.execute(
+			text(
+				'SELECT child.relname FROM pg_inherits '
+				'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+				'JOIN pg_class parent ON parent.oid = pg_inherits.inhparent '
+				'WHERE parent.relname = :table'
+			),
+			{'table': self.table},
+		)
+		pattern = re.compile(rf'^{self.table}_y(\d{{4}})m(\d{{2}})$')
+		months = []
+		for name in result.scalars():
+			match = pattern.match(name)
+			if match:
+				months.append(date(int(match[1]), int(match[2]), 1))
+		return sorted(months)
+
+	async def create(self, month: date) -> None:
+		"""Создает партицию месяца и переносит в нее строки из партиции по умолчанию."""
+		name = get_partition_name(self.table, month)
+		await self.session.execute(text(f'CREATE TABLE {name} (LIKE {self.table} INCLUDING DEFAULTS)'))
+		await self.session.execute(
+			text(
+				f'WITH moved AS ('
+				f'DELETE FROM {get_default_partition_name(self.table)} '
+				f'WHERE {self.column} >= :month_start AND {self.column} < :month_end RETURNING *'
+				f') INSERT INTO {name} SELECT * FROM moved'
+			),
+			{'month_start': month, 'month_end': add_months(month, 1)},
+		)
+		await self.session.execute(
+			text(f'ALTER TABLE {self.table} ATTACH PARTITION {name} FOR VALUES {get_partition_bounds(month)}')
+		)
+		await self.session.commit()
+
+	async def create_ahead(self, today: date, months_ahead: int) -> list[date]:
+		"""Создает недостающие партиции с текущего месяца на months_ahead месяцев вперед."""
+		existing_months = set(await self.get_months())
+		current_month = get_month_start(today)
+		created_months = []
+		for i in range(months_ahead + 1):
+			month = add_months(current_month, i)
+			if month not in existing_months:
+				await self.create(month)
+				created_months.append(month)
+		return created_months
+
+	async def get_expired_months(self, today: date, retention_months: int) -> list[date]:
+		"""Месяцы, все строки которых старше срока хранения."""
+		border_month = add_months(get_month_start(today), -retention_months)
+		return [month for month in await self.get_months() if month < border_month]
+
+	async def detach(self, month: date) -> None:
+		name = get_partition_name(self.table, month)
+		await self.session.execute(text(f'ALTER TABLE {self.table} DETACH PARTITION {name}'))
+		await self.session.commit()
+
+	async def export(self, month: date, export_dir: str) -> Path:
+		"""Выгружает отсоединенную партицию в сжатый CSV файл."""
+		name = get_partition_name(self.table, month)
+		path = Path(export_dir) / f'{name}.csv.gz'
+		path.parent.mkdir(parents=True, exist_ok=True)
+
+		connection = await (await self.session.connection()).get_raw_connection()
+		with gzip.open(path, 'wb') as file:
+			async def write(chunk: bytes) -> None:
+				file.write(chunk)
+
+			await connection.driver_connection.copy_from_table(name, output=write, format='csv', header=True)
+		await self.session.commit()
+		return path
+
+	async def drop(self, month: date) -> None:
+		await self.session.execute(text(f'DROP TABLE {get_partition_name(self.table, month)}'))
+		await self.session.commit()
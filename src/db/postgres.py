@@ -1,22 +1,184 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+import logging
+import random
+import time
+
+from fastapi import Depends
+from sqlalchemy import event, text
+from sqlalchemy.exc import SQLAlchemyError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeMeta, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from core.config import Settings, settings
+from core.metrics import (
+	POSTGRES_POOL_CHECKED_OUT,
+	POSTGRES_POOL_OVERFLOW,
+	POSTGRES_POOL_TIMEOUTS,
+	POSTGRES_POOL_WAIT,
+)
+
+
+class InstrumentedAsyncPool(AsyncAdaptedQueuePool):
+	"""Пул соединений, который измеряет время ожидания свободного соединения."""
+
+	def _do_get(self):
+		start = time.perf_counter()
+		try:
+			return super()._do_get()
+		except PoolTimeoutError:
+			POSTGRES_POOL_TIMEOUTS.inc()
+			raise
+		finally:
+			POSTGRES_POOL_WAIT.observe(time.perf_counter() - start)
+
+
+def instrument_pool(engine: AsyncEngine) -> None:
+	"""Считает выданные из пула соединения и соединения сверх размера пула."""
+	pool = engine.sync_engine.pool
 
-from core.config import settings
+	@event.listens_for(pool, 'connect')
+	def on_connect(dbapi_connection, connection_record):
+		# счетчик переполнения увеличивается до открытия соединения
+		if pool.overflow() > 0:
+			POSTGRES_POOL_OVERFLOW.inc()
 
-dsn = (
-	f'{settings.POSTGRES_SCHEME}://{settings.POSTGRES_USER}:'
-	f'{settings.POSTGRES_PASSWORD}@{settings.POSTGRES_HOST}:'
-	f'{settings.POSTGRES_PORT}/{settings.POSTGRES_DB}'
+	@event.listens_for(pool, 'checkout')
+	def on_checkout(dbapi_connection, connection_record, connection_proxy):
+		POSTGRES_POOL_CHECKED_OUT.inc()
+
+	@event.listens_for(pool, 'checkin')
+	def on_checkin(dbapi_connection, connection_record):
+		POSTGRES_POOL_CHECKED_OUT.dec()
+
+
+def get_dsn(settings: Settings) -> str:
+	return (
+		f'{settings.POSTGRES_SCHEME}://{settings.POSTGRES_USER}:'
+		f'{settings.POSTGRES_PASSWORD}@{settings.POSTGRES_HOST}:'
+		f'{settings.POSTGRES_PORT}/{settings.POSTGRES_DB}'
+	)
+
+
+def create_engine(settings: Settings, dsn: str | None = None) -> AsyncEngine:
+	engine = create_async_engine(
+		dsn or get_dsn(settings),
+		echo=settings.POSTGRES_ECHO,
+		poolclass=InstrumentedAsyncPool,
+		pool_size=settings.POSTGRES_POOL_SIZE,
+		max_overflow=settings.POSTGRES_MAX_OVERFLOW,
+		pool_timeout=settings.POSTGRES_POOL_TIMEOUT,
+		pool_pre_ping=settings.POSTGRES_POOL_PRE_PING,
+		pool_recycle=settings.POSTGRES_POOL_RECYCLE,
+		connect_args={
+			'prepared_statement_cache_size': settings.POSTGRES_STATEMENT_CACHE_SIZE,
+			'server_settings': {'statement_timeout': str(settings.POSTGRES_STATEMENT_TIMEOUT)},
+		},
+	)
+	instrument_pool(engine)
+	return engine
+
+
+# отставание реплики в секундах: реплика, которая проиграла весь полученный WAL,
+# не отстает, даже если на основной базе давно не было записей. На основной базе
+# функции реплики возвращают NULL, и отставание считается нулевым
+REPLICA_LAG_QUERY = text(
+	'SELECT COALESCE(CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+	'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END, 0)'
 )
-engine = create_async_engine(dsn, echo=True)
+
+
+class Replica:
+	"""Реплика для чтения, которая используется, пока ее отставание не больше max_lag.
+
+	Отставание проверяется не чаще раза в check_interval секунд на процесс.
+	Недоступная реплика считается отстающей до следующей проверки.
+	"""
+
+	def __init__(
+		self,
+		session_factory: async_sessionmaker[AsyncSession],
+		max_lag: float,
+		check_interval: float,
+	) -> None:
+		self.session_factory = session_factory
+		self.max_lag = max_lag
+		self.check_interval = check_interval
+		self._is_fresh = False
+		self._checked_at: float | None = None
+
+	async def is_fresh(self) -> bool:
+		now = time.monotonic()
+		if self._checked_at is None or now - self._checked_at >= self.check_interval:
+			self._checked_at = now
+			try:
+				async with self.session_factory() as session:
+					lag = (await session.execute(REPLICA_LAG_QUERY)).scalar()
+				self._is_fresh = lag <= self.max_lag
+			except (OSError, SQLAlchemyError) as e:
+				logging.error(e)
+				self._is_fresh = False
+		return self._is_fresh
+
+
+class SessionRouter:
+	"""Сессии одного запроса к основной базе и к реплике.
+
+	Запись и чтение, которое должно видеть свежие данные, идут в primary.
+	Методы, которые только читают, берут сессию из get_reader: это реплика,
+	пока в запросе не было коммита в основную базу. После записи чтение
+	тоже идет в основную базу, чтобы запрос видел свои изменения.
+	"""
+
+	def __init__(self, primary: AsyncSession, replica: Replica | None = None) -> None:
+		self.primary = primary
+		self.has_writes = False
+		self._replica = replica
+		self._replica_session: AsyncSession | None = None
+		event.listen(primary.sync_session, 'after_commit', self._on_commit)
+
+	def _on_commit(self, session) -> None:
+		self.has_writes = True
+
+	async def get_reader(self) -> AsyncSession:
+		if self.has_writes or self._replica is None or not await self._replica.is_fresh():
+			return self.primary
+		if self._replica_session is None:
+			self._replica_session = self._replica.session_factory()
+		return self._replica_session
+
+	async def close(self) -> None:
+		event.remove(self.primary.sync_session, 'after_commit', self._on_commit)
+		if self._replica_session is not None:
+			await self._replica_session.close()
+		await self.primary.close()
+
+
+dsn = get_dsn(settings)
+engine = create_engine(settings)
 
 async_session = async_sessionmaker(
 	engine, class_=AsyncSession, expire_on_commit=False
 )
 
+replicas = [
+	Replica(
+		async_sessionmaker(create_engine(settings, replica_dsn), class_=AsyncSession, expire_on_commit=False),
+		max_lag=settings.POSTGRES_REPLICA_MAX_LAG,
+		check_interval=settings.POSTGRES_REPLICA_LAG_CHECK_INTERVAL,
+	)
+	for replica_dsn in settings.POSTGRES_REPLICA_DSNS
+]
+
 Base: DeclarativeMeta = declarative_base()
 
 
-async def get_session() -> AsyncSession:
-	async with async_session() as session:
-		yield session
+async def get_session_router() -> SessionRouter:
+	router = SessionRouter(async_session(), random.choice(replicas) if replicas else None)
+	try:
+		yield router
+	finally:
+		await router.close()
+
+
+async def get_session(router: SessionRouter = Depends(get_session_router)) -> AsyncSession:
+	return router.primary
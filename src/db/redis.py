@@ -1,7 +1,68 @@
+import asyncio
+import time
 from abc import ABC, abstractmethod
-from typing import Any
+from typing import Any, AsyncIterator, Awaitable, Callable, Set
 
 from redis.asyncio import Redis
+from redis.asyncio.cluster import ClusterNode, RedisCluster
+from redis.asyncio.connection import BlockingConnectionPool
+from redis.asyncio.retry import Retry
+from redis.asyncio.sentinel import Sentinel, SentinelConnectionPool
+from redis.backoff import ExponentialBackoff
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from core.config import Settings
+from core.metrics import REDIS_POOL_ERRORS, REDIS_POOL_IN_USE, REDIS_POOL_WAIT
+
+
+# реализация Lua скрипта для InMemoryStorage: получает хранилище, KEYS и ARGV
+PythonScript = Callable[['InMemoryStorage', list[str], list[Any]], Any]
+
+
+class INoSQLPipeline(ABC):
+	"""Команды, которые копятся и отправляются в хранилище за одно обращение.
+
+	Методы только ставят команду в очередь, execute возвращает результаты
+	в порядке постановки.
+	"""
+
+	@abstractmethod
+	def get(self, key: str) -> 'INoSQLPipeline':
+		pass
+
+	@abstractmethod
+	def set(self, key: str, value: Any, expired_time: int) -> 'INoSQLPipeline':
+		pass
+
+	@abstractmethod
+	def delete(self, *keys: str) -> 'INoSQLPipeline':
+		pass
+
+	@abstractmethod
+	def incr(self, key: str, amount: int = 1, expired_time: int | None = None) -> 'INoSQLPipeline':
+		pass
+
+	@abstractmethod
+	def sadd(self, key: str, *members: str, expired_time: int) -> 'INoSQLPipeline':
+		pass
+
+	@abstractmethod
+	def srem(self, key: str, *members: str) -> 'INoSQLPipeline':
+		pass
+
+	@abstractmethod
+	def publish(self, channel: str, message: str) -> 'INoSQLPipeline':
+		pass
+
+	@abstractmethod
+	async def execute(self) -> list[Any]:
+		pass
+
+	async def __aenter__(self) -> 'INoSQLPipeline':
+		return self
+
+	async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+		pass
 
 
 class INoSQLStorage(ABC):
@@ -13,16 +74,500 @@ class INoSQLStorage(ABC):
 	async def set(self, key: str, value: Any, expired_time: int) -> None:
 		pass
 
+	@abstractmethod
+	async def mget(self, *keys: str) -> list[str | None]:
+		pass
+
+	@abstractmethod
+	async def mset(self, mapping: dict[str, Any], expired_time: int) -> None:
+		"""Записывает несколько ключей с одним временем жизни за одно обращение."""
+
+	@abstractmethod
+	async def delete(self, *keys: str) -> None:
+		pass
+
+	@abstractmethod
+	async def incr(self, key: str, amount: int = 1, expired_time: int | None = None) -> int:
+		"""Увеличивает счетчик и возвращает новое значение.
+
+		expired_time задает время жизни только новому счетчику, поэтому
+		счетчик окна не продлевается при каждом увеличении.
+		"""
+
+	@abstractmethod
+	async def sadd(self, key: str, *members: str, expired_time: int) -> None:
+		pass
+
+	@abstractmethod
+	async def srem(self, key: str, *members: str) -> None:
+		pass
+
+	@abstractmethod
+	async def sismember(self, key: str, member: str) -> bool:
+		pass
+
+	@abstractmethod
+	async def smembers(self, key: str) -> Set[str]:
+		pass
+
+	@abstractmethod
+	def pipeline(self) -> INoSQLPipeline:
+		pass
+
+	@abstractmethod
+	async def publish(self, channel: str, message: str) -> None:
+		pass
+
+	@abstractmethod
+	def register_script(
+		self,
+		script: str,
+		python_script: PythonScript | None = None,
+	) -> Callable[[list[str], list[Any]], Awaitable[Any]]:
+		"""Регистрирует Lua скрипт и возвращает функцию, которая выполняет его атомарно.
+
+		python_script - та же логика на Python, ее выполняет хранилище без Redis.
+		"""
+
+	@abstractmethod
+	def subscribe(
+		self,
+		channel: str,
+		on_subscribe: Callable[[], Awaitable[None]] | None = None,
+	) -> AsyncIterator[str]:
+		"""Асинхронно перебирает сообщения, опубликованные в канал.
+
+		on_subscribe вызывается, когда сервер подтвердил подписку: все сообщения,
+		опубликованные после этого момента, будут получены.
+		"""
+
+
+class RedisPipeline(INoSQLPipeline):
+	"""Pipeline redis-py без транзакции: одна команда интерфейса может занимать
+	несколько команд Redis, их результаты сводятся к одному в execute.
+	"""
+
+	def __init__(self, connection: Redis | RedisCluster) -> None:
+		self._pipeline = connection.pipeline(transaction=False)
+		# число команд Redis и функция, которая сводит их результаты к одному
+		self._commands: list[tuple[int, Callable[[list[Any]], Any]]] = []
+
+	def _add(self, commands_number: int = 1, result: Callable[[list[Any]], Any] = lambda results: results[0]):
+		self._commands.append((commands_number, result))
+		return self
+
+	def get(self, key: str) -> INoSQLPipeline:
+		self._pipeline.get(key)
+		return self._add()
+
+	def set(self, key: str, value: Any, expired_time: int) -> INoSQLPipeline:
+		self._pipeline.set(key, value, expired_time)
+		return self._add(result=lambda results: None)
+
+	def delete(self, *keys: str) -> INoSQLPipeline:
+		self._pipeline.delete(*keys)
+		return self._add(result=lambda results: None)
+
+	def incr(self, key: str, amount: int = 1, expired_time: int | None = None) -> INoSQLPipeline:
+		self._pipeline.incrby(key, amount)
+		if expired_time is None:
+			return self._add()
+		self._pipeline.expire(key, expired_time, nx=True)
+		return self._add(2)
+
+	def sadd(self, key: str, *members: str, expired_time: int) -> INoSQLPipeline:
+		self._pipeline.sadd(key, *members)
+		self._pipeline.expire(key, expired_time)
+		return self._add(2, lambda results: None)
+
+	def srem(self, key: str, *members: str) -> INoSQLPipeline:
+		self._pipeline.srem(key, *members)
+		return self._add(result=lambda results: None)
+
+	def publish(self, channel: str, message: str) -> INoSQLPipeline:
+		self._pipeline.publish(channel, message)
+		return self._add(result=lambda results: None)
+
+	async def execute(self) -> list[Any]:
+		raw_results = await self._pipeline.execute()
+		results, position = [], 0
+		for commands_number, result in self._commands:
+			results.append(result(raw_results[position:position + commands_number]))
+			position += commands_number
+		self._commands = []
+		return results
+
+	async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+		await self._pipeline.__aexit__(exc_type, exc_value, traceback)
+
 
 class RedisStorage(INoSQLStorage):
-	def __init__(self, **kwargs) -> None:
-		self.connection = Redis(**kwargs)
+	"""Хранилище в Redis.
+
+	Клиент создается из kwargs или передается готовым, см. create_redis_storage.
+	Подписка на каналы идет через pubsub_connection, по умолчанию через тот же клиент.
+	"""
+
+	def __init__(
+		self,
+		connection: Redis | RedisCluster | None = None,
+		pubsub_connection: Redis | None = None,
+		**kwargs,
+	) -> None:
+		self.connection = connection or Redis(**kwargs)
+		self.pubsub_connection = pubsub_connection or self.connection
 
 	async def close(self):
-		await self.connection.close()
+		if self.pubsub_connection is not self.connection:
+			await self.pubsub_connection.aclose()
+		await self.connection.aclose()
 
 	async def get(self, key: str) -> str | None:
 		return await self.connection.get(key)
 
 	async def set(self, key: str, value: Any, expired_time: int) -> None:
 		await self.connection.set(key, value, expired_time)
+
+	async def mget(self, *keys: str) -> list[str | None]:
+		return await self.connection.mget(keys)
+
+	async def mset(self, mapping: dict[str, Any], expired_time: int) -> None:
+		# MSET не задает время жизни, поэтому SET EX для каждого ключа в одном pipeline
+		async with self.pipeline() as pipe:
+			for key, value in mapping.items():
+				pipe.set(key, value, expired_time)
+			await pipe.execute()
+
+	async def delete(self, *keys: str) -> None:
+		if keys:
+			await self.connection.delete(*keys)
+
+	async def incr(self, key: str, amount: int = 1, expired_time: int | None = None) -> int:
+		async with self.pipeline() as pipe:
+			return (await pipe.incr(key, amount, expired_time).execute())[0]
+
+	async def sadd(self, key: str, *members: str, expired_time: int) -> None:
+		async with self.pipeline() as pipe:
+			await pipe.sadd(key, *members, expired_time=expired_time).execute()
+
+	async def srem(self, key: str, *members: str) -> None:
+		await self.connection.srem(key, *members)
+
+	async def sismember(self, key: str, member: str) -> bool:
+		return bool(await self.connection.sismember(key, member))
+
+	async def smembers(self, key: str) -> Set[str]:
+		return await self.connection.smembers(key)
+
+	def pipeline(self) -> INoSQLPipeline:
+		return RedisPipeline(self.connection)
+
+	async def publish(self, channel: str, message: str) -> None:
+		await self.connection.publish(channel, message)
+
+	def register_script(
+		self,
+		script: str,
+		python_script: PythonScript | None = None,
+	) -> Callable[[list[str], list[Any]], Awaitable[Any]]:
+		# redis-py вызывает скрипт по EVALSHA и загружает его при NOSCRIPT
+		redis_script = self.connection.register_script(script)
+
+		async def run(keys: list[str], args: list[Any]) -> Any:
+			return await redis_script(keys=keys, args=args)
+		return run
+
+	async def subscribe(
+		self,
+		channel: str,
+		on_subscribe: Callable[[], Awaitable[None]] | None = None,
+	) -> AsyncIterator[str]:
+		pubsub = self.pubsub_connection.pubsub()
+		await pubsub.subscribe(channel)
+		try:
+			async for message in pubsub.listen():
+				if message['type'] == 'subscribe':
+					if on_subscribe:
+						await on_subscribe()
+					continue
+				yield message['data']
+		finally:
+			await pubsub.aclose()
+
+
+class RedisClusterStorage(RedisStorage):
+	"""Хранилище в Redis Cluster.
+
+	Ключи, которые читаются или меняются вместе атомарно, должны попадать в один
+	слот, для этого в них используется hash tag: refresh_sessions:{<user_id>}.
+	MGET по ключам из разных слотов разбивается на запросы к узлам. Сообщения
+	PUBLISH расходятся по всем узлам кластера, поэтому подписка идет через
+	обычный клиент одного из них.
+	"""
+
+	async def mget(self, *keys: str) -> list[str | None]:
+		return await self.connection.mget_nonatomic(keys)
+
+
+class InstrumentedPoolMixin:
+	"""Считает соединения, выданные из пула redis-py, и время ожидания свободного соединения.
+
+	Пул сам возвращает в себя соединение, которое не удалось открыть, поэтому
+	при возврате учитываются только соединения, выданные вызывающему коду.
+	"""
+
+	def __init__(self, *args, **kwargs) -> None:
+		super().__init__(*args, **kwargs)
+		self._handed_out_connections = set()
+
+	async def get_connection(self, command_name, *keys, **options):
+		start = time.perf_counter()
+		try:
+			connection = await super().get_connection(command_name, *keys, **options)
+		except RedisConnectionError:
+			REDIS_POOL_ERRORS.inc()
+			raise
+		finally:
+			REDIS_POOL_WAIT.observe(time.perf_counter() - start)
+		self._handed_out_connections.add(connection)
+		REDIS_POOL_IN_USE.inc()
+		return connection
+
+	async def release(self, connection) -> None:
+		if connection in self._handed_out_connections:
+			self._handed_out_connections.remove(connection)
+			REDIS_POOL_IN_USE.dec()
+		await super().release(connection)
+
+
+class InstrumentedBlockingConnectionPool(InstrumentedPoolMixin, BlockingConnectionPool):
+	pass
+
+
+class InstrumentedSentinelConnectionPool(InstrumentedPoolMixin, SentinelConnectionPool):
+	pass
+
+
+def parse_nodes(nodes: list[str]) -> list[tuple[str, int]]:
+	"""Разбирает список узлов вида host:port."""
+	addresses = []
+	for node in nodes:
+		host, port = node.rsplit(':', 1)
+		addresses.append((host, int(port)))
+	return addresses
+
+
+def get_connection_kwargs(settings: Settings) -> dict[str, Any]:
+	"""Параметры соединений, общие для всех топологий.
+
+	Разрыв соединения и таймаут повторяются REDIS_RETRY_ATTEMPTS раз с экспоненциальной
+	задержкой, поэтому команда ждет ответа не дольше
+	REDIS_SOCKET_TIMEOUT * (REDIS_RETRY_ATTEMPTS + 1) плюс задержки между попытками.
+	"""
+	return {
+		'decode_responses': True,
+		'socket_timeout': settings.REDIS_SOCKET_TIMEOUT,
+		'socket_connect_timeout': settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+		'health_check_interval': settings.REDIS_HEALTH_CHECK_INTERVAL,
+		'retry': Retry(
+			ExponentialBackoff(cap=settings.REDIS_RETRY_BACKOFF_CAP, base=settings.REDIS_RETRY_BACKOFF_BASE),
+			settings.REDIS_RETRY_ATTEMPTS,
+		),
+	}
+
+
+def create_redis_storage(settings: Settings) -> RedisStorage:
+	"""Создает хранилище для топологии REDIS_MODE.
+
+	В режимах standalone и sentinel запрос ждет свободное соединение из пула
+	не дольше REDIS_POOL_TIMEOUT секунд. В режиме cluster у каждого узла свой пул
+	из REDIS_MAX_CONNECTIONS соединений, при его исчерпании команда сразу
+	завершается ошибкой, и метрики пула не собираются.
+	"""
+	connection_kwargs = get_connection_kwargs(settings)
+
+	if settings.REDIS_MODE == 'cluster':
+		nodes = parse_nodes(settings.REDIS_CLUSTER_NODES)
+		connection = RedisCluster(
+			startup_nodes=[ClusterNode(host, port) for host, port in nodes],
+			max_connections=settings.REDIS_MAX_CONNECTIONS,
+			**connection_kwargs,
+		)
+		host, port = nodes[0]
+		return RedisClusterStorage(connection, Redis(host=host, port=port, **connection_kwargs))
+
+	if settings.REDIS_MODE == 'sentinel':
+		sentinel = Sentinel(parse_nodes(settings.REDIS_SENTINELS), **connection_kwargs)
+		connection = sentinel.master_for(
+			settings.REDIS_SENTINEL_SERVICE_NAME,
+			connection_pool_class=InstrumentedSentinelConnectionPool,
+			max_connections=settings.REDIS_MAX_CONNECTIONS,
+			db=settings.REDIS_DB,
+		)
+		return RedisStorage(connection)
+
+	connection = Redis.from_pool(InstrumentedBlockingConnectionPool(
+		host=settings.REDIS_HOST,
+		port=settings.REDIS_PORT,
+		db=settings.REDIS_DB,
+		max_connections=settings.REDIS_MAX_CONNECTIONS,
+		timeout=settings.REDIS_POOL_TIMEOUT,
+		**connection_kwargs,
+	))
+	return RedisStorage(connection)
+
+
+class InMemoryPipeline(INoSQLPipeline):
+	def __init__(self, storage: 'InMemoryStorage') -> None:
+		self._storage = storage
+		self._commands: list[Callable[[], Awaitable[Any]]] = []
+
+	def _add(self, command: Callable[[], Awaitable[Any]]) -> INoSQLPipeline:
+		self._commands.append(command)
+		return self
+
+	def get(self, key: str) -> INoSQLPipeline:
+		return self._add(lambda: self._storage.get(key))
+
+	def set(self, key: str, value: Any, expired_time: int) -> INoSQLPipeline:
+		return self._add(lambda: self._storage.set(key, value, expired_time))
+
+	def delete(self, *keys: str) -> INoSQLPipeline:
+		return self._add(lambda: self._storage.delete(*keys))
+
+	def incr(self, key: str, amount: int = 1, expired_time: int | None = None) -> INoSQLPipeline:
+		return self._add(lambda: self._storage.incr(key, amount, expired_time))
+
+	def sadd(self, key: str, *members: str, expired_time: int) -> INoSQLPipeline:
+		return self._add(lambda: self._storage.sadd(key, *members, expired_time=expired_time))
+
+	def srem(self, key: str, *members: str) -> INoSQLPipeline:
+		return self._add(lambda: self._storage.srem(key, *members))
+
+	def publish(self, channel: str, message: str) -> INoSQLPipeline:
+		return self._add(lambda: self._storage.publish(channel, message))
+
+	async def execute(self) -> list[Any]:
+		commands, self._commands = self._commands, []
+		return [await command() for command in commands]
+
+
+class InMemoryStorage(INoSQLStorage):
+	"""Хранилище в памяти процесса для тестов и бенчмарков без Redis.
+
+	Значения хранятся строками, как в Redis с decode_responses=True. Вместо
+	Lua скриптов выполняются их реализации на Python: они работают с данными
+	через read, write и expire без await, поэтому атомарны, как скрипты в Redis.
+	Хеши хранятся словарями и изменяются скриптами на месте.
+	"""
+
+	def __init__(self) -> None:
+		self.data: dict[str, Any] = {}
+		self.expire_at: dict[str, float] = {}
+		self._subscribers: dict[str, list[asyncio.Queue]] = {}
+
+	def _is_alive(self, key: str) -> bool:
+		expire_at = self.expire_at.get(key)
+		if expire_at is not None and expire_at <= time.monotonic():
+			self.data.pop(key, None)
+			self.expire_at.pop(key, None)
+		return key in self.data
+
+	def _expire(self, key: str, expired_time: float) -> None:
+		self.expire_at[key] = time.monotonic() + expired_time
+
+	def read(self, key: str) -> Any | None:
+		return self.data[key] if self._is_alive(key) else None
+
+	def write(self, key: str, value: Any, expired_time: float | None = None) -> None:
+		"""Записывает значение, без expired_time ключ живет бессрочно, как после SET без EX."""
+		self.data[key] = value
+		self.expire_at.pop(key, None)
+		if expired_time is not None:
+			self._expire(key, expired_time)
+
+	def expire(self, key: str, expired_time: float) -> None:
+		if self._is_alive(key):
+			self._expire(key, expired_time)
+
+	def ttl(self, key: str) -> float | None:
+		"""Сколько секунд осталось жить ключу, None - ключа нет или он бессрочный."""
+		if not self._is_alive(key) or key not in self.expire_at:
+			return None
+		return self.expire_at[key] - time.monotonic()
+
+	async def get(self, key: str) -> str | None:
+		return self.read(key)
+
+	async def set(self, key: str, value: Any, expired_time: int) -> None:
+		self.write(key, str(value), expired_time)
+
+	async def mget(self, *keys: str) -> list[str | None]:
+		return [await self.get(key) for key in keys]
+
+	async def mset(self, mapping: dict[str, Any], expired_time: int) -> None:
+		for key, value in mapping.items():
+			await self.set(key, value, expired_time)
+
+	async def delete(self, *keys: str) -> None:
+		for key in keys:
+			self.data.pop(key, None)
+			self.expire_at.pop(key, None)
+
+	async def incr(self, key: str, amount: int = 1, expired_time: int | None = None) -> int:
+		is_new = not self._is_alive(key)
+		value = int(self.data.get(key, 0)) + amount
+		self.data[key] = str(value)
+		if is_new and expired_time is not None:
+			self._expire(key, expired_time)
+		return value
+
+	async def sadd(self, key: str, *members: str, expired_time: int) -> None:
+		if not self._is_alive(key):
+			self.data[key] = set()
+		self.data[key].update(members)
+		self._expire(key, expired_time)
+
+	async def srem(self, key: str, *members: str) -> None:
+		if self._is_alive(key):
+			self.data[key].difference_update(members)
+
+	async def sismember(self, key: str, member: str) -> bool:
+		return self._is_alive(key) and member in self.data[key]
+
+	async def smembers(self, key: str) -> Set[str]:
+		return set(self.data[key]) if self._is_alive(key) else set()
+
+	def pipeline(self) -> INoSQLPipeline:
+		return InMemoryPipeline(self)
+
+	async def publish(self, channel: str, message: str) -> None:
+		for queue in self._subscribers.get(channel, []):
+			queue.put_nowait(message)
+
+	def register_script(
+		self,
+		script: str,
+		python_script: PythonScript | None = None,
+	) -> Callable[[list[str], list[Any]], Awaitable[Any]]:
+		if python_script is None:
+			raise ValueError('Для хранилища в памяти нужна реализация скрипта на Python')
+
+		async def run(keys: list[str], args: list[Any]) -> Any:
+			return python_script(self, keys, args)
+		return run
+
+	async def subscribe(
+		self,
+		channel: str,
+		on_subscribe: Callable[[], Awaitable[None]] | None = None,
+	) -> AsyncIterator[str]:
+		queue = asyncio.Queue()
+		self._subscribers.setdefault(channel, []).append(queue)
+		try:
+			if on_subscribe:
+				await on_subscribe()
+			while True:
+				yield await queue.get()
+		finally:
+			self._subscribers[channel].remove(queue)
@@ -1,13 +1,25 @@
+import asyncio
+import json
 import logging
 from datetime import datetime
+from typing import Literal
 
 from async_fastapi_jwt_auth import AuthJWT
 from datetime import timedelta
 from http import HTTPStatus
 from fastapi import HTTPException
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
 
+from .bloom import TimeBucketedBloomFilter
+from .local_cache import LocalTTLCache
 from .redis import RedisStorage, INoSQLStorage
 from core.config import JWTSettings
+from core.metrics import (
+    DENYLIST_LOOKUPS,
+    DENYLIST_REDIS_FAILURES,
+    PERMISSIONS_CACHE_HITS,
+    PERMISSIONS_CACHE_MISSES,
+)
 from async_fastapi_jwt_auth import AuthJWT
 
 
@@ -19,16 +31,137 @@ async def get_nosql_storage() -> RedisStorage:
 
 
 class TokenHandler:
-    def __init__(self, no_sql: INoSQLStorage, expired_time: int) -> None:
+    """Список отозванных access токенов.
+
+    Кроме jti проверяется время, раньше которого все токены пользователя
+    считаются отозванными. Проверка идет от дешевого уровня к дорогому:
+    - фильтр Блума по окнам exp: если jti в нем нет, токен точно не отозван;
+    - локальный LRU-кеш процесса: отозванные jti хранятся в нем до истечения токена,
+      а проверенные валидные jti - не дольше negative_ttl секунд;
+    - Redis, не более одного запроса на проверку.
+    Отзыв токена публикуется в канал Redis, и остальные воркеры сразу добавляют
+    его в фильтр и локальный кеш. jti отозванных токенов также хранятся в Redis
+    в множествах по окнам exp, из них фильтр заполняется после подписки на канал.
+    Пока фильтр не заполнен, он не используется. Если Redis не ответил
+    за redis_timeout секунд, ответ определяет failure_policy.
+    """
+    bucket_key_prefix = 'denylist:bucket'
+    revoked_before_key_prefix = 'revoked_before'
+
+    def __init__(
+            self,
+            no_sql: INoSQLStorage,
+            local_cache_size: int = 100000,
+            negative_ttl: float = 5.0,
+            channel: str = 'denylist',
+            access_token_expires: int = 600,
+            bloom_capacity: int = 100000,
+            bloom_error_rate: float = 0.01,
+            redis_timeout: float | None = None,
+            failure_policy: Literal['open', 'closed'] = 'closed',
+    ) -> None:
         self.no_sql = no_sql
-        self.expired_time = expired_time
+        self.access_token_expires = access_token_expires
+        self.local_denylist = LocalTTLCache(local_cache_size)
+        self.local_revoked_before = LocalTTLCache(local_cache_size)
+        self.negative_ttl = negative_ttl
+        self.channel = channel
+        self.bloom_filter = TimeBucketedBloomFilter(access_token_expires, bloom_capacity, bloom_error_rate)
+        self.is_bloom_filter_synced = False
+        self.redis_timeout = redis_timeout
+        self.failure_policy = failure_policy
+
+    def _get_bucket_key(self, bucket: int) -> str:
+        return f'{self.bucket_key_prefix}:{bucket}'
+
+    def _get_revoked_before_key(self, user_id: str) -> str:
+        return f'{self.revoked_before_key_prefix}:{user_id}'
+
+    def _remember_revoked(self, jti: str, exp: int) -> None:
+        self.local_denylist.set(jti, True, exp - datetime.now().timestamp())
+        self.bloom_filter.add(jti, exp)
+
+    def _remember_revoked_before(self, revoked_before_key: str, revoked_before: int) -> None:
+        # известное время отзыва меняется только вместе с сообщением в канале,
+        # а его отсутствие перепроверяется так же часто, как валидные jti
+        ttl = self.access_token_expires if revoked_before else self.negative_ttl
+        self.local_revoked_before.set(revoked_before_key, revoked_before, ttl)
+
+    async def _sync_bloom_filter(self) -> None:
+        """Заполняет фильтр Блума jti всех еще не истекших отозванных токенов."""
+        self.bloom_filter.clear()
+        for bucket in self.bloom_filter.get_active_buckets():
+            exp = bucket * self.bloom_filter.window
+            for jti in await self.no_sql.smembers(self._get_bucket_key(bucket)):
+                self.bloom_filter.add(jti, exp)
+        self.is_bloom_filter_synced = True
+
+    def _lookup_local_denylist(self, jti: str, exp: int) -> bool | None:
+        """Проверяет jti без обращения к Redis, None - ответа в памяти процесса нет."""
+        if self.is_bloom_filter_synced and not self.bloom_filter.might_contain(jti, exp):
+            DENYLIST_LOOKUPS.labels('bloom').inc()
+            return False
+
+        is_revoked = self.local_denylist.get(jti)
+        if is_revoked is not None:
+            DENYLIST_LOOKUPS.labels('local').inc()
+        return is_revoked
 
     # @AuthJWT.token_in_denylist_loader
     async def _check_if_token_in_denylist(self, decrypted_token) -> bool:
-        jti = decrypted_token["jti"]
-        if await self.no_sql.get(jti):
+        """Проверяет jti токена и время отзыва всех токенов пользователя.
+
+        Все, чего нет в памяти процесса, читается из Redis одним MGET.
+        """
+        jti = decrypted_token['jti']
+        exp = decrypted_token['exp']
+        revoked_before_key = self._get_revoked_before_key(decrypted_token['user_id'])
+
+        is_revoked = self._lookup_local_denylist(jti, exp)
+        if is_revoked:
             return True
-        return False
+        revoked_before = self.local_revoked_before.get(revoked_before_key)
+
+        keys = []
+        if is_revoked is None:
+            keys.append(jti)
+        if revoked_before is None:
+            keys.append(revoked_before_key)
+
+        if keys:
+            DENYLIST_LOOKUPS.labels('redis').inc()
+            try:
+                values = dict(zip(keys, await asyncio.wait_for(self.no_sql.mget(*keys), self.redis_timeout)))
+            except (asyncio.TimeoutError, RedisConnectionError, RedisTimeoutError) as e:
+                return self._on_redis_failure(e, decrypted_token['iat'] < (revoked_before or 0))
+            if is_revoked is None:
+                is_revoked = bool(values[jti])
+                if is_revoked:
+                    self._remember_revoked(jti, exp)
+                else:
+                    self.local_denylist.set(jti, False, self.negative_ttl)
+            if revoked_before is None:
+                revoked_before = int(values[revoked_before_key] or 0)
+                self._remember_revoked_before(revoked_before_key, revoked_before)
+
+        return is_revoked or decrypted_token['iat'] < revoked_before
+
+    def _on_redis_failure(self, error: Exception, is_known_revoked: bool) -> bool:
+        """Отвечает на проверку токена, когда Redis не ответил вовремя.
+
+        В режиме open токен считается отозванным, только если это известно
+        из памяти процесса, в режиме closed запрос отклоняется с кодом 503.
+        Ответ не кешируется, следующая проверка снова обратится к Redis.
+        """
+        DENYLIST_REDIS_FAILURES.labels(self.failure_policy).inc()
+        logging.warning('Список отозванных токенов недоступен: %r', error)
+        if self.failure_policy == 'open' or is_known_revoked:
+            return is_known_revoked
+        raise HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail='Сервис временно недоступен, повторите попытку позже',
+            headers={'Retry-After': '1'},
+        )
 
     async def check_if_token_is_valid(self, decrypted_token) -> None:
         """Метод для проверки присутствия access токена в списке невалидных токенов"""
@@ -42,4 +175,100 @@ class TokenHandler:
         exp = decrypted_token['exp']
         # рассчитываем оставшееся время жизни токена (потом можно удалить, тк он просто не пройдет проверку)
         access_expires = exp - int(datetime.now().timestamp())
-        await self.no_sql.set(jti, 'invalid', access_expires)
+        bucket = self.bloom_filter.get_bucket(exp)
+        # запись jti, его окна для фильтра Блума и сообщение воркерам - за одно обращение
+        async with self.no_sql.pipeline() as pipe:
+            pipe.set(jti, 'invalid', access_expires)
+            pipe.sadd(
+                self._get_bucket_key(bucket),
+                jti,
+                expired_time=(bucket + 1) * self.bloom_filter.window - int(datetime.now().timestamp()),
+            )
+            pipe.publish(self.channel, json.dumps({'jti': jti, 'exp': exp}))
+            await pipe.execute()
+        self._remember_revoked(jti, exp)
+
+    async def revoke_user_tokens(self, user_id, revoked_before: int | None = None) -> None:
+        """Отзывает все access токены пользователя, выпущенные раньше revoked_before.
+
+        По умолчанию отзываются все уже выпущенные токены, включая токены
+        текущей секунды: iat хранится с точностью до секунды. Границу передает
+        только вход, который сохраняет выпущенный им самим токен. Вместо записи
+        каждого jti сохраняется одно время отзыва на пользователя, ключ живет
+        не дольше access токена.
+        """
+        revoked_before = revoked_before or int(datetime.now().timestamp()) + 1
+        revoked_before_key = self._get_revoked_before_key(user_id)
+        async with self.no_sql.pipeline() as pipe:
+            pipe.set(revoked_before_key, revoked_before, self.access_token_expires)
+            pipe.publish(
+                self.channel,
+                json.dumps({'revoked_before_key': revoked_before_key, 'revoked_before': revoked_before})
+            )
+            await pipe.execute()
+        self._remember_revoked_before(revoked_before_key, revoked_before)
+
+    async def listen_revocations(self) -> None:
+        """Фоновая задача: добавляет в локальный кеш токены, отозванные другими воркерами."""
+        while True:
+            try:
+                async for message in self.no_sql.subscribe(self.channel, on_subscribe=self._sync_bloom_filter):
+                    revocation = json.loads(message)
+                    if 'jti' in revocation:
+                        self._remember_revoked(revocation['jti'], revocation['exp'])
+                    else:
+                        self._remember_revoked_before(
+                            revocation['revoked_before_key'], revocation['revoked_before']
+                        )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(e)
+                # сообщения, пришедшие во время разрыва соединения, потеряны:
+                # закешированные валидные jti и фильтр больше нельзя считать актуальными
+                self.is_bloom_filter_synced = False
+                self.local_denylist.clear()
+                self.local_revoked_before.clear()
+                await asyncio.sleep(1)
+
+
+token_handler: TokenHandler | None = None
+
+
+async def get_token_handler() -> TokenHandler:
+    return token_handler
+
+
+class PermissionsCache:
+    """Кеш списка привилегий пользователя, сбрасывается при изменении групп и привилегий."""
+    key_prefix = 'user_permissions'
+
+    def __init__(self, no_sql: INoSQLStorage, expired_time: int) -> None:
+        self.no_sql = no_sql
+        self.expired_time = expired_time
+
+    def _get_key(self, user_id) -> str:
+        return f'{self.key_prefix}:{user_id}'
+
+    async def get(self, user_id) -> list[str] | None:
+        """Возвращает привилегии пользователя из кеша или None, если их там нет."""
+        permissions = await self.no_sql.get(self._get_key(user_id))
+        if permissions is None:
+            PERMISSIONS_CACHE_MISSES.inc()
+            return None
+        PERMISSIONS_CACHE_HITS.inc()
+        return json.loads(permissions)
+
+    async def set(self, user_id, permissions: list[str]) -> None:
+        await self.no_sql.set(self._get_key(user_id), json.dumps(permissions), self.expired_time)
+
+    async def invalidate(self, *user_ids) -> None:
+        """Удаляет из кеша привилегии перечисленных пользователей одним запросом."""
+        await self.no_sql.delete(*[self._get_key(user_id) for user_id in user_ids])
+
+
+permissions_cache: PermissionsCache | None = None
+
+
+async def get_permissions_cache() -> PermissionsCache:
+    return permissions_cache
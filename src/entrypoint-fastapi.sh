@@ -1,6 +1,5 @@
 #!/usr/bin/env bash
 
-alembic revision --autogenerate -m "Init database"
 alembic upgrade head
 
 gunicorn main:app --workers 4 --worker-class uvicorn.workers.UvicornWorker --bind 0.0.0.0:8000
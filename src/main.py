@@ -1,4 +1,7 @@
-from contextlib import asynccontextmanager
+import asyncio
+import math
+from contextlib import asynccontextmanager, suppress
+from http import HTTPStatus
 
 import uvicorn
 
@@ -6,24 +9,85 @@ from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 from async_fastapi_jwt_auth.exceptions import AuthJWTException
 
+from api import well_known
 from api.v1 import users, groups, permissions
 
-from core.config import settings
+from core import hashing
+from core.config import JWTSettings, settings
+from core.hashing import PasswordHasher, PasswordHasherOverloaded
+from core.metrics import make_metrics_app
 
 from db import storage
-from db.redis import RedisStorage
+from db.postgres import async_session
+from db.redis import create_redis_storage
+from db.storage import PermissionsCache, TokenHandler
+from services import history, rate_limiter, refresh_sessions
+from services.history import HistoryWriter
+from services.rate_limiter import RateLimit, RateLimiter, RateLimitExceeded
+from services.refresh_sessions import RedisRefreshSessionStore, RefreshSessionMirror
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    storage.nosql_storage = RedisStorage(
-        host=settings.REDIS_HOST,
-        port=settings.REDIS_PORT,
-        db=0,
-        decode_responses=True
+    storage.nosql_storage = create_redis_storage(settings)
+    hashing.password_hasher = PasswordHasher(
+        hashing.hash_context,
+        executor=settings.PASSWORD_HASHER_EXECUTOR,
+        max_workers=settings.PASSWORD_HASHER_WORKERS,
+        max_queue_size=settings.PASSWORD_HASHER_QUEUE_SIZE,
     )
+    storage.token_handler = TokenHandler(
+        storage.nosql_storage,
+        local_cache_size=settings.DENYLIST_LOCAL_CACHE_SIZE,
+        negative_ttl=settings.DENYLIST_NEGATIVE_TTL,
+        channel=settings.DENYLIST_CHANNEL,
+        access_token_expires=int(JWTSettings().authjwt_access_token_expires.total_seconds()),
+        bloom_capacity=settings.DENYLIST_BLOOM_CAPACITY,
+        bloom_error_rate=settings.DENYLIST_BLOOM_ERROR_RATE,
+        redis_timeout=settings.DENYLIST_REDIS_TIMEOUT,
+        failure_policy=settings.DENYLIST_FAILURE_POLICY,
+    )
+    storage.permissions_cache = PermissionsCache(storage.nosql_storage, settings.PERMISSIONS_CACHE_EXPIRE)
+    if settings.RATE_LIMIT_ENABLED:
+        rate_limiter.rate_limiter = RateLimiter(
+            storage.nosql_storage,
+            [
+                RateLimit('ip', settings.RATE_LIMIT_IP_LIMIT, settings.RATE_LIMIT_IP_PERIOD),
+                RateLimit('username', settings.RATE_LIMIT_USERNAME_LIMIT, settings.RATE_LIMIT_USERNAME_PERIOD),
+                RateLimit('global', settings.RATE_LIMIT_GLOBAL_LIMIT, settings.RATE_LIMIT_GLOBAL_PERIOD),
+            ],
+            local_cache_size=settings.RATE_LIMIT_LOCAL_CACHE_SIZE,
+            client_ip_header=settings.RATE_LIMIT_CLIENT_IP_HEADER,
+        )
+    denylist_listener = asyncio.create_task(storage.token_handler.listen_revocations())
+    history.history_writer = HistoryWriter(
+        async_session,
+        max_queue_size=settings.HISTORY_WRITER_QUEUE_SIZE,
+        batch_size=settings.HISTORY_WRITER_BATCH_SIZE,
+        flush_interval=settings.HISTORY_WRITER_FLUSH_INTERVAL,
+        overflow=settings.HISTORY_WRITER_OVERFLOW,
+    )
+    history.history_writer.start()
+    session_mirror = None
+    if settings.REFRESH_SESSION_STORE == 'redis':
+        session_mirror = RefreshSessionMirror(
+            async_session,
+            max_queue_size=settings.REFRESH_SESSION_MIRROR_QUEUE_SIZE,
+            batch_size=settings.REFRESH_SESSION_MIRROR_BATCH_SIZE,
+            flush_interval=settings.REFRESH_SESSION_MIRROR_FLUSH_INTERVAL,
+        )
+        session_mirror.start()
+        refresh_sessions.refresh_session_store = RedisRefreshSessionStore(storage.nosql_storage, session_mirror)
     yield
+    # дописываем накопленную историю и ротации сессий до закрытия соединений
+    await history.history_writer.close()
+    if session_mirror:
+        await session_mirror.close()
+    denylist_listener.cancel()
+    with suppress(asyncio.CancelledError):
+        await denylist_listener
     await storage.nosql_storage.close()
+    hashing.password_hasher.shutdown()
 
 
 app = FastAPI(
@@ -39,6 +103,8 @@ app = FastAPI(
 app.include_router(users.router, prefix='/api/v1/users', tags=['users'])
 app.include_router(groups.router, prefix='/api/v1/groups', tags=['groups'])
 app.include_router(permissions.router, prefix='/api/v1/permissions', tags=['permissios'])
+app.include_router(well_known.router, prefix='/.well-known', tags=['jwks'])
+app.mount('/metrics', make_metrics_app())
 
 
 @app.exception_handler(AuthJWTException)
@@ -47,6 +113,26 @@ def authjwt_exception_handler(request: Request, exc: AuthJWTException):
     return JSONResponse(status_code=exc.status_code, content={"detail": exc.message})
 
 
+@app.exception_handler(PasswordHasherOverloaded)
+def password_hasher_overloaded_handler(request: Request, exc: PasswordHasherOverloaded):
+    """Сервис перегружен хешированием паролей: просим клиента повторить запрос позже."""
+    return JSONResponse(
+        status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+        content={'detail': 'Сервис перегружен, повторите попытку позже'},
+        headers={'Retry-After': '1'},
+    )
+
+
+@app.exception_handler(RateLimitExceeded)
+def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
+    """Превышен лимит входов или регистраций: сообщаем клиенту, когда можно повторить запрос."""
+    return JSONResponse(
+        status_code=HTTPStatus.TOO_MANY_REQUESTS,
+        content={'detail': 'Слишком много попыток, повторите попытку позже'},
+        headers={'Retry-After': str(math.ceil(exc.retry_after))},
+    )
+
+
 if __name__ == '__main__':
     uvicorn.run(
         'main:app',
@@ -1,11 +1,20 @@
 import asyncio
+from datetime import date
+from enum import Enum
+from pathlib import Path
 
 import typer
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from core.config import settings
+from core.jwt_keys import generate_private_key
+from db.partitions import MonthlyPartitions
 from db.postgres import async_session
-from models.entity import User, Group, Permission
+from models.entity import User, Group, Permission, UserLoginHistory
+
+
+app = typer.Typer()
 
 
 SUPERUSER_GROUP_NAME = 'superuser'
@@ -82,9 +91,84 @@ async def create_superuser():
 		print('User was created successfully!')
 
 
+@app.callback(invoke_without_command=True)
+def default(ctx: typer.Context):
+	"""Управление сервисом. Без команды, как и раньше, создает суперпользователя."""
+	if ctx.invoked_subcommand is None:
+		asyncio.run(create_superuser())
+
+
+@app.command('createsuperuser')
 def main():
 	asyncio.run(create_superuser())
 
 
+@app.command('generate-jwt-key')
+def generate_jwt_key(
+	kid: str,
+	algorithm: str = settings.JWT_ALGORITHM,
+	keys_dir: str = settings.JWT_KEYS_DIR,
+):
+	"""Создает закрытый ключ подписи JWT в файле <kid>.pem."""
+	path = Path(keys_dir) / f'{kid}.pem'
+	if path.exists():
+		raise ValueError(f'Ключ {kid} уже существует')
+
+	path.parent.mkdir(parents=True, exist_ok=True)
+	path.write_bytes(generate_private_key(algorithm))
+	path.chmod(0o600)
+	print(f'Key {path} was created successfully!')
+
+
+async def create_login_history_partitions(months_ahead: int) -> None:
+	async with async_session() as session:
+		partitions = MonthlyPartitions(session, UserLoginHistory.__tablename__, 'login_at')
+		for month in await partitions.create_ahead(date.today(), months_ahead):
+			print(f'Partition for {month:%Y-%m} was created')
+
+
+async def archive_login_history_partitions(retention_months: int, export_dir: str | None, drop: bool) -> None:
+	async with async_session() as session:
+		partitions = MonthlyPartitions(session, UserLoginHistory.__tablename__, 'login_at')
+		for month in await partitions.get_expired_months(date.today(), retention_months):
+			# отсоединенная партиция не участвует в запросах и не мешает вставкам
+			await partitions.detach(month)
+			if export_dir:
+				path = await partitions.export(month, export_dir)
+				print(f'Partition for {month:%Y-%m} was exported to {path}')
+			if drop:
+				await partitions.drop(month)
+			print(f'Partition for {month:%Y-%m} was archived')
+
+
+@app.command('create-partitions')
+def create_partitions(months_ahead: int = settings.LOGIN_HISTORY_PARTITIONS_AHEAD):
+	"""Создает партиции истории входов на months_ahead месяцев вперед."""
+	asyncio.run(create_login_history_partitions(months_ahead))
+
+
+class ArchiveMode(str, Enum):
+	# выгрузить партицию в файл и удалить
+	export = 'export'
+	# удалить партицию без выгрузки
+	drop = 'drop'
+	# только отсоединить партицию от таблицы
+	detach = 'detach'
+
+
+@app.command('archive-partitions')
+def archive_partitions(
+	retention_months: int = settings.LOGIN_HISTORY_RETENTION_MONTHS,
+	mode: ArchiveMode = ArchiveMode.export,
+	export_dir: str = settings.LOGIN_HISTORY_ARCHIVE_DIR,
+):
+	"""Отсоединяет партиции истории входов старше срока хранения, выгружает их в gzip и удаляет."""
+	asyncio.run(archive_login_history_partitions(
+		retention_months,
+		export_dir if mode == ArchiveMode.export else None,
+		drop=mode != ArchiveMode.detach,
+	))
+
+
 if __name__ == '__main__':
-	typer.run(main)
+	app()
@@ -4,32 +4,35 @@ from datetime import datetime
 
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy import Column, DateTime, String, ForeignKey, Table, Boolean
+from sqlalchemy import Column, DateTime, String, ForeignKey, Table, Boolean, Index
 from sqlalchemy.orm import declarative_base
 from sqlalchemy import Column, DateTime, String
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.ext.declarative import DeclarativeMeta
-from werkzeug.security import check_password_hash, generate_password_hash
 from db.postgres import Base
 
 
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 
 from core.config import settings
+from core.hashing import hash_context
 
 
 groups_users_table = Table(
 	'groups_users',
 	Base.metadata,
-	Column('group_id', ForeignKey('groups.id', ondelete='CASCADE'), ),
-	Column('user_id', ForeignKey('users.id', ondelete='CASCADE'))
+	Column('group_id', ForeignKey('groups.id', ondelete='CASCADE'), primary_key=True),
+	Column('user_id', ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+	# первичный ключ начинается с group_id, для поиска групп пользователя нужен отдельный индекс
+	Index('ix_groups_users_user_id', 'user_id'),
 )
 
 groups_permissions_table = Table(
 	'groups_permissions',
 	Base.metadata,
-	Column('group_id', ForeignKey('groups.id', ondelete='CASCADE')),
-	Column('permission_id', ForeignKey('permissions.id', ondelete='CASCADE'))
+	Column('group_id', ForeignKey('groups.id', ondelete='CASCADE'), primary_key=True),
+	Column('permission_id', ForeignKey('permissions.id', ondelete='CASCADE'), primary_key=True),
+	Index('ix_groups_permissions_permission_id', 'permission_id'),
 )
 
 
@@ -93,16 +96,18 @@ class User(Base):
 		last_name: str = '',
 		email: str = '',
 		*args,
+		password_hash: str | None = None,
 		**kwargs,
 	) -> None:
 		self.username = username
-		self.password = generate_password_hash(password)
+		# хеш может быть заранее посчитан в пуле core.hashing.PasswordHasher
+		self.password = password_hash or hash_context.hash(password)
 		self.first_name = first_name
 		self.last_name = last_name
 		self.email = email
 
 	def check_password(self, password: str) -> bool:
-		return check_password_hash(self.password, password)
+		return hash_context.verify(self.password, password)
 
 	def __repr__(self) -> str:
 		return f'<User {self.username}>'
@@ -126,6 +131,16 @@ class RefreshSession(Base):
 	created_at = Column(DateTime, default=datetime.utcnow)
 	expired_at = Column(DateTime, nullable=False)
 	is_active = Column(Boolean, unique=False, nullable=False, default=True)
+	# jti нового refresh токена, если сессия закрыта ротацией, а не выходом,
+	# лимитом сессий или сменой пароля
+	replaced_by = Column(String, nullable=True)
+
+	__table_args__ = (
+		# открытых сессий у пользователя не больше лимита, индекс обслуживает
+		# и подсчет сессий, и поиск сессии устройства
+		Index('ix_refresh_sessions_user_id_active', 'user_id', postgresql_where=is_active),
+		Index('ix_refresh_sessions_refresh_jti', 'refresh_jti', unique=True),
+	)
 
 	def __init__(
 		self,
@@ -146,22 +161,33 @@ class RefreshSession(Base):
 
 
 class UserLoginHistory(Base):
-	"""Модель хранения истории входов и выходов из аккаунта пользователя."""
+	"""Модель хранения истории входов и выходов из аккаунта пользователя.
+
+	Таблица разбита на помесячные партиции по login_at, поэтому первичный ключ
+	включает login_at. Партиции создаются и архивируются командами manager.py.
+	"""
 	__tablename__ = 'user_login_history'
 
 	id = Column(
 		UUID(as_uuid=True),
 		primary_key=True,
 		default=uuid.uuid4,
-		unique=True,
 		nullable=False
 	)
 
 	user_id = Column(UUID, ForeignKey('users.id'))
 	user_agent = Column(String(255), nullable=False)
-	login_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+	login_at = Column(DateTime, primary_key=True, nullable=False, default=datetime.utcnow)
 	logout_at = Column(DateTime, nullable=True, default=None)
 
+	__table_args__ = (
+		# поиск активного входа пользователя с устройства
+		Index('ix_user_login_history_user_id_user_agent_logout_at', 'user_id', 'user_agent', 'logout_at'),
+		# постраничная выдача истории по курсору (login_at, id)
+		Index('ix_user_login_history_user_id_login_at_id', 'user_id', 'login_at', 'id'),
+		{'postgresql_partition_by': 'RANGE (login_at)'},
+	)
+
 	def __init__(
 		self,
 		user_id: UUID,
@@ -78,15 +78,6 @@ class UserResponseUsername(BaseModel):
     username: str = Field(..., max_length=255)
 
 
-class RefreshToDb(BaseModel):
-    """Модель записи сессии в postgres."""
-    user_id: UUID
-    refresh_jti: str
-    user_agent: str = Field(max_length=255)
-    expired_at: datetime
-    is_active: bool
-
-
 class RefreshDelDb(BaseModel):
     """Модель удаления сессии из postgres."""
     user_id: UUID
@@ -111,6 +102,8 @@ class UserResponseHistoryInDb(UserLoginHistoryInDb):
 
 
 class UserPaginatedHistoryInDb(BaseModel):
-    previous: None | int
-    next: None | int
+    previous: None | int = None
+    next: None | int = None
+    next_cursor: None | str = None
+    total: None | int = None
     items: list[UserResponseHistoryInDb]
@@ -1,7 +1,10 @@
 from fastapi import Depends
-from fastapi.security import HTTPBearer
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from async_fastapi_jwt_auth import AuthJWT
 
+from db.storage import TokenHandler, get_token_handler
+from services.tokens import RequestAuthJWT
+
 
 security = HTTPBearer()
 
@@ -9,18 +12,26 @@ security = HTTPBearer()
 class AuthorizationChecker:
 	def __init__(
 		self,
-		access_token: str = Depends(security),
-		authorize_service: AuthJWT = Depends(),
+		# HTTPBearer только требует заголовок Authorization и описывает схему
+		# в OpenAPI, сам токен читает и проверяет RequestAuthJWT
+		_credentials: HTTPAuthorizationCredentials = Depends(security),
+		authorize_service: RequestAuthJWT = Depends(),
+		token_handler: TokenHandler = Depends(get_token_handler),
 	):
-		self.access_token = access_token
 		self.authorize_service = authorize_service
+		self.token_handler = token_handler
 
 	async def __call__(
 		self,
 		required_permissons: list[str]
 	):
-		await self.authorize_service.jwt_required(token=self.access_token)
-		user_permissions = (await self.authorize_service.get_raw_jwt())['permissions']
+		# подпись проверяется один раз за запрос, claims разделяются с эндпоинтом
+		decrypted_token = await self.authorize_service.get_access_claims()
+
+		# проверяем, что токен не отозван
+		await self.token_handler.check_if_token_is_valid(decrypted_token)
+
+		user_permissions = decrypted_token['permissions']
 
 		if '*.*' in user_permissions:
 			return True
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from typing import Generic, Literal, TypeVar
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from core.metrics import (
+	BATCH_WRITER_BATCH_SIZE,
+	BATCH_WRITER_DROPPED,
+	BATCH_WRITER_LAG,
+	BATCH_WRITER_QUEUE_SIZE,
+)
+
+
+Event = TypeVar('Event')
+
+
+class BatchWriter(ABC, Generic[Event]):
+	"""Отложенная запись событий в базу данных пачками.
+
+	Запрос лишь кладет событие в ограниченную очередь. Фоновая задача пишет
+	события одной транзакцией, когда их набралось batch_size или прошло
+	flush_interval секунд с первого события пачки. При переполнении очереди
+	запрос ждет места в ней (block) или событие отбрасывается (drop).
+	"""
+	name: str
+
+	def __init__(
+		self,
+		session_factory: async_sessionmaker[AsyncSession],
+		max_queue_size: int = 10000,
+		batch_size: int = 500,
+		flush_interval: float = 1.0,
+		overflow: Literal['block', 'drop'] = 'block',
+	) -> None:
+		self.session_factory = session_factory
+		self.batch_size = batch_size
+		self.flush_interval = flush_interval
+		self.overflow = overflow
+		self._queue: asyncio.Queue[tuple[Event, float] | None] = asyncio.Queue(max_queue_size)
+		self._task: asyncio.Task | None = None
+
+	def start(self) -> None:
+		self._task = asyncio.create_task(self._run())
+
+	async def close(self) -> None:
+		"""Записывает накопленные события и останавливает фоновую задачу."""
+		if self._task is None:
+			return
+		await self._queue.put(None)
+		await self._task
+		self._task = None
+
+	async def put(self, event: Event) -> None:
+		item = (event, time.monotonic())
+		if self.overflow == 'drop':
+			try:
+				self._queue.put_nowait(item)
+			except asyncio.QueueFull:
+				BATCH_WRITER_DROPPED.labels(self.name, 'overflow').inc()
+				return
+		else:
+			await self._queue.put(item)
+		BATCH_WRITER_QUEUE_SIZE.labels(self.name).inc()
+
+	async def _run(self) -> None:
+		loop = asyncio.get_running_loop()
+		is_closing = False
+		while not is_closing:
+			item = await self._queue.get()
+			if item is None:
+				break
+
+			batch = [item]
+			deadline = loop.time() + self.flush_interval
+			while len(batch) < self.batch_size:
+				try:
+					item = await asyncio.wait_for(self._queue.get(), max(deadline - loop.time(), 0))
+				except asyncio.TimeoutError:
+					break
+				if item is None:
+					is_closing = True
+					break
+				batch.append(item)
+
+			await self._flush(batch)
+
+	async def _flush(self, batch: list[tuple[Event, float]]) -> None:
+		BATCH_WRITER_QUEUE_SIZE.labels(self.name).dec(len(batch))
+		try:
+			async with self.session_factory() as session:
+				await self.write(session, [event for event, _ in batch])
+				await session.commit()
+		except Exception as e:
+			# любая ошибка записи, включая недоступность базы данных, теряет только
+			# эту пачку: фоновая задача продолжает разбирать очередь
+			logging.error('Не удалось записать пачку %s: %r', self.name, e)
+			BATCH_WRITER_DROPPED.labels(self.name, 'error').inc(len(batch))
+			return
+
+		BATCH_WRITER_BATCH_SIZE.labels(self.name).observe(len(batch))
+		now = time.monotonic()
+		for _, enqueued_at in batch:
+			BATCH_WRITER_LAG.labels(self.name).observe(now - enqueued_at)
+
+	@abstractmethod
+	async def write(self, session: AsyncSession, events: list[Event]) -> None:
+		"""Записывает пачку событий в открытой транзакции."""
@@ -4,14 +4,22 @@ from fastapi import Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
-from db.postgres import get_session
-from models.entity import Permission, Group
+from db.postgres import SessionRouter, get_session, get_session_router
+from db.storage import PermissionsCache, get_permissions_cache
+from models.entity import Permission, Group, groups_users_table
 from schemas.entity import GroupDetailView, GroupShortView, PermissionShortView
 
 
 class DatabaseSession:
-    def __init__(self, session: AsyncSession):
+    def __init__(self, session: AsyncSession, sessions: SessionRouter | None = None):
         self.session = session
+        self.sessions = sessions
+
+    async def get_reader(self) -> AsyncSession:
+        """Сессия для запросов, которые только читают: реплика, пока запрос ничего не записал."""
+        if self.sessions is None:
+            return self.session
+        return await self.sessions.get_reader()
 
     async def get_group_by_group_name(self, group_name: str):
         group = (await self.session.execute(
@@ -19,6 +27,12 @@ class DatabaseSession:
         )).scalars().first()
         return group
 
+    async def get_group_user_ids(self, group_id: UUID) -> list[UUID]:
+        query_result = await self.session.execute(
+            select(groups_users_table.c.user_id).where(groups_users_table.c.group_id == group_id)
+        )
+        return list(query_result.scalars().all())
+
     async def delete_group(
             self,
             group_id: UUID
@@ -37,7 +51,7 @@ class DatabaseSession:
         return group.id
 
     async def read_groups(self) -> list[Group]:
-        query_result = await self.session.execute(select(Group))
+        query_result = await (await self.get_reader()).execute(select(Group))
         return list(query_result.unique().scalars().all())
 
     async def update_group(
@@ -92,8 +106,9 @@ class DatabaseSession:
 
 
 class GroupService:
-    def __init__(self, session: DatabaseSession):
+    def __init__(self, session: DatabaseSession, permissions_cache: PermissionsCache):
         self.session = session
+        self.permissions_cache = permissions_cache
 
     async def check_group_exists(self, group_name: str) -> bool:
         group = await self.session.get_group_by_group_name(group_name)
@@ -140,6 +155,8 @@ class GroupService:
         if not group:
             return None
 
+        await self.permissions_cache.invalidate(*await self.session.get_group_user_ids(group_id))
+
         return GroupDetailView(
             id=group.id,
             group_name=group.group_name,
@@ -155,17 +172,23 @@ class GroupService:
             self,
             group_id: UUID
     ) -> UUID | None:
+        # участников группы нужно получить до удаления, связи удаляются каскадно
+        user_ids = await self.session.get_group_user_ids(group_id)
         group_id = await self.session.delete_group(group_id)
 
         if not group_id:
             return None
 
+        await self.permissions_cache.invalidate(*user_ids)
         return group_id
 
 
 async def get_group_service(
-        db: AsyncSession = Depends(get_session)
+        db: AsyncSession = Depends(get_session),
+        permissions_cache: PermissionsCache = Depends(get_permissions_cache),
+        sessions: SessionRouter = Depends(get_session_router),
 ) -> GroupService:
     return GroupService(
-        DatabaseSession(db)
+        DatabaseSession(db, sessions),
+        permissions_cache,
     )
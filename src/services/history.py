@@ -0,0 +1,118 @@
+import uuid
+from datetime import datetime
+from typing import Literal, NamedTuple
+
+from sqlalchemy import DateTime, String, and_, column, insert, select, update, values
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import JWTSettings
+from models.entity import UserLoginHistory
+from services.batch_writer import BatchWriter
+
+
+# вход без выхода старше времени жизни refresh токена уже не активен. Условие
+# на login_at позволяет Postgres не просматривать старые партиции истории входов
+ACTIVE_LOGIN_WINDOW = JWTSettings().authjwt_refresh_token_expires
+
+
+class HistoryEvent(NamedTuple):
+	kind: Literal['login', 'logout']
+	user_id: str
+	user_agent: str
+	created_at: datetime
+
+
+class HistoryWriter(BatchWriter[HistoryEvent]):
+	"""Отложенная запись истории входов и выходов из аккаунта.
+
+	История нужна только для аудита и может отставать на секунду. Входы
+	пишутся одним многострочным INSERT, выходы одним UPDATE ... FROM (VALUES ...).
+	"""
+	name = 'history'
+
+	async def put_login(self, user_id: str, user_agent: str) -> None:
+		await self.put(HistoryEvent('login', user_id, user_agent, datetime.utcnow()))
+
+	async def put_logout(self, user_id: str, user_agent: str) -> None:
+		await self.put(HistoryEvent('logout', user_id, user_agent, datetime.utcnow()))
+
+	async def write(self, session: AsyncSession, events: list[HistoryEvent]) -> None:
+		logins = [event for event in events if event.kind == 'login']
+		logouts = [event for event in events if event.kind == 'logout']
+		# входы пишутся раньше выходов, чтобы выход из пачки закрыл вход из нее же
+		if logins:
+			await session.execute(self.get_logins_statement(logins))
+		if logouts:
+			await session.execute(self.get_logouts_statement(logouts))
+
+	@staticmethod
+	def get_logins_statement(logins: list[HistoryEvent]):
+		return insert(UserLoginHistory).values([
+			{
+				'id': uuid.uuid4(),
+				'user_id': event.user_id,
+				'user_agent': event.user_agent,
+				'login_at': event.created_at,
+			}
+			for event in logins
+		])
+
+	@staticmethod
+	def get_logouts_statement(logouts: list[HistoryEvent]):
+		"""Закрывает по одной последней открытой записи на пару (user_id, user_agent).
+
+		Открытые записи пары находятся по индексу (user_id, user_agent, logout_at)
+		только в партициях за последние ACTIVE_LOGIN_WINDOW, а обновляются
+		по первичному ключу, поэтому выход не трогает записи других
+		пользователей и более ранние незакрытые входы.
+		"""
+		logouts_values = values(
+			column('user_id', UUID),
+			column('user_agent', String),
+			column('logout_at', DateTime),
+			name='logouts',
+		).data([(event.user_id, event.user_agent, event.created_at) for event in logouts])
+
+		latest_logins = (
+			select(UserLoginHistory.id, UserLoginHistory.login_at, logouts_values.c.logout_at).
+			distinct(UserLoginHistory.user_id, UserLoginHistory.user_agent).
+			join(
+				logouts_values,
+				and_(
+					UserLoginHistory.user_id == logouts_values.c.user_id,
+					UserLoginHistory.user_agent == logouts_values.c.user_agent,
+				),
+			).
+			where(
+				UserLoginHistory.logout_at.is_(None),
+				UserLoginHistory.login_at <= logouts_values.c.logout_at,
+				UserLoginHistory.login_at >= logouts_values.c.logout_at - ACTIVE_LOGIN_WINDOW,
+				# та же граница константой для всей пачки: по ней партиции
+				# отсекаются до выполнения, а не только при соединении с VALUES
+				UserLoginHistory.login_at >= min(event.created_at for event in logouts) - ACTIVE_LOGIN_WINDOW,
+			).
+			order_by(
+				UserLoginHistory.user_id,
+				UserLoginHistory.user_agent,
+				UserLoginHistory.login_at.desc(),
+				UserLoginHistory.id.desc(),
+			).
+			cte('latest_logins')
+		)
+
+		return (
+			update(UserLoginHistory).
+			where(
+				UserLoginHistory.id == latest_logins.c.id,
+				UserLoginHistory.login_at == latest_logins.c.login_at,
+			).
+			values(logout_at=latest_logins.c.logout_at)
+		)
+
+
+history_writer: HistoryWriter | None = None
+
+
+async def get_history_writer() -> HistoryWriter:
+	return history_writer
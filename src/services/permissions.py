@@ -4,14 +4,22 @@ from fastapi import Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_
 
-from db.postgres import get_session
-from models.entity import Permission
+from db.postgres import SessionRouter, get_session, get_session_router
+from db.storage import PermissionsCache, get_permissions_cache
+from models.entity import Permission, groups_permissions_table, groups_users_table
 from schemas.entity import PermissionDetailView, PermissionShortView
 
 
 class DatabaseSession:
-	def __init__(self, session: AsyncSession):
+	def __init__(self, session: AsyncSession, sessions: SessionRouter | None = None):
 		self.session = session
+		self.sessions = sessions
+
+	async def get_reader(self) -> AsyncSession:
+		"""Сессия для запросов, которые только читают: реплика, пока запрос ничего не записал."""
+		if self.sessions is None:
+			return self.session
+		return await self.sessions.get_reader()
 
 	async def get_permission_by_name(self, permission_name: str):
 		permission = (await self.session.execute(
@@ -31,7 +39,7 @@ class DatabaseSession:
 		return permission
 
 	async def read_permissions(self) -> list[Permission]:
-		permissions = await self.session.execute(select(Permission))
+		permissions = await (await self.get_reader()).execute(select(Permission))
 		return list(permissions.unique().scalars().all())
 
 	async def get_permission_name_duplicates(
@@ -67,6 +75,18 @@ class DatabaseSession:
 		await self.session.commit()
 		return permission
 
+	async def get_permission_user_ids(self, permission_id: UUID) -> list[UUID]:
+		query_result = await self.session.execute(
+			select(groups_users_table.c.user_id).
+			distinct().
+			join(
+				groups_permissions_table,
+				groups_permissions_table.c.group_id == groups_users_table.c.group_id
+			).
+			where(groups_permissions_table.c.permission_id == permission_id)
+		)
+		return list(query_result.scalars().all())
+
 	async def delete_permission(
 		self,
 		permission_id: UUID
@@ -86,8 +106,9 @@ class DatabaseSession:
 
 
 class PermissionService:
-	def __init__(self, session: DatabaseSession):
+	def __init__(self, session: DatabaseSession, permissions_cache: PermissionsCache):
 		self.session = session
+		self.permissions_cache = permissions_cache
 
 	async def check_permission_exists(self, permission_name: str) -> bool:
 		permission = await self.session.get_permission_by_name(permission_name)
@@ -128,6 +149,8 @@ class PermissionService:
 		if not permission:
 			return None
 
+		await self.permissions_cache.invalidate(*await self.session.get_permission_user_ids(permission_id))
+
 		return PermissionDetailView(
 			id=permission.id,
 			permission_name=permission.permission_name
@@ -137,12 +160,23 @@ class PermissionService:
 		self,
 		permission_id: UUID
 	) -> UUID | None:
-		return await self.session.delete_permission(permission_id)
+		# пользователей нужно получить до удаления, связи удаляются каскадно
+		user_ids = await self.session.get_permission_user_ids(permission_id)
+		deleted_id = await self.session.delete_permission(permission_id)
+
+		if not deleted_id:
+			return None
+
+		await self.permissions_cache.invalidate(*user_ids)
+		return deleted_id
 
 
 async def get_permission_service(
-	db: AsyncSession = Depends(get_session)
+	db: AsyncSession = Depends(get_session),
+	permissions_cache: PermissionsCache = Depends(get_permissions_cache),
+	sessions: SessionRouter = Depends(get_session_router),
 ) -> PermissionService:
 	return PermissionService(
-		DatabaseSession(db)
+		DatabaseSession(db, sessions),
+		permissions_cache,
 	)
@@ -0,0 +1,214 @@
+import logging
+import math
+import time
+from typing import Literal, NamedTuple
+
+from fastapi import Request
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+
+from core.metrics import RATE_LIMIT_REDIS_FAILURES, RATE_LIMIT_REJECTED
+from db.local_cache import LocalTTLCache
+from db.redis import INoSQLStorage, InMemoryStorage
+
+
+class RateLimit(NamedTuple):
+	"""Корзина токенов: limit запросов подряд, затем limit запросов за period секунд."""
+	scope: Literal['ip', 'username', 'global']
+	limit: int
+	period: float
+
+	@property
+	def rate(self) -> float:
+		return self.limit / self.period
+
+
+class RateLimitExceeded(Exception):
+	"""Запрос превысил лимит, повторить его можно через retry_after секунд."""
+
+	def __init__(self, scope: str, retry_after: float) -> None:
+		super().__init__(scope, retry_after)
+		self.scope = scope
+		self.retry_after = retry_after
+
+
+class LocalTokenBucket:
+	"""Корзина токенов в памяти воркера с теми же параметрами, что и в Redis.
+
+	Токен берется до обращения к Redis и возвращается, если Redis отказал,
+	поэтому в локальной корзине токенов не меньше, чем в общей: пустая локальная
+	корзина означает, что отказал бы и Redis. Отказ Redis блокирует корзину
+	до появления в общей корзине следующего токена.
+	"""
+
+	def __init__(self, limit: RateLimit) -> None:
+		self.limit = limit
+		self.tokens = float(limit.limit)
+		self.updated_at = time.monotonic()
+		self.blocked_until = 0.0
+
+	def _refill(self) -> float:
+		now = time.monotonic()
+		self.tokens = min(self.limit.limit, self.tokens + (now - self.updated_at) * self.limit.rate)
+		self.updated_at = now
+		return now
+
+	def get_wait_time(self) -> float:
+		"""Сколько секунд ждать свободного токена, 0 - токен есть."""
+		now = self._refill()
+		return max(self.blocked_until - now, (1 - self.tokens) / self.limit.rate, 0)
+
+	def take(self) -> None:
+		self.tokens -= 1
+
+	def refund(self) -> None:
+		self.tokens = min(self.limit.limit, self.tokens + 1)
+
+	def block(self, retry_after: float) -> None:
+		self.blocked_until = time.monotonic() + retry_after
+
+
+# KEYS - корзины, ARGV - пары (limit, period в миллисекундах) для каждой корзины.
+# Токен берется из всех корзин или ни из одной. Возвращает {1} или
+# {0, время до появления токена в миллисекундах, номер отказавшей корзины}
+TOKEN_BUCKET_SCRIPT = '''
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local buckets = {}
+local retry_after, denied = 0, 0
+for i, key in ipairs(KEYS) do
+	local limit = tonumber(ARGV[i * 2 - 1])
+	local period = tonumber(ARGV[i * 2])
+	local state = redis.call('HMGET', key, 'tokens', 'updated_at')
+	local tokens = tonumber(state[1]) or limit
+	local updated_at = tonumber(state[2]) or now
+	tokens = math.min(limit, tokens + (now - updated_at) * limit / period)
+	if tokens < 1 then
+		local wait = math.ceil((1 - tokens) * period / limit)
+		if wait > retry_after then
+			retry_after, denied = wait, i
+		end
+	end
+	buckets[i] = {tokens, limit, period}
+end
+if denied > 0 then
+	return {0, retry_after, denied}
+end
+for i, key in ipairs(KEYS) do
+	local tokens, limit, period = unpack(buckets[i])
+	redis.call('HSET', key, 'tokens', tostring(tokens - 1), 'updated_at', now)
+	-- корзина удаляется, когда наполнится снова
+	redis.call('PEXPIRE', key, math.ceil((limit - tokens + 1) * period / limit))
+end
+return {1}
+'''
+
+
+def token_bucket(storage: InMemoryStorage, keys: list[str], args: list[int]) -> list[int]:
+	"""TOKEN_BUCKET_SCRIPT для хранилища в памяти."""
+	now = int(time.time() * 1000)
+	buckets = []
+	retry_after, denied = 0, 0
+	for i, key in enumerate(keys):
+		limit, period = int(args[i * 2]), int(args[i * 2 + 1])
+		state = storage.read(key) or {}
+		tokens = float(state.get('tokens', limit))
+		updated_at = int(state.get('updated_at', now))
+		tokens = min(limit, tokens + (now - updated_at) * limit / period)
+		if tokens < 1:
+			wait = math.ceil((1 - tokens) * period / limit)
+			if wait > retry_after:
+				retry_after, denied = wait, i + 1
+		buckets.append((tokens, limit, period))
+	if denied > 0:
+		return [0, retry_after, denied]
+	for key, (tokens, limit, period) in zip(keys, buckets):
+		storage.write(
+			key,
+			{'tokens': str(tokens - 1), 'updated_at': str(now)},
+			math.ceil((limit - tokens + 1) * period / limit) / 1000,
+		)
+	return [1]
+
+
+class RateLimiter:
+	"""Ограничение частоты входов и регистраций по адресу клиента, имени пользователя и в целом.
+
+	Лимиты проверяются одним Lua скриптом за одно обращение к Redis. Перед
+	Redis запрос проходит локальные корзины воркера, которые отсекают поток
+	запросов из одного источника без обращения к Redis. Если Redis недоступен,
+	действуют только локальные корзины. Ключи объединены хеш-тегом, чтобы
+	скрипт выполнялся в одном слоте Redis Cluster.
+	"""
+	key_prefix = '{rate_limit}'
+
+	def __init__(
+		self,
+		no_sql: INoSQLStorage,
+		limits: list[RateLimit],
+		local_cache_size: int = 100000,
+		client_ip_header: str | None = None,
+	) -> None:
+		self.limits = limits
+		self.client_ip_header = client_ip_header
+		self.local_buckets = LocalTTLCache(local_cache_size)
+		self._script = no_sql.register_script(TOKEN_BUCKET_SCRIPT, token_bucket)
+
+	def get_client_ip(self, request: Request) -> str:
+		"""Адрес клиента из заголовка прокси, если сервис работает за ним, иначе адрес соединения."""
+		if self.client_ip_header and self.client_ip_header in request.headers:
+			return request.headers[self.client_ip_header]
+		return request.client.host if request.client else 'unknown'
+
+	def _get_key(self, action: str, limit: RateLimit, value: str | None) -> str:
+		if limit.scope == 'global':
+			return f'{self.key_prefix}:{action}:global'
+		return f'{self.key_prefix}:{action}:{limit.scope}:{value}'
+
+	def _get_local_bucket(self, key: str, limit: RateLimit) -> LocalTokenBucket:
+		bucket = self.local_buckets.get(key)
+		if bucket is None:
+			bucket = LocalTokenBucket(limit)
+		# корзина, не тронутая period секунд, полна и равна новой
+		self.local_buckets.set(key, bucket, limit.period)
+		return bucket
+
+	async def check(self, action: str, ip: str, username: str) -> None:
+		"""Берет по токену из корзин запроса или выбрасывает RateLimitExceeded."""
+		values = {'ip': ip, 'username': username, 'global': None}
+		keys = [self._get_key(action, limit, values[limit.scope]) for limit in self.limits]
+		buckets = [self._get_local_bucket(key, limit) for key, limit in zip(keys, self.limits)]
+
+		wait_times = [bucket.get_wait_time() for bucket in buckets]
+		retry_after = max(wait_times)
+		if retry_after > 0:
+			scope = self.limits[wait_times.index(retry_after)].scope
+			RATE_LIMIT_REJECTED.labels(action, scope, 'local').inc()
+			raise RateLimitExceeded(scope, retry_after)
+
+		for bucket in buckets:
+			bucket.take()
+		args = []
+		for limit in self.limits:
+			args.extend([limit.limit, math.ceil(limit.period * 1000)])
+		try:
+			result = await self._script(keys, args)
+		except (RedisConnectionError, RedisTimeoutError) as e:
+			RATE_LIMIT_REDIS_FAILURES.inc()
+			logging.warning('Лимиты запросов в Redis недоступны: %r', e)
+			return
+
+		if not result[0]:
+			for bucket in buckets:
+				bucket.refund()
+			retry_after = result[1] / 1000
+			denied_bucket = buckets[result[2] - 1]
+			denied_bucket.block(retry_after)
+			RATE_LIMIT_REJECTED.labels(action, denied_bucket.limit.scope, 'redis').inc()
+			raise RateLimitExceeded(denied_bucket.limit.scope, retry_after)
+
+
+rate_limiter: RateLimiter | None = None
+
+
+async def get_rate_limiter() -> RateLimiter | None:
+	return rate_limiter
@@ -0,0 +1,280 @@
+import time
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Literal, NamedTuple
+
+from sqlalchemy import String, column, insert, literal, select, update, values
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.redis import INoSQLStorage, InMemoryStorage
+from models.entity import RefreshSession
+from services.batch_writer import BatchWriter
+
+
+class RotationResult(NamedTuple):
+	"""Итог ротации refresh токена.
+
+	reused - токен уже был заменен ранее, то есть его предъявляет кто-то кроме
+	владельца. family_user_agent - устройство, на котором токен был выпущен:
+	его цепочка токенов считается скомпрометированной.
+	"""
+	status: Literal['rotated', 'not_found', 'reused']
+	family_user_agent: str | None = None
+
+
+ROTATED = RotationResult('rotated')
+NOT_FOUND = RotationResult('not_found')
+
+
+class IRefreshSessionStore(ABC):
+	"""Хранилище активных refresh сессий: одна сессия на пользователя и устройство."""
+
+	@abstractmethod
+	async def put(self, user_id: str, user_agent: str, refresh_claims: dict) -> None:
+		pass
+
+	@abstractmethod
+	async def rotate(self, user_id: str, user_agent: str, old_jti: str, refresh_claims: dict) -> RotationResult:
+		"""Атомарно заменяет сессию устройства с refresh токеном old_jti на новую.
+
+		Из параллельных ротаций одного токена успешна ровно одна.
+		"""
+
+	@abstractmethod
+	async def delete(self, user_id: str, user_agent: str) -> None:
+		pass
+
+	@abstractmethod
+	async def delete_all(self, user_id: str) -> None:
+		pass
+
+
+class RefreshRotation(NamedTuple):
+	user_id: str
+	user_agent: str
+	old_jti: str
+	new_jti: str
+	created_at: datetime
+	expired_at: datetime
+
+
+class RefreshSessionMirror(BatchWriter[RefreshRotation]):
+	"""Отложенная запись ротаций refresh токенов в refresh_sessions для аудита."""
+	name = 'refresh_sessions'
+
+	async def write(self, session: AsyncSession, events: list[RefreshRotation]) -> None:
+		# ротация нового токена той же пачки пишется после строки, которую она закрывает
+		rounds: list[list[RefreshRotation]] = []
+		round_numbers = {}
+		for event in events:
+			round_number = round_numbers.get(event.old_jti, -1) + 1
+			round_numbers[event.new_jti] = round_number
+			if round_number == len(rounds):
+				rounds.append([])
+			rounds[round_number].append(event)
+
+		for rotations in rounds:
+			await session.execute(self.get_rotations_statement(rotations))
+
+	@staticmethod
+	def get_rotations_statement(events: list[RefreshRotation]):
+		"""Закрывает старые сессии и открывает новые только для еще активных старых сессий.
+
+		Ротация пишется позже, чем выполнена в Redis. Если за это время сессию
+		закрыли выход или смена пароля, новая сессия в Postgres не открывается.
+		"""
+		rotations = values(
+			column('id', RefreshSession.id.type),
+			column('user_id', RefreshSession.user_id.type),
+			column('old_jti', String),
+			column('new_jti', String),
+			column('created_at', RefreshSession.created_at.type),
+			column('expired_at', RefreshSession.expired_at.type),
+			name='rotations',
+		).data([
+			(uuid.uuid4(), event.user_id, event.old_jti, event.new_jti, event.created_at, event.expired_at)
+			for event in events
+		])
+		closed_sessions = (
+			update(RefreshSession).
+			where(
+				RefreshSession.user_id == rotations.c.user_id,
+				RefreshSession.refresh_jti == rotations.c.old_jti,
+				RefreshSession.is_active.is_(True),
+			).
+			values(is_active=False, replaced_by=rotations.c.new_jti).
+			returning(
+				rotations.c.id,
+				RefreshSession.user_id,
+				rotations.c.new_jti,
+				RefreshSession.user_agent,
+				rotations.c.created_at,
+				rotations.c.expired_at,
+			).
+			cte('closed_sessions')
+		)
+		return insert(RefreshSession).from_select(
+			['id', 'user_id', 'refresh_jti', 'user_agent', 'created_at', 'expired_at', 'is_active'],
+			select(
+				closed_sessions.c.id,
+				closed_sessions.c.user_id,
+				closed_sessions.c.new_jti,
+				closed_sessions.c.user_agent,
+				closed_sessions.c.created_at,
+				closed_sessions.c.expired_at,
+				literal(True),
+			),
+		)
+
+
+# продлевает время жизни хеша до истечения самой поздней сессии в нем
+EXTEND_EXPIRE_SCRIPT = '''
+local function extend_expire(key, expire_at)
+	local ttl = redis.call('TTL', key)
+	local now = tonumber(redis.call('TIME')[1])
+	if ttl < 0 or now + ttl < expire_at then
+		redis.call('EXPIREAT', key, expire_at)
+	end
+end
+'''
+
+# KEYS[1] - сессии пользователя, ARGV: устройство, jti, exp
+PUT_SCRIPT = EXTEND_EXPIRE_SCRIPT + '''
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2] .. ':' .. ARGV[3])
+extend_expire(KEYS[1], tonumber(ARGV[3]))
+'''
+
+# KEYS[1] - сессии пользователя, KEYS[2] - отметка о ротации старого jti,
+# ARGV: устройство, старый jti, новый jti, новый exp.
+# Возвращает 1 после ротации, 0 если сессии нет, устройство, на котором был
+# выпущен токен, если токен уже заменен. Цепочка этого устройства закрывается
+ROTATE_SCRIPT = EXTEND_EXPIRE_SCRIPT + '''
+local current = redis.call('HGET', KEYS[1], ARGV[1])
+if current then
+	local separator = string.find(current, ':', 1, true)
+	local jti = string.sub(current, 1, separator - 1)
+	local expire_at = tonumber(string.sub(current, separator + 1))
+	if jti == ARGV[2] and expire_at > tonumber(redis.call('TIME')[1]) then
+		redis.call('HSET', KEYS[1], ARGV[1], ARGV[3] .. ':' .. ARGV[4])
+		extend_expire(KEYS[1], tonumber(ARGV[4]))
+		redis.call('SET', KEYS[2], ARGV[1], 'EXAT', expire_at)
+		return 1
+	end
+end
+local family_user_agent = redis.call('GET', KEYS[2])
+if family_user_agent then
+	redis.call('HDEL', KEYS[1], family_user_agent)
+	return family_user_agent
+end
+return 0
+'''
+
+DELETE_SCRIPT = "return redis.call('HDEL', KEYS[1], ARGV[1])"
+
+
+def _extend_expire(storage: InMemoryStorage, key: str, expire_at: int) -> None:
+	ttl = storage.ttl(key)
+	now = time.time()
+	if ttl is None or now + ttl < expire_at:
+		storage.expire(key, expire_at - now)
+
+
+def put_session(storage: InMemoryStorage, keys: list[str], args: list) -> None:
+	"""PUT_SCRIPT для хранилища в памяти."""
+	user_agent, jti, expire_at = args
+	sessions = storage.read(keys[0])
+	if sessions is None:
+		sessions = {}
+		storage.write(keys[0], sessions)
+	sessions[user_agent] = f'{jti}:{expire_at}'
+	_extend_expire(storage, keys[0], int(expire_at))
+
+
+def rotate_session(storage: InMemoryStorage, keys: list[str], args: list) -> int | str:
+	"""ROTATE_SCRIPT для хранилища в памяти."""
+	user_agent, old_jti, new_jti, new_expire_at = args
+	sessions = storage.read(keys[0]) or {}
+	current = sessions.get(user_agent)
+	if current:
+		jti, _, expire_at = current.partition(':')
+		if jti == old_jti and int(expire_at) > int(time.time()):
+			sessions[user_agent] = f'{new_jti}:{new_expire_at}'
+			_extend_expire(storage, keys[0], int(new_expire_at))
+			storage.write(keys[1], user_agent, int(expire_at) - time.time())
+			return 1
+	family_user_agent = storage.read(keys[1])
+	if family_user_agent:
+		sessions.pop(family_user_agent, None)
+		return family_user_agent
+	return 0
+
+
+def delete_session(storage: InMemoryStorage, keys: list[str], args: list) -> int:
+	"""DELETE_SCRIPT для хранилища в памяти."""
+	sessions = storage.read(keys[0]) or {}
+	return int(sessions.pop(args[0], None) is not None)
+
+
+class RedisRefreshSessionStore(IRefreshSessionStore):
+	"""Активные refresh сессии в Redis, по хешу на пользователя с полем на устройство.
+
+	Значение поля - jti и exp refresh токена, хеш живет до истечения самой
+	поздней сессии. Ротация выполняется одним Lua скриптом за одно обращение
+	к Redis. Замененные jti помечаются до истечения токена, чтобы повторное
+	предъявление токена закрывало цепочку устройства. Ключи пользователя
+	объединены хеш-тегом и попадают в один слот Redis Cluster. Вход, выход и смена пароля по-прежнему пишут refresh_sessions
+	в своих транзакциях, а ротации копируются туда отложенно через mirror.
+	"""
+	key_prefix = 'refresh_sessions'
+
+	def __init__(self, no_sql: INoSQLStorage, mirror: RefreshSessionMirror | None = None) -> None:
+		self.no_sql = no_sql
+		self.mirror = mirror
+		self._put_script = no_sql.register_script(PUT_SCRIPT, put_session)
+		self._rotate_script = no_sql.register_script(ROTATE_SCRIPT, rotate_session)
+		self._delete_script = no_sql.register_script(DELETE_SCRIPT, delete_session)
+
+	def _get_key(self, user_id: str) -> str:
+		return f'{self.key_prefix}:{{{user_id}}}'
+
+	def _get_rotated_key(self, user_id: str, jti: str) -> str:
+		return f'{self._get_key(user_id)}:rotated:{jti}'
+
+	async def put(self, user_id: str, user_agent: str, refresh_claims: dict) -> None:
+		await self._put_script([self._get_key(user_id)], [user_agent, refresh_claims['jti'], refresh_claims['exp']])
+
+	async def rotate(self, user_id: str, user_agent: str, old_jti: str, refresh_claims: dict) -> RotationResult:
+		result = await self._rotate_script(
+			[self._get_key(user_id), self._get_rotated_key(user_id, old_jti)],
+			[user_agent, old_jti, refresh_claims['jti'], refresh_claims['exp']],
+		)
+		if result == 0:
+			return NOT_FOUND
+		if result != 1:
+			return RotationResult('reused', result.decode() if isinstance(result, bytes) else result)
+
+		if self.mirror:
+			await self.mirror.put(RefreshRotation(
+				user_id,
+				user_agent,
+				old_jti,
+				refresh_claims['jti'],
+				datetime.utcnow(),
+				datetime.fromtimestamp(refresh_claims['exp']),
+			))
+		return ROTATED
+
+	async def delete(self, user_id: str, user_agent: str) -> None:
+		await self._delete_script([self._get_key(user_id)], [user_agent])
+
+	async def delete_all(self, user_id: str) -> None:
+		await self.no_sql.delete(self._get_key(user_id))
+
+
+# None, если refresh сессии хранятся только в Postgres
+refresh_session_store: IRefreshSessionStore | None = None
+
+
+async def get_refresh_session_store() -> IRefreshSessionStore | None:
+	return refresh_session_store
@@ -0,0 +1,120 @@
+from datetime import datetime, timezone
+from typing import NamedTuple
+
+import jwt
+from async_fastapi_jwt_auth import AuthJWT
+from async_fastapi_jwt_auth.exceptions import InvalidHeaderError, JWTDecodeError
+from fastapi import Request, Response
+
+from core import jwt_keys
+
+
+class TokenPair(NamedTuple):
+	access_token: str
+	access_claims: dict
+	refresh_token: str
+	refresh_claims: dict
+
+
+class RequestAuthJWT(AuthJWT):
+	"""AuthJWT, который проверяет подпись каждого токена не больше одного раза за запрос.
+
+	FastAPI создает один экземпляр зависимости на запрос, поэтому эндпоинт
+	и AuthorizationChecker разделяют уже проверенные claims. Счетчик
+	signature_verifications показывает число проверок подписи в запросе.
+
+	Для асимметричных алгоритмов токены подписываются активным ключом
+	из jwt_key_set, а проверяются ключом, указанным в заголовке kid.
+	"""
+
+	def __init__(self, req: Request = None, res: Response = None):
+		super().__init__(req, res)
+		self._verified_claims: dict[str, dict] = {}
+		self.signature_verifications = 0
+
+	async def _verified_token(self, encoded_token: str, issuer: str | None = None) -> dict:
+		claims = self._verified_claims.get(encoded_token)
+		# проверка издателя сводится к сравнению iss, при расхождении проверяем заново ради ошибки
+		if claims is None or (issuer is not None and claims.get('iss') != issuer):
+			self.signature_verifications += 1
+			claims = await self._decode_token(encoded_token, issuer)
+			self._verified_claims[encoded_token] = claims
+		return claims
+
+	async def _decode_token(self, encoded_token: str, issuer: str | None) -> dict:
+		key_set = jwt_keys.jwt_key_set
+		if not key_set.is_asymmetric:
+			return await super()._verified_token(encoded_token, issuer)
+
+		try:
+			kid = jwt.get_unverified_header(encoded_token).get('kid')
+		except Exception as err:
+			raise InvalidHeaderError(status_code=422, message=str(err))
+
+		key = key_set.get_verification_key(kid)
+		if key is None:
+			raise InvalidHeaderError(status_code=422, message='Unknown signing key')
+
+		try:
+			return jwt.decode(
+				encoded_token,
+				key.public_key,
+				issuer=issuer,
+				audience=self._decode_audience,
+				leeway=self._decode_leeway,
+				algorithms=[key.algorithm],
+			)
+		except Exception as err:
+			raise JWTDecodeError(status_code=422, message=str(err))
+
+	async def get_access_claims(self) -> dict:
+		"""Проверяет access токен из заголовка и возвращает его claims."""
+		await self.jwt_required()
+		return await self.get_raw_jwt()
+
+	async def get_refresh_claims(self) -> dict:
+		"""Проверяет refresh токен из заголовка и возвращает его claims."""
+		await self.jwt_refresh_token_required()
+		return await self.get_raw_jwt()
+
+	async def create_token_with_claims(
+		self,
+		subject: str,
+		type_token: str,
+		user_claims: dict,
+	) -> tuple[str, dict]:
+		"""Выпускает токен и возвращает его вместе с claims, чтобы не декодировать его повторно."""
+		now = self._get_int_from_datetime(datetime.now(timezone.utc))
+		claims = {
+			'sub': subject,
+			'iat': now,
+			'nbf': now,
+			'jti': self._get_jwt_identifier(),
+			'exp': await self._get_expired_time(type_token),
+			'type': type_token,
+		}
+		# набор claims повторяет AuthJWT._create_token
+		if type_token == 'access':
+			claims['fresh'] = False
+			if self._encode_issuer:
+				claims['iss'] = self._encode_issuer
+		claims.update(user_claims)
+
+		key_set = jwt_keys.jwt_key_set
+		if key_set.is_asymmetric:
+			signing_key = key_set.signing_key
+			token = jwt.encode(
+				claims,
+				signing_key.private_key,
+				algorithm=signing_key.algorithm,
+				headers={'kid': signing_key.kid},
+			)
+			return token, claims
+
+		secret_key = await self._get_secret_key(self._algorithm, 'encode')
+		return jwt.encode(claims, secret_key, algorithm=self._algorithm), claims
+
+	async def create_token_pair(self, subject: str, user_claims: dict) -> TokenPair:
+		access_token, access_claims = await self.create_token_with_claims(subject, 'access', user_claims)
+		refresh_token, refresh_claims = await self.create_token_with_claims(subject, 'refresh', user_claims)
+		return TokenPair(access_token, access_claims, refresh_token, refresh_claims)
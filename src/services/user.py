@@ -5,6 +5,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
 from db.postgres import get_session
+from db.storage import PermissionsCache, TokenHandler, get_permissions_cache, get_token_handler
 from models.entity import User, Group
 from schemas.entity import UserInDB
 
@@ -71,8 +72,15 @@ class DatabaseSession:
 
 
 class UserPermissionsService:
-	def __init__(self, session: DatabaseSession):
+	def __init__(
+		self,
+		session: DatabaseSession,
+		permissions_cache: PermissionsCache,
+		token_handler: TokenHandler,
+	):
 		self.session = session
+		self.permissions_cache = permissions_cache
+		self.token_handler = token_handler
 
 	async def add_role_to_user(
 		self,
@@ -84,6 +92,10 @@ class UserPermissionsService:
 		if not user:
 			return None
 
+		await self.permissions_cache.invalidate(user.id)
+		# привилегии в выданных access токенах устарели
+		await self.token_handler.revoke_user_tokens(user.id)
+
 		return UserInDB(
 			id=user.id,
 			first_name=user.first_name,
@@ -101,6 +113,10 @@ class UserPermissionsService:
 		if not user:
 			return None
 
+		await self.permissions_cache.invalidate(user.id)
+		# привилегии в выданных access токенах устарели
+		await self.token_handler.revoke_user_tokens(user.id)
+
 		return UserInDB(
 			id=user.id,
 			first_name=user.first_name,
@@ -110,8 +126,12 @@ class UserPermissionsService:
 
 
 async def get_user_permissions_service(
-	db: AsyncSession = Depends(get_session)
+	db: AsyncSession = Depends(get_session),
+	permissions_cache: PermissionsCache = Depends(get_permissions_cache),
+	token_handler: TokenHandler = Depends(get_token_handler),
 ) -> UserPermissionsService:
 	return UserPermissionsService(
-		DatabaseSession(db)
+		DatabaseSession(db),
+		permissions_cache,
+		token_handler,
 	)
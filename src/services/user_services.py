@@ -1,23 +1,44 @@
+import base64
 import json
 import logging
 import uuid
 
 from datetime import datetime
-from functools import lru_cache
+from http import HTTPStatus
 
-from fastapi import Depends
-from sqlalchemy import select, update, UUID, func
+from fastapi import Depends, HTTPException
+from sqlalchemy import select, update, insert, exists, literal, tuple_, UUID, func
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
-from werkzeug.security import generate_password_hash, check_password_hash
-
-from db.postgres import get_session
-from db.redis import RedisStorage
-from db.storage import get_nosql_storage, TokenHandler
-from models.entity import User, RefreshSession, UserLoginHistory, Permission, Group
-from schemas.entity import RefreshToDb, UserLoginHistoryInDb, UserLogoutHistoryInDb, RefreshDelDb
-
-CACHE_EXPIRE_IN_SECONDS = 5 * 60  # 5 min
+from sqlalchemy.orm import aliased
+
+from core.hashing import PasswordHasher, get_password_hasher
+from db.postgres import SessionRouter, get_session, get_session_router
+from db.storage import (
+    get_permissions_cache,
+    get_token_handler,
+    PermissionsCache,
+    TokenHandler,
+)
+from models.entity import (
+    User,
+    RefreshSession,
+    UserLoginHistory,
+    Permission,
+    Group,
+    groups_users_table,
+    groups_permissions_table,
+)
+from schemas.entity import RefreshDelDb
+from services.history import HistoryWriter, get_history_writer
+from services.refresh_sessions import (
+    NOT_FOUND,
+    ROTATED,
+    IRefreshSessionStore,
+    RotationResult,
+    get_refresh_session_store,
+)
+from services.tokens import RequestAuthJWT, TokenPair
 
 
 class UserService:
@@ -25,23 +46,192 @@ class UserService:
             self,
             token_handler: TokenHandler,
             db: AsyncSession,
+            password_hasher: PasswordHasher,
+            permissions_cache: PermissionsCache,
+            history_writer: HistoryWriter | None = None,
+            sessions: SessionRouter | None = None,
+            session_store: IRefreshSessionStore | None = None,
     ) -> None:
         self.token_handler = token_handler
         self.db = db
+        self.password_hasher = password_hasher
+        self.permissions_cache = permissions_cache
+        self.history_writer = history_writer
+        self.sessions = sessions
+        self.session_store = session_store
+
+    async def _get_reader(self) -> AsyncSession:
+        """Сессия для запросов, которые только читают: реплика, пока запрос ничего не записал."""
+        if self.sessions is None:
+            return self.db
+        return await self.sessions.get_reader()
 
     async def get_user_permissions(self, user_id: str) -> list[str]:
-        user = (await self.db.execute(
-            select(User).where(User.id == user_id)
-        )).scalar()
-
-        permissions_in_groups = [group.permissions for group in user.groups]
-        permissions_names = []
-        for permissions_in_group in permissions_in_groups:
-            permissions_names.extend(
-                [permission_in_group.permission_name for permission_in_group in permissions_in_group]
+        """Возвращает имена привилегий пользователя, по возможности из кеша."""
+        permissions = await self.permissions_cache.get(user_id)
+        if permissions is not None:
+            return permissions
+
+        permissions = await self.get_user_permissions_from_db(user_id)
+        await self.permissions_cache.set(user_id, permissions)
+        return permissions
+
+    async def get_user_permissions_from_db(self, user_id: str) -> list[str]:
+        """Возвращает имена привилегий пользователя одним запросом, не загружая ORM-объекты.
+
+        Результат попадает в общий кеш и в токены, поэтому читается с основного
+        сервера: отстающая реплика вернула бы в кеш только что отозванные привилегии.
+        """
+        result = await self.db.execute(
+            select(Permission.permission_name).
+            distinct().
+            select_from(groups_users_table).
+            join(
+                groups_permissions_table,
+                groups_permissions_table.c.group_id == groups_users_table.c.group_id
+            ).
+            join(Permission, Permission.id == groups_permissions_table.c.permission_id).
+            where(groups_users_table.c.user_id == user_id)
+        )
+        return list(result.scalars().all())
+
+    async def signin(
+            self,
+            username: str,
+            password: str,
+            user_agent: str,
+            authorize: RequestAuthJWT,
+            max_sessions: int,
+    ) -> TokenPair:
+        """Вход пользователя в аккаунт за два запроса к базе данных.
+
+        Первый запрос читает пользователя вместе с признаком открытой сессии
+        на этом устройстве и привилегиями. Второй в одной транзакции закрывает
+        сессии сверх лимита, сохраняет refresh сессию и новый хеш пароля.
+        История входа пишется отложенно через HistoryWriter.
+        """
+        row = (await self.db.execute(self._get_signin_state_query(username, user_agent))).first()
+        # не удерживаем соединение на время проверки пароля
+        await self.db.rollback()
+
+        if not row or not await self.password_hasher.verify(row.password, password):
+            raise HTTPException(
+                status_code=HTTPStatus.UNAUTHORIZED,
+                detail='Неверное имя пользователя или пароль'
+            )
+        if row.is_logged_in:
+            raise HTTPException(
+                status_code=HTTPStatus.BAD_REQUEST,
+                detail='Данный пользователь уже совершил вход с данного устройства'
             )
 
-        return list(set(permissions_names))
+        # пересчитываем хеш пароля, если изменился профиль хеширования
+        password_hash = None
+        if self.password_hasher.needs_rehash(row.password):
+            password_hash = await self.password_hasher.hash(password)
+
+        user_id = str(row.id)
+        token_pair = await authorize.create_token_pair(
+            username,
+            {'user_id': user_id, 'permissions': row.permissions or []},
+        )
+
+        try:
+            revoked_sessions_number = (await self.db.execute(self._get_signin_write_query(
+                user_id, user_agent, token_pair.refresh_claims, max_sessions, password_hash,
+            ))).scalar()
+            await self.db.commit()
+        except SQLAlchemyError as e:
+            logging.error(e)
+            await self.db.rollback()
+            raise
+        await self.put_login_history_in_db(user_id, user_agent)
+
+        if self.session_store:
+            if revoked_sessions_number:
+                await self.session_store.delete_all(user_id)
+            await self.session_store.put(user_id, user_agent, token_pair.refresh_claims)
+
+        # при превышении лимита сессий отзываем и access токены, выпущенные до текущего входа
+        if revoked_sessions_number:
+            await self.token_handler.revoke_user_tokens(user_id, revoked_before=token_pair.access_claims['iat'])
+
+        return token_pair
+
+    @staticmethod
+    def _get_signin_state_query(username: str, user_agent: str):
+        # история входов пишется с задержкой, поэтому вход с устройства
+        # определяется по открытой refresh сессии
+        is_logged_in = exists().where(
+            RefreshSession.user_id == User.id,
+            RefreshSession.user_agent == user_agent,
+            RefreshSession.is_active.is_(True),
+            RefreshSession.expired_at > datetime.now(),
+        )
+        permissions = (
+            select(func.array_agg(Permission.permission_name.distinct())).
+            select_from(groups_users_table).
+            join(
+                groups_permissions_table,
+                groups_permissions_table.c.group_id == groups_users_table.c.group_id
+            ).
+            join(Permission, Permission.id == groups_permissions_table.c.permission_id).
+            where(groups_users_table.c.user_id == User.id).
+            scalar_subquery()
+        )
+        # выбираем колонки, а не User, чтобы не подгружать группы пользователя
+        return select(
+            User.id,
+            User.password,
+            is_logged_in.label('is_logged_in'),
+            permissions.label('permissions'),
+        ).where(User.username == username)
+
+    @staticmethod
+    def _get_signin_write_query(
+            user_id: str,
+            user_agent: str,
+            refresh_claims: dict,
+            max_sessions: int,
+            password_hash: str | None,
+    ):
+        active_sessions = aliased(RefreshSession)
+        active_sessions_number = (
+            select(func.count()).
+            select_from(active_sessions).
+            where(active_sessions.user_id == user_id, active_sessions.is_active.is_(True)).
+            scalar_subquery()
+        )
+        # все части запроса видят один снимок, новая сессия не попадет под закрытие
+        revoked_sessions = (
+            update(RefreshSession).
+            where(
+                RefreshSession.user_id == user_id,
+                RefreshSession.is_active.is_(True),
+                active_sessions_number > max_sessions,
+            ).
+            values(is_active=False).
+            returning(RefreshSession.id).
+            cte('revoked_sessions')
+        )
+        ctes = [
+            insert(RefreshSession).values(
+                id=uuid.uuid4(),
+                user_id=user_id,
+                refresh_jti=refresh_claims['jti'],
+                user_agent=user_agent,
+                created_at=datetime.utcnow(),
+                expired_at=datetime.fromtimestamp(refresh_claims['exp']),
+                is_active=True,
+            ).returning(RefreshSession.id).cte('new_session'),
+        ]
+        if password_hash:
+            ctes.append(
+                update(User).where(User.id == user_id).values(password=password_hash).
+                returning(User.id).cte('rehashed_password')
+            )
+
+        return select(func.count()).select_from(revoked_sessions).add_cte(*ctes)
 
     async def check_exist_user(self, user_dto):
         result = await self.db.execute(select(User).where(User.username == user_dto.get('username')))
@@ -56,7 +246,8 @@ class UserService:
         return True if not user else False
 
     async def create_user(self, user_dto):
-        user = User(**user_dto)
+        password_hash = await self.password_hasher.hash(user_dto.get('password'))
+        user = User(**user_dto, password_hash=password_hash)
         self.db.add(user)
         await self.db.commit()
         await self.db.refresh(user)
@@ -64,17 +255,19 @@ class UserService:
         return user
 
     async def update_password(self, user_dto):
-        user = User(**user_dto)
         if (
                 not await self.check_repeated_password(user_dto.get('password'), user_dto.get('repeated_old_password')) or
-                not await self._check_old_password(user_dto) or
                 user_dto.get('password') == user_dto.get('new_password')  # старый и новый пароль должны отличаться
         ):
             return False
 
-        new_password = generate_password_hash(user_dto.get('new_password'))
+        user = await self.get_user_by_username(user_dto.get('username'))
+        if not user or not await self.check_password(user, user_dto.get('password')):
+            return False
+
+        new_password = await self.password_hasher.hash(user_dto.get('new_password'))
         await self.db.execute(
-            update(User).where(User.username == user_dto.get('username')).values(password=new_password),
+            update(User).where(User.id == user.id).values(password=new_password),
         )
         await self.db.commit()
 
@@ -85,12 +278,9 @@ class UserService:
             return False
         return True
 
-    async def _check_old_password(self, user_dto):
-        result = await self.db.execute(select(User).where(User.username == user_dto.get('username')))
-        user = result.scalars().first()
-        old_pass_verified = check_password_hash(user.password, user_dto.get('password'))
-
-        return True if old_pass_verified else False
+    async def check_password(self, user: User, password: str) -> bool:
+        """Проверяет пароль пользователя в пуле хеширования, не блокируя event loop."""
+        return await self.password_hasher.verify(user.password, password)
 
     async def get_user_by_username(self, username: str) -> User | None:
         """Возвращает пользователя из базы данных по его username, если он есть."""
@@ -101,45 +291,6 @@ class UserService:
         except SQLAlchemyError as e:
             logging.error(e)
 
-    async def put_refresh_session_in_db(self, user_id: str, user_agent: str, decrypted_token: dict) -> None:
-        """Записывает созданный refresh токен в базу данных."""
-        session_dto = json.dumps({
-            'user_id': user_id,
-            'refresh_jti': decrypted_token['jti'],
-            'user_agent': user_agent,
-            'expired_at': datetime.fromtimestamp(decrypted_token['exp']).isoformat(),
-            'is_active': True
-        })
-        data = RefreshToDb.model_validate_json(session_dto)
-        try:
-            row = RefreshSession(**data.model_dump())
-            self.db.add(row)
-            await self.db.commit()
-            await self.db.refresh(row)
-        except SQLAlchemyError as e:
-            logging.error(e)
-            await self.db.rollback()
-
-    async def check_if_session_exist(self, user_id: str, user_agent: str) -> bool:
-        """Проверяет существование сессии."""
-        session_dto = json.dumps({
-            'user_id': user_id,
-            'user_agent': user_agent,
-        })
-        data = RefreshDelDb.model_validate_json(session_dto)
-        try:
-            stmt = select(RefreshSession). \
-                where(
-                User.id == data.user_id,
-                    RefreshSession.user_agent == data.user_agent,
-                    RefreshSession.is_active.is_(True),
-                )
-            result = await self.db.execute(stmt)
-            row = result.scalars().first()
-            return True if row else False
-        except SQLAlchemyError as e:
-            logging.error(e)
-
     async def del_refresh_session_in_db(self, user_id: str, user_agent: str) -> None:
         """Помечает refresh токен как удаленный в базе данных."""
         session_dto = json.dumps({
@@ -151,7 +302,7 @@ class UserService:
             stmt = update(RefreshSession). \
                 values(is_active=False). \
                 where(
-                    User.id == data.user_id,
+                    RefreshSession.user_id == data.user_id,
                     RefreshSession.user_agent == data.user_agent,
                     RefreshSession.is_active.is_(True),
                 )
@@ -160,132 +311,212 @@ class UserService:
         except SQLAlchemyError as e:
             logging.error(e)
             await self.db.rollback()
+        if self.session_store:
+            await self.session_store.delete(user_id, user_agent)
 
-    async def del_all_refresh_sessions_in_db(self, user: User) -> None:
-        try:
-            await self.db.execute(
-                update(RefreshSession).where(RefreshSession.user_id == user.id).values(is_active=False),
-            )
-            await self.db.commit()
-        except SQLAlchemyError as e:
-            logging.error(e)
-
-    async def put_login_history_in_db(self, user_id: str, user_agent: str) -> None:
-        """Записывает историю входа в аккаунт в базу данных."""
-        history_dto = json.dumps({
-            'user_id': user_id,
-            'user_agent': user_agent,
-        })
-        data = UserLoginHistoryInDb.model_validate_json(history_dto)
+    async def rotate_refresh_session(
+            self,
+            user_id: str,
+            user_agent: str,
+            old_jti: str,
+            refresh_claims: dict,
+    ) -> bool:
+        """Заменяет refresh сессию устройства на сессию нового refresh токена.
+
+        Замена - одна атомарная операция сравнения и замены по refresh_jti: из
+        параллельных запросов с одним токеном успешен ровно один, и блокируется
+        только строка сессии этого устройства. Повторное предъявление уже
+        замененного токена закрывает цепочку сессий устройства, на котором он
+        был выпущен. Возвращает True, если сессия заменена.
+        """
+        if self.session_store:
+            result = await self.session_store.rotate(user_id, user_agent, old_jti, refresh_claims)
+        else:
+            result = await self._rotate_refresh_session_in_db(user_id, user_agent, old_jti, refresh_claims)
+
+        if result.status == 'reused':
+            await self._revoke_refresh_family(user_id, result.family_user_agent)
+        return result.status == 'rotated'
+
+    async def _rotate_refresh_session_in_db(
+            self,
+            user_id: str,
+            user_agent: str,
+            old_jti: str,
+            refresh_claims: dict,
+    ) -> RotationResult:
         try:
-            row = UserLoginHistory(**data.model_dump())
-            self.db.add(row)
+            row = (await self.db.execute(
+                self._get_rotate_query(user_id, user_agent, old_jti, refresh_claims),
+            )).one()
             await self.db.commit()
-            await self.db.refresh(row)
         except SQLAlchemyError as e:
             logging.error(e)
             await self.db.rollback()
+            raise
+        if row.is_rotated:
+            return ROTATED
+        if row.family_user_agent is not None:
+            return RotationResult('reused', row.family_user_agent)
+        return NOT_FOUND
+
+    @staticmethod
+    def _get_rotate_query(user_id: str, user_agent: str, old_jti: str, refresh_claims: dict):
+        # конкурентный UPDATE той же строки ждет коммита первого и перепроверяет
+        # условие, поэтому второй запрос не найдет активную сессию со старым jti
+        rotated_session = (
+            update(RefreshSession).
+            where(
+                RefreshSession.user_id == user_id,
+                RefreshSession.user_agent == user_agent,
+                RefreshSession.refresh_jti == old_jti,
+                RefreshSession.is_active.is_(True),
+            ).
+            values(is_active=False, replaced_by=refresh_claims['jti']).
+            returning(RefreshSession.id).
+            cte('rotated_session')
+        )
+        new_session = (
+            insert(RefreshSession).
+            from_select(
+                ['id', 'user_id', 'refresh_jti', 'user_agent', 'created_at', 'expired_at', 'is_active'],
+                select(
+                    literal(uuid.uuid4(), RefreshSession.id.type),
+                    literal(user_id, RefreshSession.user_id.type),
+                    literal(refresh_claims['jti']),
+                    literal(user_agent),
+                    literal(datetime.utcnow(), RefreshSession.created_at.type),
+                    literal(datetime.fromtimestamp(refresh_claims['exp']), RefreshSession.expired_at.type),
+                    literal(True),
+                ).select_from(rotated_session),
+            ).
+            returning(RefreshSession.id).
+            cte('new_session')
+        )
+        # повторным использованием считается только токен, уже замененный ротацией:
+        # токен сессии, закрытой выходом, лимитом сессий или сменой пароля, просто недействителен
+        family_user_agent = (
+            select(RefreshSession.user_agent).
+            where(
+                RefreshSession.refresh_jti == old_jti,
+                RefreshSession.user_id == user_id,
+                RefreshSession.replaced_by.is_not(None),
+            ).
+            scalar_subquery()
+        )
+        return select(
+            exists(select(new_session.c.id)).label('is_rotated'),
+            family_user_agent.label('family_user_agent'),
+        )
 
-    async def check_if_user_login(self, user_id: str, user_agent: str) -> bool:
-        """Проверяет существования активной записи о входе пользователя с данного устройства."""
-        try:
-            stmt = select(UserLoginHistory). \
-                where(
-                    UserLoginHistory.user_id == user_id,
-                    UserLoginHistory.user_agent == user_agent,
-                    UserLoginHistory.logout_at.is_(None))
-
-            result = await self.db.execute(stmt)
-            active_login_history = result.scalars().first()
+    async def _revoke_refresh_family(self, user_id: str, family_user_agent: str) -> None:
+        """Закрывает сессию устройства и отзывает access токены пользователя.
 
-            return True if active_login_history else False
-        except SQLAlchemyError as e:
-            logging.error(e)
+        access токены не содержат устройство, поэтому отзываются все токены
+        пользователя, выпущенные до этого момента.
+        """
+        logging.warning('Повторное использование refresh токена пользователя %s', user_id)
+        await self.del_refresh_session_in_db(user_id, family_user_agent)
+        await self.token_handler.revoke_user_tokens(user_id)
 
-    async def put_logout_history_in_db(self, user_id: str, user_agent: str) -> None:
-        """Записывает историю выхода из аккаунта в базу данных."""
-        history_dto = json.dumps({
-            'user_id': user_id,
-            'user_agent': user_agent,
-            'logout_at': datetime.now().isoformat()
-        })
-        data = UserLogoutHistoryInDb.model_validate_json(history_dto)
+    async def del_all_refresh_sessions_in_db(self, user: User) -> None:
         try:
-            stmt = update(UserLoginHistory). \
-                values(logout_at=data.logout_at). \
-                where(
-                    User.id == data.user_id,
-                    UserLoginHistory.user_agent == data.user_agent
-                )
-
-            await self.db.execute(stmt)
+            await self.db.execute(
+                update(RefreshSession).where(RefreshSession.user_id == user.id).values(is_active=False),
+            )
             await self.db.commit()
         except SQLAlchemyError as e:
             logging.error(e)
-            await self.db.rollback()
+        if self.session_store:
+            await self.session_store.delete_all(str(user.id))
 
-    async def count_refresh_sessions(self, user_id: str) -> int:
-        """Возвращает число открытых сессий пользователя."""
-        try:
-            result = await self.db.execute(select(RefreshSession).where(
-                RefreshSession.user_id == user_id,
-                RefreshSession.is_active.is_(True),
-                ))
-            sessions = result.scalars().all()
-            return sessions.count() if len(sessions) > 0 else 0
-        except SQLAlchemyError as e:
-            logging.error(e)
+    async def put_login_history_in_db(self, user_id: str, user_agent: str) -> None:
+        """Ставит запись истории входа в очередь отложенной записи в базу данных."""
+        await self.history_writer.put_login(user_id, user_agent)
 
-    async def calc_previous_and_next_pages(self, page_number, page_size, count):
-        previous = page_number - 1 if page_number != 1 else None
-        next_page = page_number + 1 if count // (page_size * page_number) > 1 else None
-        return previous, next_page
+    async def put_logout_history_in_db(self, user_id: str, user_agent: str) -> None:
+        """Ставит запись истории выхода в очередь отложенной записи в базу данных."""
+        await self.history_writer.put_logout(user_id, user_agent)
 
     async def get_login_history(
             self,
             user_id: uuid,
             page_size: int,
-            page_number: int,
-    ) -> list[dict[str, UUID | datetime | str]]:
-
-        offset_min, offset_max = await self.calculate_offset(page_size, page_number)
-
-        result = await self.db.execute(
-            select(UserLoginHistory).
+            page_number: int = 1,
+            cursor: str | None = None,
+    ) -> tuple[list[dict[str, UUID | datetime | str]], str | None]:
+        """Возвращает страницу истории входов, новые записи первыми, и курсор следующей страницы.
+
+        С курсором страница начинается сразу после записи, на которой закончилась
+        предыдущая, и ее стоимость не зависит от глубины. Номер страницы
+        поддерживается для совместимости и читается через OFFSET.
+        """
+        stmt = (
+            select(UserLoginHistory.id, UserLoginHistory.user_id, UserLoginHistory.user_agent, UserLoginHistory.login_at).
             where(UserLoginHistory.user_id == str(user_id)).
-            order_by(UserLoginHistory.id).
-            offset(offset_min).
-            limit(offset_max - offset_min)
+            order_by(UserLoginHistory.login_at.desc(), UserLoginHistory.id.desc()).
+            limit(page_size + 1)
         )
-        history = result.scalars().all()
+        if cursor:
+            login_at, history_id = self.decode_history_cursor(cursor)
+            stmt = stmt.where(
+                tuple_(UserLoginHistory.login_at, UserLoginHistory.id) < tuple_(login_at, history_id)
+            )
+        else:
+            stmt = stmt.offset((page_number - 1) * page_size)
+
+        # лишняя запись показывает, что есть следующая страница, без подсчета всех записей
+        history = (await (await self._get_reader()).execute(stmt)).all()
+        next_cursor = self.encode_history_cursor(history[page_size - 1]) if len(history) > page_size else None
 
         history_dto = [{
             'user_id': item.user_id,
             'user_agent': item.user_agent,
             'login_at': item.login_at,
-        } for item in history]
+        } for item in history[:page_size]]
 
-        return history_dto
+        return history_dto, next_cursor
+
+    @staticmethod
+    def encode_history_cursor(item) -> str:
+        cursor = json.dumps([item.login_at.isoformat(), str(item.id)])
+        return base64.urlsafe_b64encode(cursor.encode()).decode()
+
+    @staticmethod
+    def decode_history_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+        try:
+            login_at, history_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            # курсор присылает клиент, поэтому типы элементов проверяются до разбора
+            if not isinstance(login_at, str) or not isinstance(history_id, str):
+                raise ValueError(cursor)
+            return datetime.fromisoformat(login_at), uuid.UUID(history_id)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail='Некорректный курсор')
 
     async def get_login_history_count(self, user_id: uuid):
-        result = await self.db.execute(
+        db = await self._get_reader()
+        result = await db.execute(
             select(func.count(UserLoginHistory.id)).
             where(UserLoginHistory.user_id == str(user_id))
         )
         return result.scalar()
 
-    async def calculate_offset(self, page_size: int, page_number: int) -> tuple[int, int]:
-        offset_min = (page_number - 1) * page_size
-        offset_max = offset_min + page_size
 
-        return offset_min, offset_max
-
-
-@lru_cache()
-def get_user_service(
-        no_sql: RedisStorage = Depends(get_nosql_storage),
+async def get_user_service(
+        token_handler: TokenHandler = Depends(get_token_handler),
         db: AsyncSession = Depends(get_session),
+        password_hasher: PasswordHasher = Depends(get_password_hasher),
+        permissions_cache: PermissionsCache = Depends(get_permissions_cache),
+        history_writer: HistoryWriter = Depends(get_history_writer),
+        sessions: SessionRouter = Depends(get_session_router),
+        session_store: IRefreshSessionStore | None = Depends(get_refresh_session_store),
 ) -> UserService:
-    token_handler = TokenHandler(no_sql, CACHE_EXPIRE_IN_SECONDS)
-
-    return UserService(token_handler, db)
+    return UserService(
+        token_handler,
+        db,
+        password_hasher,
+        permissions_cache,
+        history_writer,
+        sessions,
+        session_store,
+    )
@@ -0,0 +1,105 @@
+"""Оценка числа обращений к Redis, которые экономит фильтр Блума списка отозванных токенов.
+
+Генерирует поток проверок access токенов, часть из которых отозвана,
+и считает запросы к хранилищу и долю ложных срабатываний фильтра.
+Локальный кеш валидных jti отключен, чтобы измерить только эффект фильтра.
+
+Запуск из каталога src:
+	python tests/benchmarks/denylist_bloom.py --tokens 100000 --revocation-rate 0.01
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+import uuid
+
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+from db.redis import InMemoryStorage
+from db.storage import TokenHandler
+
+
+ACCESS_TOKEN_LIFETIME = 600
+
+
+class CountingStorage(InMemoryStorage):
+	"""Хранилище в памяти, считающее обращения на чтение."""
+
+	def __init__(self) -> None:
+		super().__init__()
+		self.get_calls = 0
+
+	async def get(self, key: str) -> str | None:
+		self.get_calls += 1
+		return await super().get(key)
+
+	async def mget(self, *keys: str) -> list[str | None]:
+		self.get_calls += 1
+		return [await super(CountingStorage, self).get(key) for key in keys]
+
+
+async def main(tokens_number: int, revocation_rate: float, capacity: int, error_rate: float) -> None:
+	now = int(time.time())
+	tokens = [
+		{
+			'jti': str(uuid.uuid4()),
+			'user_id': 'benchmark-user',
+			'iat': now,
+			'exp': now + random.randint(1, ACCESS_TOKEN_LIFETIME),
+		}
+		for _ in range(tokens_number)
+	]
+	revoked = random.sample(range(tokens_number), int(tokens_number * revocation_rate))
+
+	storage = CountingStorage()
+	token_handler = TokenHandler(
+		storage,
+		negative_ttl=0,
+		access_token_expires=ACCESS_TOKEN_LIFETIME,
+		bloom_capacity=capacity,
+		bloom_error_rate=error_rate,
+	)
+	for index in revoked:
+		await token_handler.put_token_in_denylist(tokens[index])
+	token_handler.local_denylist.clear()
+	await token_handler._sync_bloom_filter()
+	# время массового отзыва пользователя считается известным, измеряем только проверку jti
+	token_handler.local_revoked_before.set(
+		token_handler._get_revoked_before_key('benchmark-user'), 0, ACCESS_TOKEN_LIFETIME
+	)
+
+	revoked_jti = {tokens[index]['jti'] for index in revoked}
+	false_positives = sum(
+		1 for token in tokens
+		if token['jti'] not in revoked_jti and token_handler.bloom_filter.might_contain(token['jti'], token['exp'])
+	)
+
+	started_at = time.perf_counter()
+	for token in tokens:
+		await token_handler._check_if_token_in_denylist(token)
+		# отозванные jti закешированы локально, сбрасываем кеш, чтобы считать честно
+		token_handler.local_denylist.clear()
+	elapsed = time.perf_counter() - started_at
+
+	valid_number = tokens_number - len(revoked)
+	print(f'checks:               {tokens_number}')
+	print(f'revoked:              {len(revoked)}')
+	print(f'redis reads without filter: {tokens_number}')
+	print(f'redis reads with filter:    {storage.get_calls}')
+	print(f'redis calls avoided:  {1 - storage.get_calls / tokens_number:.2%}')
+	print(f'false positive rate:  {false_positives / valid_number if valid_number else 0:.4%}')
+	print(f'check time:           {elapsed / tokens_number * 1e6:.2f} us per token')
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--tokens', type=int, default=100000)
+	parser.add_argument('--revocation-rate', type=float, default=0.01)
+	parser.add_argument('--capacity', type=int, default=100000)
+	parser.add_argument('--error-rate', type=float, default=0.01)
+	args = parser.parse_args()
+
+	asyncio.run(main(args.tokens, args.revocation_rate, args.capacity, args.error_rate))
@@ -0,0 +1,79 @@
+"""Задержка проверки отзыва access токена с локальными кешами и без них.
+
+Проверяет поток валидных токенов в двух режимах: рабочем, когда фильтр
+Блума заполнен и результаты проверок кешируются, и худшем, когда каждая
+проверка идет в Redis. Печатает перцентили задержки одной проверки.
+Функциональный тест проверяет бюджет худшего случая на хранилище в памяти,
+здесь к нему добавляется задержка сети до Redis.
+
+Нужен Redis из настроек приложения. Запуск из каталога src:
+	python tests/benchmarks/denylist_latency.py --checks 10000
+"""
+import argparse
+import asyncio
+import sys
+import time
+import uuid
+
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+from core.config import settings
+from db.redis import create_redis_storage
+from db.storage import TokenHandler
+
+
+MODES = {
+	'cached': {'negative_ttl': 5.0, 'sync_bloom_filter': True},
+	'all redis': {'negative_ttl': 0, 'sync_bloom_filter': False},
+}
+
+
+async def measure(checks_number: int, negative_ttl: float, sync_bloom_filter: bool) -> list[float]:
+	"""Возвращает отсортированные задержки проверок в миллисекундах."""
+	storage = create_redis_storage(settings)
+	token_handler = TokenHandler(storage, negative_ttl=negative_ttl)
+	if sync_bloom_filter:
+		await token_handler._sync_bloom_filter()
+
+	now = int(time.time())
+	user_ids = [str(uuid.uuid4()) for _ in range(10)]
+	timings = []
+	try:
+		for i in range(checks_number):
+			decrypted_token = {
+				'jti': str(uuid.uuid4()),
+				'user_id': user_ids[i % len(user_ids)],
+				'iat': now,
+				'exp': now + 600,
+			}
+			started_at = time.perf_counter()
+			await token_handler.check_if_token_is_valid(decrypted_token)
+			timings.append((time.perf_counter() - started_at) * 1000)
+	finally:
+		await storage.close()
+	return sorted(timings)
+
+
+def percentile(timings: list[float], share: float) -> float:
+	return timings[max(int(len(timings) * share) - 1, 0)]
+
+
+async def main(checks_number: int) -> None:
+	for mode, params in MODES.items():
+		timings = await measure(checks_number, **params)
+		print(
+			f'{mode:<10}'
+			f'p50 {percentile(timings, 0.5):7.3f} ms  '
+			f'p99 {percentile(timings, 0.99):7.3f} ms  '
+			f'max {timings[-1]:7.3f} ms'
+		)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--checks', type=int, default=10000)
+	args = parser.parse_args()
+
+	asyncio.run(main(args.checks))
@@ -0,0 +1,68 @@
+"""Замер стоимости подписи и проверки JWT для поддерживаемых алгоритмов.
+
+Запуск из каталога src:
+	python tests/benchmarks/jwt_algorithms.py --rounds 2000
+"""
+import argparse
+import secrets
+import sys
+import time
+import uuid
+
+from pathlib import Path
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+from core.jwt_keys import generate_private_key
+
+
+CLAIMS = {
+	'sub': 'benchmark-user',
+	'user_id': str(uuid.uuid4()),
+	'permissions': ['movies.read', 'movies.write', 'subscribers.read'],
+	'type': 'access',
+}
+
+
+def build_keys() -> dict[str, tuple]:
+	keys = {'HS256': (secrets.token_bytes(32), None)}
+	for algorithm in ('RS256', 'EdDSA'):
+		private_key = serialization.load_pem_private_key(generate_private_key(algorithm), password=None)
+		keys[algorithm] = (private_key, private_key.public_key())
+	return keys
+
+
+def measure(algorithm: str, signing_key, verification_key, rounds: int) -> tuple[float, float, int]:
+	verification_key = verification_key or signing_key
+
+	started_at = time.perf_counter()
+	for _ in range(rounds):
+		token = jwt.encode(CLAIMS, signing_key, algorithm=algorithm, headers={'kid': 'benchmark'})
+	sign_time = (time.perf_counter() - started_at) / rounds
+
+	started_at = time.perf_counter()
+	for _ in range(rounds):
+		jwt.decode(token, verification_key, algorithms=[algorithm])
+	verify_time = (time.perf_counter() - started_at) / rounds
+
+	return sign_time, verify_time, len(token)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--rounds', type=int, default=1000)
+	args = parser.parse_args()
+
+	print(f'{"algorithm":<12}{"sign, us":>12}{"verify, us":>12}{"verify/s":>12}{"token, B":>12}')
+	for algorithm, (signing_key, verification_key) in build_keys().items():
+		sign_time, verify_time, token_size = measure(algorithm, signing_key, verification_key, args.rounds)
+		print(
+			f'{algorithm:<12}'
+			f'{sign_time * 1e6:>12.1f}'
+			f'{verify_time * 1e6:>12.1f}'
+			f'{1 / verify_time:>12.0f}'
+			f'{token_size:>12}'
+		)
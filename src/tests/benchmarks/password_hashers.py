@@ -0,0 +1,63 @@
+"""Замер времени проверки пароля для профилей хеширования на текущей машине.
+
+Запуск из каталога src:
+	python tests/benchmarks/password_hashers.py --rounds 20
+"""
+import argparse
+import statistics
+import sys
+import time
+
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+from core.config import settings
+from core.hashing import Argon2Hasher, BaseHasher, Pbkdf2Hasher, ScryptHasher, hash_context
+
+
+PASSWORD = 'correct horse battery staple'
+
+
+def build_profiles() -> dict[str, BaseHasher]:
+	return {
+		'current': hash_context.default,
+		f'pbkdf2:sha256:{settings.PASSWORD_PBKDF2_ITERATIONS}': Pbkdf2Hasher(
+			iterations=settings.PASSWORD_PBKDF2_ITERATIONS
+		),
+		'pbkdf2:sha256:100000': Pbkdf2Hasher(iterations=100000),
+		'scrypt:32768:8:1': ScryptHasher(n=2 ** 15, r=8, p=1),
+		'scrypt:16384:8:1': ScryptHasher(n=2 ** 14, r=8, p=1),
+		'argon2:t=3,m=65536,p=4': Argon2Hasher(time_cost=3, memory_cost=65536, parallelism=4),
+		'argon2:t=2,m=19456,p=1': Argon2Hasher(time_cost=2, memory_cost=19456, parallelism=1),
+	}
+
+
+def measure_verify(hasher: BaseHasher, rounds: int) -> list[float]:
+	password_hash = hasher.hash(PASSWORD)
+	timings = []
+	for _ in range(rounds):
+		started_at = time.perf_counter()
+		assert hasher.verify(password_hash, PASSWORD)
+		timings.append((time.perf_counter() - started_at) * 1000)
+	return timings
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--rounds', type=int, default=10)
+	args = parser.parse_args()
+
+	print(f'{"profile":<32}{"mean, ms":>12}{"p50, ms":>12}{"max, ms":>12}')
+	for name, hasher in build_profiles().items():
+		try:
+			timings = measure_verify(hasher, args.rounds)
+		except RuntimeError as e:
+			print(f'{name:<32}skipped: {e}')
+			continue
+		print(
+			f'{name:<32}'
+			f'{statistics.mean(timings):>12.2f}'
+			f'{statistics.median(timings):>12.2f}'
+			f'{max(timings):>12.2f}'
+		)
@@ -0,0 +1,82 @@
+"""Пропускная способность Redis при обращении по одному ключу и пачками.
+
+Записывает и читает заданное число ключей тремя способами: отдельной
+командой на ключ, MSET/MGET и pipeline, и удаляет созданные ключи.
+
+Запуск из каталога src:
+	python tests/benchmarks/redis_batching.py --keys 10000 --batch 100
+"""
+import argparse
+import asyncio
+import sys
+import time
+import uuid
+
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+from db.redis import RedisStorage
+from tests.functional.settings import test_settings
+
+
+EXPIRED_TIME = 60
+
+
+def get_batches(keys: list[str], batch_size: int) -> list[list[str]]:
+	return [keys[i:i + batch_size] for i in range(0, len(keys), batch_size)]
+
+
+async def per_key(storage: RedisStorage, keys: list[str], batch_size: int) -> None:
+	for key in keys:
+		await storage.set(key, key, EXPIRED_TIME)
+	for key in keys:
+		await storage.get(key)
+
+
+async def multi_key(storage: RedisStorage, keys: list[str], batch_size: int) -> None:
+	for batch in get_batches(keys, batch_size):
+		await storage.mset({key: key for key in batch}, EXPIRED_TIME)
+	for batch in get_batches(keys, batch_size):
+		await storage.mget(*batch)
+
+
+async def pipelined(storage: RedisStorage, keys: list[str], batch_size: int) -> None:
+	for batch in get_batches(keys, batch_size):
+		async with storage.pipeline() as pipe:
+			for key in batch:
+				pipe.set(key, key, EXPIRED_TIME)
+				pipe.incr(f'{key}:counter', expired_time=EXPIRED_TIME)
+			await pipe.execute()
+	for batch in get_batches(keys, batch_size):
+		async with storage.pipeline() as pipe:
+			for key in batch:
+				pipe.get(key)
+			await pipe.execute()
+
+
+async def main(keys_number: int, batch_size: int) -> None:
+	storage = RedisStorage(host=test_settings.REDIS_HOST, port=test_settings.REDIS_PORT, decode_responses=True)
+	prefix = f'bench-{uuid.uuid4().hex[:8]}'
+	keys = [f'{prefix}:{i}' for i in range(keys_number)]
+
+	try:
+		for name, func in (('per key', per_key), ('mset/mget', multi_key), ('pipeline', pipelined)):
+			started_at = time.perf_counter()
+			await func(storage, keys, batch_size)
+			elapsed = time.perf_counter() - started_at
+			# запись и чтение каждого ключа - две операции
+			print(f'{name:<12}{2 * keys_number / elapsed:12.0f} ops/s  {elapsed:8.3f} s')
+	finally:
+		for batch in get_batches(keys, 1000):
+			await storage.delete(*batch, *[f'{key}:counter' for key in batch])
+		await storage.close()
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--keys', type=int, default=10000)
+	parser.add_argument('--batch', type=int, default=100)
+	args = parser.parse_args()
+
+	asyncio.run(main(args.keys, args.batch))
@@ -0,0 +1,140 @@
+"""Пропускная способность ротации refresh токенов в Postgres и в Redis.
+
+Создает в тестовой базе пользователей с открытой сессией на устройстве,
+параллельно ротирует их сессии заданное время и удаляет созданные данные.
+В режиме redis копия сессий в Postgres пишется отложенно, время ее записи
+не входит в замер, но очередь дописывается до удаления данных.
+
+Запуск из каталога src:
+	python tests/benchmarks/refresh_rotation.py --users 100 --duration 10
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from db.redis import RedisStorage
+from models.entity import User, RefreshSession
+from services.refresh_sessions import RedisRefreshSessionStore, RefreshSessionMirror
+from services.user_services import UserService
+from tests.functional.settings import test_settings
+
+
+dsn = (
+	f'{test_settings.POSTGRES_SCHEME}://{test_settings.POSTGRES_USER}:'
+	f'{test_settings.POSTGRES_PASSWORD}@{test_settings.POSTGRES_HOST}:'
+	f'{test_settings.POSTGRES_PORT}/{test_settings.POSTGRES_DB}'
+)
+USER_AGENT = 'benchmark-user-agent'
+
+
+def make_refresh_claims() -> dict:
+	return {
+		'jti': str(uuid.uuid4()),
+		'exp': int((datetime.now() + timedelta(days=1)).timestamp()),
+	}
+
+
+async def seed(session: AsyncSession, prefix: str, users_number: int) -> list[tuple[str, str]]:
+	users = [User(f'{prefix}-user-{i}', '', password_hash='benchmark') for i in range(users_number)]
+	session.add_all(users)
+	await session.commit()
+
+	sessions = []
+	for user in users:
+		claims = make_refresh_claims()
+		session.add(RefreshSession(
+			user.id, claims['jti'], USER_AGENT, datetime.fromtimestamp(claims['exp']), True,
+		))
+		sessions.append((str(user.id), claims['jti']))
+	await session.commit()
+	return sessions
+
+
+async def clean_up(session: AsyncSession, prefix: str) -> None:
+	user_ids = User.__table__.select().with_only_columns(User.id).where(User.username.like(f'{prefix}-%'))
+	await session.execute(delete(RefreshSession).where(RefreshSession.user_id.in_(user_ids)))
+	await session.execute(delete(User).where(User.username.like(f'{prefix}-%')))
+	await session.commit()
+
+
+async def run_rotations(
+	async_session: async_sessionmaker[AsyncSession],
+	sessions: list[tuple[str, str]],
+	duration: float,
+	store: RedisRefreshSessionStore | None,
+) -> list[float]:
+	"""Каждый пользователь ротирует свою сессию по кругу, как клиент, обновляющий токены."""
+	deadline = time.perf_counter() + duration
+	timings = []
+
+	async def client(user_id: str, jti: str) -> None:
+		while time.perf_counter() < deadline:
+			claims = make_refresh_claims()
+			started_at = time.perf_counter()
+			# сервис создается на запрос вместе с сессией базы данных, как в приложении
+			async with async_session() as db:
+				user_service = UserService(None, db, None, None, session_store=store)
+				assert await user_service.rotate_refresh_session(user_id, USER_AGENT, jti, claims)
+			timings.append((time.perf_counter() - started_at) * 1000)
+			jti = claims['jti']
+
+	await asyncio.gather(*(client(user_id, jti) for user_id, jti in sessions))
+	return timings
+
+
+async def main(users_number: int, duration: float) -> None:
+	engine = create_async_engine(dsn, pool_size=users_number, max_overflow=0)
+	async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+	storage = RedisStorage(host=test_settings.REDIS_HOST, port=test_settings.REDIS_PORT, decode_responses=True)
+
+	for backend in ('postgres', 'redis'):
+		prefix = f'bench-{uuid.uuid4().hex[:8]}'
+		async with async_session() as session:
+			sessions = await seed(session, prefix, users_number)
+
+		store, mirror = None, None
+		if backend == 'redis':
+			mirror = RefreshSessionMirror(async_session)
+			mirror.start()
+			store = RedisRefreshSessionStore(storage, mirror)
+			for user_id, jti in sessions:
+				await store.put(user_id, USER_AGENT, {'jti': jti, 'exp': make_refresh_claims()['exp']})
+
+		try:
+			timings = await run_rotations(async_session, sessions, duration, store)
+			print(
+				f'{backend:<10}'
+				f'{len(timings) / duration:10.0f} rotations/s  '
+				f'p50 {statistics.median(timings):8.2f} ms  '
+				f'p99 {statistics.quantiles(timings, n=100)[98]:8.2f} ms'
+			)
+		finally:
+			if mirror:
+				await mirror.close()
+				for user_id, _ in sessions:
+					await store.delete_all(user_id)
+			async with async_session() as session:
+				await clean_up(session, prefix)
+
+	await storage.close()
+	await engine.dispose()
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--users', type=int, default=100)
+	parser.add_argument('--duration', type=float, default=10)
+	args = parser.parse_args()
+
+	asyncio.run(main(args.users, args.duration))
@@ -0,0 +1,113 @@
+"""Нагрузка на процессор при подборе паролей с лимитами входов и без них.
+
+Создает пользователей с известным паролем и заданное время отправляет
+в приложение в этом же процессе входы с неверными паролями с нескольких
+адресов, как при credential stuffing. Без лимитов каждая попытка проверяет
+пароль, и процессор занят хешированием. С лимитами лишние попытки отклоняются
+до хеширования, большая часть из них - локальными корзинами воркера без
+обращения к Redis. Хеширование выполняется в пуле потоков, поэтому время
+процессора процесса включает его.
+
+Нужны Postgres и Redis из настроек приложения. Запуск из каталога src:
+	python tests/benchmarks/signin_flood.py --attackers 200 --ips 10 --duration 10
+"""
+import argparse
+import asyncio
+import sys
+import time
+import uuid
+from collections import Counter
+
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+import httpx
+from sqlalchemy import delete
+
+from core.config import settings
+from core.hashing import hash_context
+from db.postgres import async_session
+from main import app, lifespan
+from models.entity import User
+from services import rate_limiter
+
+
+async def seed(prefix: str, users_number: int) -> list[str]:
+	password_hash = hash_context.hash('benchmark-password')
+	usernames = [f'{prefix}-user-{i}' for i in range(users_number)]
+	async with async_session() as session:
+		session.add_all([
+			User(username, '', email=f'{username}@example.com', password_hash=password_hash)
+			for username in usernames
+		])
+		await session.commit()
+	return usernames
+
+
+async def clean_up(prefix: str) -> None:
+	async with async_session() as session:
+		await session.execute(delete(User).where(User.username.like(f'{prefix}-%')))
+		await session.commit()
+
+
+async def run_attack(usernames: list[str], attackers: int, ips: int, duration: float) -> tuple[Counter, float, float]:
+	"""Возвращает коды ответов, время процессора и длительность атаки."""
+	clients = [
+		httpx.AsyncClient(transport=httpx.ASGITransport(app=app, client=(f'10.0.0.{i + 1}', 0)), base_url='http://auth')
+		for i in range(ips)
+	]
+	statuses = Counter()
+	deadline = time.perf_counter() + duration
+
+	async def attacker(number: int) -> None:
+		client = clients[number % ips]
+		attempt = 0
+		while time.perf_counter() < deadline:
+			response = await client.post(
+				'/api/v1/users/signin',
+				json={'username': usernames[(number + attempt) % len(usernames)], 'password': f'wrong-{attempt}'},
+				headers={'User-Agent': 'benchmark-user-agent'},
+			)
+			statuses[response.status_code] += 1
+			attempt += 1
+
+	started_at, cpu_started_at = time.perf_counter(), time.process_time()
+	await asyncio.gather(*(attacker(i) for i in range(attackers)))
+	elapsed, cpu = time.perf_counter() - started_at, time.process_time() - cpu_started_at
+
+	for client in clients:
+		await client.aclose()
+	return statuses, cpu, elapsed
+
+
+async def main(users_number: int, attackers: int, ips: int, duration: float) -> None:
+	settings.PASSWORD_HASHER_EXECUTOR = 'thread'
+	prefix = f'bench-{uuid.uuid4().hex[:8]}'
+	usernames = await seed(prefix, users_number)
+
+	try:
+		for is_enabled in (False, True):
+			settings.RATE_LIMIT_ENABLED = is_enabled
+			rate_limiter.rate_limiter = None
+			async with lifespan(app):
+				statuses, cpu, elapsed = await run_attack(usernames, attackers, ips, duration)
+			print(
+				f'{"with limits" if is_enabled else "no limits":<12}'
+				f'{sum(statuses.values()) / elapsed:10.0f} requests/s  '
+				f'CPU {cpu / elapsed:5.2f} cores  '
+				f'statuses {dict(sorted(statuses.items()))}'
+			)
+	finally:
+		await clean_up(prefix)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--users', type=int, default=1000)
+	parser.add_argument('--attackers', type=int, default=200)
+	parser.add_argument('--ips', type=int, default=10)
+	parser.add_argument('--duration', type=float, default=10)
+	args = parser.parse_args()
+
+	asyncio.run(main(args.users, args.attackers, args.ips, args.duration))
@@ -0,0 +1,129 @@
+"""Сравнение загрузки привилегий пользователя через ORM и одним SQL-запросом.
+
+Создает в тестовой базе пользователя с заданным числом групп и привилегий,
+замеряет обе реализации и удаляет созданные данные.
+
+Запуск из каталога src:
+	python tests/benchmarks/user_permissions.py --groups 50 --permissions 20
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+import uuid
+
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from models.entity import User, Group, Permission
+from services.user_services import UserService
+from tests.functional.settings import test_settings
+
+
+dsn = (
+	f'{test_settings.POSTGRES_SCHEME}://{test_settings.POSTGRES_USER}:'
+	f'{test_settings.POSTGRES_PASSWORD}@{test_settings.POSTGRES_HOST}:'
+	f'{test_settings.POSTGRES_PORT}/{test_settings.POSTGRES_DB}'
+)
+
+
+async def get_user_permissions_orm(session: AsyncSession, user_id: uuid.UUID) -> list[str]:
+	"""Прежняя реализация: загрузка пользователя с группами и привилегиями через joined-связи."""
+	user = (await session.execute(
+		select(User).where(User.id == user_id)
+	)).unique().scalar()
+
+	permissions_in_groups = [group.permissions for group in user.groups]
+	permissions_names = []
+	for permissions_in_group in permissions_in_groups:
+		permissions_names.extend(
+			[permission_in_group.permission_name for permission_in_group in permissions_in_group]
+		)
+
+	return list(set(permissions_names))
+
+
+async def seed(session: AsyncSession, prefix: str, groups_number: int, permissions_number: int) -> User:
+	permissions = [Permission(f'{prefix}-permission-{i}') for i in range(permissions_number)]
+	groups = [
+		# каждая группа получает половину привилегий со сдвигом, чтобы наборы пересекались
+		Group(
+			f'{prefix}-group-{i}',
+			[permissions[(i + j) % permissions_number] for j in range(max(permissions_number // 2, 1))]
+		)
+		for i in range(groups_number)
+	]
+	user = User(f'{prefix}-user', '', password_hash='benchmark')
+	user.groups = groups
+	session.add_all([*permissions, *groups, user])
+	await session.commit()
+	return user
+
+
+async def clean_up(session: AsyncSession, prefix: str) -> None:
+	await session.execute(delete(User).where(User.username.like(f'{prefix}-%')))
+	await session.execute(delete(Group).where(Group.group_name.like(f'{prefix}-%')))
+	await session.execute(delete(Permission).where(Permission.permission_name.like(f'{prefix}-%')))
+	await session.commit()
+
+
+async def measure(func, rounds: int) -> list[float]:
+	timings = []
+	for _ in range(rounds):
+		started_at = time.perf_counter()
+		await func()
+		timings.append((time.perf_counter() - started_at) * 1000)
+	return timings
+
+
+async def main(groups_number: int, permissions_number: int, rounds: int) -> None:
+	engine = create_async_engine(dsn)
+	async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+	prefix = f'bench-{uuid.uuid4().hex[:8]}'
+
+	async with async_session() as session:
+		user = await seed(session, prefix, groups_number, permissions_number)
+		user_id = user.id
+		session.expunge_all()
+
+		user_service = UserService(token_handler=None, db=session, password_hasher=None, permissions_cache=None)
+
+		async def orm_implementation():
+			await get_user_permissions_orm(session, user_id)
+			session.expunge_all()
+
+		async def sql_implementation():
+			await user_service.get_user_permissions_from_db(user_id)
+
+		try:
+			assert sorted(await get_user_permissions_orm(session, user_id)) == \
+				sorted(await user_service.get_user_permissions_from_db(user_id))
+			session.expunge_all()
+
+			for name, func in (('orm', orm_implementation), ('single query', sql_implementation)):
+				timings = await measure(func, rounds)
+				print(
+					f'{name:<16}'
+					f'mean {statistics.mean(timings):8.2f} ms  '
+					f'p50 {statistics.median(timings):8.2f} ms  '
+					f'max {max(timings):8.2f} ms'
+				)
+		finally:
+			await clean_up(session, prefix)
+
+	await engine.dispose()
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--groups', type=int, default=50)
+	parser.add_argument('--permissions', type=int, default=20)
+	parser.add_argument('--rounds', type=int, default=50)
+	args = parser.parse_args()
+
+	asyncio.run(main(args.groups, args.permissions, args.rounds))
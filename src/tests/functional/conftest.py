@@ -28,4 +28,5 @@ pytest_plugins = [
 	'tests.functional.api_fixtures',
 	'tests.functional.postgres_fixtures',
 	'tests.functional.jwt_fixtures',
+	'tests.functional.explain_fixtures',
 ]
\ No newline at end of file
@@ -0,0 +1,61 @@
+import json
+from contextlib import contextmanager
+
+import pytest_asyncio
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .postgres_fixtures import engine
+from .settings import test_settings
+
+
+def get_scanned_relations(plan: dict):
+	"""Обходит план запроса и возвращает таблицы, которые читаются последовательно."""
+	if plan['Node Type'] == 'Seq Scan':
+		yield plan['Relation Name']
+	for child_plan in plan.get('Plans', []):
+		yield from get_scanned_relations(child_plan)
+
+
+class QueryPlanChecker:
+	"""Собирает запросы, выполненные сервисами, и проверяет их планы через EXPLAIN.
+
+	Последовательное чтение таблиц, в которых меньше max_rows строк, допустимо:
+	для маленьких таблиц планировщик выбирает его и при наличии индекса.
+	"""
+
+	def __init__(self, session: AsyncSession, max_rows: int) -> None:
+		self.session = session
+		self.max_rows = max_rows
+		self.statements = []
+
+	def _on_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+		self.statements.append((statement, parameters))
+
+	@contextmanager
+	def capture(self):
+		event.listen(engine.sync_engine, 'before_cursor_execute', self._on_execute)
+		try:
+			yield self
+		finally:
+			event.remove(engine.sync_engine, 'before_cursor_execute', self._on_execute)
+
+	async def get_seq_scans(self) -> list[str]:
+		connection = await self.session.connection()
+		table_sizes = dict((await self.session.execute(
+			text("SELECT relname, reltuples FROM pg_class WHERE relkind IN ('r', 'p')")
+		)).all())
+
+		seq_scans = []
+		for statement, parameters in self.statements:
+			plan = (await connection.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {statement}', parameters)).scalar()
+			plan = json.loads(plan) if isinstance(plan, str) else plan
+			for relation in get_scanned_relations(plan[0]['Plan']):
+				if table_sizes.get(relation, 0) > self.max_rows:
+					seq_scans.append(f'Seq Scan on {relation}: {statement}')
+		return seq_scans
+
+
+@pytest_asyncio.fixture(scope='function')
+def query_plan_checker(init_session: AsyncSession) -> QueryPlanChecker:
+	return QueryPlanChecker(init_session, test_settings.SEQ_SCAN_MAX_ROWS)
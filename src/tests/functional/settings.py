@@ -11,8 +11,14 @@ class TestSettings(BaseSettings):
 	POSTGRES_DB: str = 'users_test'
 	POSTGRES_USER: str = 'postgres'
 	POSTGRES_SCHEME: str = 'postgresql+asyncpg'
+	# второй экземпляр Postgres, который играет роль реплики в тестах маршрутизации
+	POSTGRES_REPLICA_HOST: str = 'database-replica'
+	POSTGRES_REPLICA_PORT: int = 5432
 
 	SERVICE_URL: str = 'http://fastapi:8000'
 
+	# таблицы больше этого размера не должны читаться запросами сервисов последовательно
+	SEQ_SCAN_MAX_ROWS: int = 1000
+
 
 test_settings = TestSettings()
@@ -0,0 +1,32 @@
+import gc
+
+import httpx
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from main import app, lifespan
+
+
+REQUESTS_NUMBER = 200
+
+
+def count_sessions() -> int:
+	gc.collect()
+	return sum(isinstance(obj, AsyncSession) for obj in gc.get_objects())
+
+
+async def test_sessions_are_not_retained_after_requests():
+	sessions_before = count_sessions()
+
+	async with lifespan(app):
+		transport = httpx.ASGITransport(app=app)
+		async with httpx.AsyncClient(transport=transport, base_url='http://auth') as client:
+			for i in range(REQUESTS_NUMBER):
+				response = await client.post(
+					'/api/v1/users/signin',
+					json={'username': f'unknown-user-{i}', 'password': 'password123'},
+					headers={'User-Agent': 'test-user-agent'},
+				)
+				assert response.status_code == 401
+
+	# сервисы создаются на каждый запрос и не держат закрытые сессии
+	assert count_sessions() == sessions_before
@@ -0,0 +1,45 @@
+import json
+import uuid
+from http import HTTPStatus
+
+import jwt
+
+from core import jwt_keys
+from core.jwt_keys import JWTKeySet, generate_private_key, load_keys
+from services.tokens import RequestAuthJWT
+from tests.functional.settings import test_settings
+
+
+JWKS_URL = test_settings.SERVICE_URL + '/.well-known/jwks.json'
+
+
+async def test_jwks_served_with_cache_headers(fastapi_session):
+	async with fastapi_session.get(JWKS_URL) as response:
+		assert response.status == HTTPStatus.OK
+		assert 'max-age' in response.headers['Cache-Control']
+		assert 'keys' in await response.json()
+		etag = response.headers['ETag']
+
+	async with fastapi_session.get(JWKS_URL, headers={'If-None-Match': etag}) as response:
+		assert response.status == HTTPStatus.NOT_MODIFIED
+
+
+async def test_token_signed_by_rotated_key_still_verified(tmp_path, monkeypatch):
+	(tmp_path / 'old.pem').write_bytes(generate_private_key('EdDSA'))
+	(tmp_path / 'new.pem').write_bytes(generate_private_key('RS256'))
+	keys = load_keys(str(tmp_path))
+
+	monkeypatch.setattr(jwt_keys, 'jwt_key_set', JWTKeySet('EdDSA', keys, 'old'))
+	token_pair = await RequestAuthJWT().create_token_pair('superuser', {'user_id': str(uuid.uuid4())})
+
+	# ротация: новый ключ подписывает токены, старый остается для проверки
+	key_set = JWTKeySet('RS256', keys, 'new')
+	monkeypatch.setattr(jwt_keys, 'jwt_key_set', key_set)
+	authorize = RequestAuthJWT()
+
+	new_token_pair = await authorize.create_token_pair('superuser', {'user_id': str(uuid.uuid4())})
+
+	assert jwt.get_unverified_header(new_token_pair.access_token)['kid'] == 'new'
+	assert await authorize.get_raw_jwt(token_pair.access_token) == token_pair.access_claims
+	assert await authorize.get_raw_jwt(new_token_pair.access_token) == new_token_pair.access_claims
+	assert {key['kid'] for key in json.loads(key_set.jwks)['keys']} == {'old', 'new'}
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+
+from db.redis import InMemoryStorage, RedisStorage
+from tests.functional.settings import test_settings
+
+
+@pytest_asyncio.fixture(scope='function', params=['redis', 'memory'])
+async def storage(request):
+	"""Одни и те же проверки выполняются на Redis и на хранилище в памяти."""
+	if request.param == 'memory':
+		yield InMemoryStorage()
+		return
+
+	storage = RedisStorage(host=test_settings.REDIS_HOST, port=test_settings.REDIS_PORT, decode_responses=True)
+	yield storage
+	await storage.close()
+
+
+async def test_mset_mget(storage):
+	await storage.mset({'test:first': 1, 'test:second': 'value'}, 60)
+
+	assert await storage.mget('test:first', 'test:second', 'test:missing') == ['1', 'value', None]
+	await storage.delete('test:first', 'test:second')
+
+
+async def test_incr_sets_expire_once(storage):
+	assert await storage.incr('test:counter', expired_time=1) == 1
+	assert await storage.incr('test:counter', 2, expired_time=60) == 3
+
+	# время жизни задано первым увеличением и не продлевается
+	await asyncio.sleep(1.1)
+	assert await storage.get('test:counter') is None
+
+
+async def test_set_operations(storage):
+	await storage.sadd('test:set', 'first', 'second', expired_time=60)
+	await storage.srem('test:set', 'first')
+
+	assert await storage.smembers('test:set') == {'second'}
+	assert await storage.sismember('test:set', 'second')
+	assert not await storage.sismember('test:set', 'first')
+	await storage.delete('test:set')
+
+
+async def test_pipeline_returns_results_in_order(storage):
+	async with storage.pipeline() as pipe:
+		pipe.set('test:key', 'value', 60)
+		pipe.incr('test:counter', expired_time=60)
+		pipe.sadd('test:set', 'member', expired_time=60)
+		pipe.get('test:key')
+		pipe.delete('test:key', 'test:counter', 'test:set')
+		results = await pipe.execute()
+
+	assert results == [None, 1, None, 'value', None]
+	assert await storage.get('test:key') is None
+
+
+async def test_publish_subscribe(storage):
+	subscribed = asyncio.Event()
+
+	async def on_subscribe():
+		subscribed.set()
+
+	async def receive() -> str:
+		async for message in storage.subscribe('test:channel', on_subscribe=on_subscribe):
+			return message
+
+	receiver = asyncio.create_task(receive())
+	await subscribed.wait()
+	await storage.publish('test:channel', 'message')
+
+	assert await asyncio.wait_for(receiver, 1) == 'message'
+
+
+def incrby(storage: InMemoryStorage, keys: list[str], args: list) -> int:
+	value = int(storage.read(keys[0]) or 0) + int(args[0])
+	storage.write(keys[0], str(value))
+	return value
+
+
+async def test_register_script(storage):
+	script = storage.register_script("return redis.call('INCRBY', KEYS[1], ARGV[1])", incrby)
+	try:
+		# в Redis второй вызов идет по EVALSHA
+		assert await script(['test:script'], [2]) == 2
+		assert await script(['test:script'], [3]) == 5
+		assert await storage.get('test:script') == '5'
+	finally:
+		await storage.delete('test:script')
+
+
+def test_memory_script_requires_python_implementation():
+	with pytest.raises(ValueError):
+		InMemoryStorage().register_script('return 1')
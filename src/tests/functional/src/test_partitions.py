@@ -0,0 +1,39 @@
+import gzip
+from datetime import date, datetime
+
+from sqlalchemy import text
+
+from db.partitions import MonthlyPartitions, add_months, get_partition_name
+from models.entity import User, UserLoginHistory
+
+
+TABLE = UserLoginHistory.__tablename__
+
+
+async def test_login_history_partition_lifecycle(create_fake_user_in_db, init_session, tmp_path):
+	fake_user = User(username='fake-user', password='123456789')
+	await create_fake_user_in_db(fake_user)
+	# месяц далеко в будущем, для него еще нет партиции
+	month = add_months(date.today().replace(day=1), 60)
+	history = UserLoginHistory(user_id=fake_user.id, user_agent='fake-user-agent')
+	history.login_at = datetime(month.year, month.month, 15)
+	init_session.add(history)
+	await init_session.commit()
+
+	partitions = MonthlyPartitions(init_session, TABLE, 'login_at')
+	assert month not in await partitions.get_months()
+
+	# строка переносится из партиции по умолчанию в созданную партицию
+	assert month in await partitions.create_ahead(month, 0)
+	partition = (await init_session.execute(
+		text(f'SELECT tableoid::regclass::text FROM {TABLE} WHERE id = :id'), {'id': history.id}
+	)).scalar()
+	assert partition == get_partition_name(TABLE, month)
+
+	await partitions.detach(month)
+	path = await partitions.export(month, str(tmp_path))
+	await partitions.drop(month)
+
+	assert month not in await partitions.get_months()
+	with gzip.open(path, 'rt') as file:
+		assert str(history.id) in file.read()
@@ -0,0 +1,56 @@
+import pytest
+import pytest_asyncio
+from prometheus_client import REGISTRY
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+
+from core.config import Settings
+from db.postgres import create_engine
+from tests.functional.settings import test_settings
+
+
+def get_metric(name: str) -> float:
+	return REGISTRY.get_sample_value(name) or 0
+
+
+@pytest_asyncio.fixture(scope='function')
+async def small_engine():
+	engine = create_engine(Settings(
+		POSTGRES_PASSWORD=test_settings.POSTGRES_PASSWORD,
+		POSTGRES_HOST=test_settings.POSTGRES_HOST,
+		POSTGRES_PORT=test_settings.POSTGRES_PORT,
+		POSTGRES_DB=test_settings.POSTGRES_DB,
+		POSTGRES_USER=test_settings.POSTGRES_USER,
+		POSTGRES_POOL_SIZE=1,
+		POSTGRES_MAX_OVERFLOW=1,
+		POSTGRES_POOL_TIMEOUT=0.1,
+		POSTGRES_STATEMENT_TIMEOUT=100,
+	))
+	yield engine
+	await engine.dispose()
+
+
+async def test_statement_timeout(small_engine):
+	async with small_engine.connect() as connection:
+		with pytest.raises(DBAPIError):
+			await connection.execute(text('SELECT pg_sleep(1)'))
+
+
+async def test_pool_metrics(small_engine):
+	overflow = get_metric('postgres_pool_overflow_total')
+	timeouts = get_metric('postgres_pool_timeouts_total')
+	checked_out = get_metric('postgres_pool_checked_out')
+
+	async with small_engine.connect() as first, small_engine.connect() as second:
+		await first.execute(text('SELECT 1'))
+		await second.execute(text('SELECT 1'))
+		assert get_metric('postgres_pool_checked_out') == checked_out + 2
+
+		with pytest.raises(PoolTimeoutError):
+			async with small_engine.connect() as third:
+				await third.execute(text('SELECT 1'))
+
+	assert get_metric('postgres_pool_checked_out') == checked_out
+	assert get_metric('postgres_pool_overflow_total') == overflow + 1
+	assert get_metric('postgres_pool_timeouts_total') == timeouts + 1
+	assert get_metric('postgres_pool_wait_seconds_count') >= 3
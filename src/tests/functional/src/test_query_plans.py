@@ -0,0 +1,66 @@
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, text
+
+from models.entity import User
+from services.history import HistoryEvent, HistoryWriter
+from services.refresh_sessions import RefreshRotation, RefreshSessionMirror
+from services.user_services import UserService
+from tests.functional.postgres_fixtures import async_session
+
+
+SEED_ROWS = 10000
+USER_AGENT = 'test-user-agent'
+
+
+async def seed_tables(session) -> None:
+	"""Заполняет таблицы так, чтобы последовательное чтение стало заметно дороже индекса."""
+	statements = [
+		"INSERT INTO users (id, username, password) "
+		"SELECT gen_random_uuid(), 'user-' || i, 'password' FROM generate_series(1, :rows) AS i",
+		"INSERT INTO user_login_history (id, user_id, user_agent, login_at) "
+		"SELECT gen_random_uuid(), id, :user_agent, now() FROM users",
+		"INSERT INTO refresh_sessions (id, user_id, refresh_jti, user_agent, created_at, expired_at, is_active) "
+		"SELECT gen_random_uuid(), id, gen_random_uuid()::text, :user_agent, now(), now(), false FROM users",
+		"INSERT INTO groups (id, group_name) VALUES (gen_random_uuid(), 'subscribers')",
+		"INSERT INTO permissions (id, permission_name) VALUES (gen_random_uuid(), 'movies.read')",
+		"INSERT INTO groups_permissions (group_id, permission_id) SELECT groups.id, permissions.id FROM groups, permissions",
+		"INSERT INTO groups_users (group_id, user_id) SELECT groups.id, users.id FROM groups, users",
+	]
+	for statement in statements:
+		await session.execute(text(statement), {'rows': SEED_ROWS, 'user_agent': USER_AGENT})
+	await session.commit()
+	await session.execute(text('ANALYZE'))
+
+
+async def test_service_queries_use_indexes(init_session, query_plan_checker):
+	await seed_tables(init_session)
+	user_id, username = (await init_session.execute(select(User.id, User.username).limit(1))).one()
+	user_id = str(user_id)
+	user_service = UserService(None, init_session, None, None)
+	now = datetime.utcnow()
+	refresh_claims = {'jti': str(uuid.uuid4()), 'exp': int((now + timedelta(days=1)).timestamp())}
+
+	# проверяются запросы, которые выполняет приложение, с теми же построителями
+	with query_plan_checker.capture():
+		await init_session.execute(UserService._get_signin_state_query(username, USER_AGENT))
+		await init_session.execute(UserService._get_signin_write_query(user_id, USER_AGENT, refresh_claims, 5, None))
+		await init_session.commit()
+		await user_service._rotate_refresh_session_in_db(
+			user_id, USER_AGENT, refresh_claims['jti'], {'jti': str(uuid.uuid4()), 'exp': refresh_claims['exp']},
+		)
+		await RefreshSessionMirror(async_session).write(init_session, [
+			RefreshRotation(user_id, USER_AGENT, str(uuid.uuid4()), str(uuid.uuid4()), now, now + timedelta(days=1)),
+		])
+		await user_service.del_refresh_session_in_db(user_id, USER_AGENT)
+		await HistoryWriter(async_session).write(init_session, [
+			HistoryEvent('login', user_id, USER_AGENT, now),
+			HistoryEvent('logout', user_id, USER_AGENT, now),
+		])
+		await user_service.get_user_permissions_from_db(user_id)
+		_, next_cursor = await user_service.get_login_history(user_id, 1)
+		await user_service.get_login_history(user_id, 1, cursor=next_cursor)
+		await user_service.get_login_history_count(user_id)
+
+	assert await query_plan_checker.get_seq_scans() == []
@@ -0,0 +1,109 @@
+import uuid
+from http import HTTPStatus
+
+import httpx
+import pytest
+import pytest_asyncio
+
+from db.redis import InMemoryStorage, RedisStorage
+from main import app, lifespan
+from services.rate_limiter import RateLimit, RateLimiter, RateLimitExceeded, get_rate_limiter
+from tests.functional.settings import test_settings
+
+
+LIMITS = [
+	RateLimit('ip', 10, 60),
+	RateLimit('username', 3, 60),
+	RateLimit('global', 100, 1),
+]
+
+
+@pytest_asyncio.fixture(scope='function', params=['redis', 'memory'])
+async def storage(request):
+	"""Лимиты проверяются на Redis и на хранилище в памяти."""
+	if request.param == 'memory':
+		yield InMemoryStorage()
+		return
+
+	storage = RedisStorage(host=test_settings.REDIS_HOST, port=test_settings.REDIS_PORT, decode_responses=True)
+	yield storage
+	await storage.close()
+
+
+@pytest.fixture
+def action() -> str:
+	"""Свое действие на тест, чтобы тесты не делили корзины в Redis."""
+	return f'test-{uuid.uuid4()}'
+
+
+async def test_username_limit(storage, action):
+	rate_limiter = RateLimiter(storage, LIMITS)
+	for _ in range(3):
+		await rate_limiter.check(action, '127.0.0.1', 'user')
+
+	with pytest.raises(RateLimitExceeded) as error:
+		await rate_limiter.check(action, '127.0.0.1', 'user')
+	assert error.value.scope == 'username'
+	# следующий токен появится через period / limit секунд
+	assert 19 < error.value.retry_after <= 20
+
+	# другие пользователи с того же адреса не ограничены
+	await rate_limiter.check(action, '127.0.0.1', 'other-user')
+
+
+async def test_limits_shared_between_workers(storage, action):
+	workers = [RateLimiter(storage, LIMITS), RateLimiter(storage, LIMITS)]
+	await workers[0].check(action, '127.0.0.1', 'user')
+	await workers[1].check(action, '127.0.0.1', 'user')
+	await workers[1].check(action, '127.0.0.1', 'user')
+
+	# локальная корзина первого воркера не пуста, отказывает общая корзина в Redis
+	with pytest.raises(RateLimitExceeded) as error:
+		await workers[0].check(action, '127.0.0.1', 'user')
+	assert error.value.scope == 'username'
+
+
+async def test_flood_shed_without_redis(storage, action):
+	rate_limiter = RateLimiter(storage, LIMITS)
+	script = rate_limiter._script
+	calls = 0
+
+	async def counting_script(keys, args):
+		nonlocal calls
+		calls += 1
+		return await script(keys, args)
+
+	rate_limiter._script = counting_script
+	rejected = 0
+	for i in range(1000):
+		try:
+			await rate_limiter.check(action, '10.0.0.1', f'user-{i}')
+		except RateLimitExceeded:
+			rejected += 1
+
+	assert rejected == 990
+	assert calls == 10
+
+
+async def test_signin_returns_retry_after(storage):
+	rate_limiter = RateLimiter(storage, [RateLimit('username', 2, 60)])
+	app.dependency_overrides[get_rate_limiter] = lambda: rate_limiter
+	username = f'unknown-user-{uuid.uuid4()}'
+
+	try:
+		async with lifespan(app):
+			transport = httpx.ASGITransport(app=app)
+			async with httpx.AsyncClient(transport=transport, base_url='http://auth') as client:
+				statuses = []
+				for _ in range(3):
+					response = await client.post(
+						'/api/v1/users/signin',
+						json={'username': username, 'password': 'password123'},
+						headers={'User-Agent': 'test-user-agent'},
+					)
+					statuses.append(response.status_code)
+	finally:
+		app.dependency_overrides.clear()
+
+	assert statuses == [HTTPStatus.UNAUTHORIZED, HTTPStatus.UNAUTHORIZED, HTTPStatus.TOO_MANY_REQUESTS]
+	assert response.headers['Retry-After'] == '30'
@@ -0,0 +1,144 @@
+import asyncio
+import time
+import uuid
+from http import HTTPStatus
+
+import pytest
+import pytest_asyncio
+from fastapi import HTTPException
+from prometheus_client import REGISTRY
+from redis.asyncio import Redis
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+
+from core.config import Settings
+from db.redis import create_redis_storage
+from db.storage import TokenHandler
+from tests.functional.settings import test_settings
+
+
+# Redis не отвечает клиентам это число миллисекунд после CLIENT PAUSE
+PAUSE_MS = 1000
+
+
+def get_metric(name: str, labels: dict | None = None) -> float:
+	return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def get_token(now: int) -> dict:
+	return {'jti': str(uuid.uuid4()), 'user_id': str(uuid.uuid4()), 'iat': now, 'exp': now + 600}
+
+
+@pytest_asyncio.fixture(scope='function')
+async def small_storage():
+	storage = create_redis_storage(Settings(
+		POSTGRES_PASSWORD=test_settings.POSTGRES_PASSWORD,
+		REDIS_HOST=test_settings.REDIS_HOST,
+		REDIS_PORT=test_settings.REDIS_PORT,
+		REDIS_MAX_CONNECTIONS=2,
+		REDIS_POOL_TIMEOUT=0.1,
+		REDIS_SOCKET_TIMEOUT=0.2,
+		REDIS_RETRY_ATTEMPTS=1,
+		REDIS_RETRY_BACKOFF_BASE=0.01,
+		REDIS_RETRY_BACKOFF_CAP=0.05,
+	))
+	yield storage
+	await storage.close()
+
+
+@pytest_asyncio.fixture(scope='function')
+async def pause_redis():
+	"""Приостанавливает обработку команд всех клиентов Redis на PAUSE_MS миллисекунд."""
+	admin = Redis(host=test_settings.REDIS_HOST, port=test_settings.REDIS_PORT)
+
+	async def pause() -> None:
+		await admin.execute_command('CLIENT', 'PAUSE', PAUSE_MS, 'ALL')
+
+	yield pause
+	# следующий тест начинается после окончания паузы
+	await asyncio.sleep(PAUSE_MS / 1000)
+	await admin.aclose()
+
+
+async def test_command_timeout_while_paused(small_storage, pause_redis):
+	await small_storage.set('test:key', 'value', 60)
+	await pause_redis()
+
+	started_at = time.perf_counter()
+	with pytest.raises(RedisTimeoutError):
+		await small_storage.get('test:key')
+	# две попытки по REDIS_SOCKET_TIMEOUT и задержка между ними, а не вся пауза
+	assert time.perf_counter() - started_at < PAUSE_MS / 1000
+
+	await asyncio.sleep(PAUSE_MS / 1000)
+	assert await small_storage.get('test:key') == 'value'
+	await small_storage.delete('test:key')
+
+
+async def test_pool_metrics_while_paused(small_storage, pause_redis):
+	errors = get_metric('redis_pool_errors_total')
+	in_use = get_metric('redis_pool_in_use')
+	await small_storage.get('test:key')
+	await pause_redis()
+
+	# пул из двух соединений занят зависшими командами, третья не дожидается соединения
+	results = await asyncio.gather(*[small_storage.get('test:key') for _ in range(3)], return_exceptions=True)
+
+	assert sum(isinstance(result, RedisTimeoutError) for result in results) == 2
+	assert sum(isinstance(result, RedisConnectionError) for result in results) == 1
+	assert get_metric('redis_pool_errors_total') == errors + 1
+	assert get_metric('redis_pool_in_use') == in_use
+	assert get_metric('redis_pool_wait_seconds_count') >= 4
+
+
+async def test_pool_metrics_when_connection_refused():
+	# на этом порту никто не слушает
+	storage = create_redis_storage(Settings(
+		POSTGRES_PASSWORD=test_settings.POSTGRES_PASSWORD,
+		REDIS_HOST='127.0.0.1',
+		REDIS_PORT=1,
+		REDIS_SOCKET_CONNECT_TIMEOUT=0.2,
+		REDIS_POOL_TIMEOUT=0.5,
+	))
+	errors = get_metric('redis_pool_errors_total')
+	in_use = get_metric('redis_pool_in_use')
+
+	for _ in range(3):
+		with pytest.raises(RedisConnectionError):
+			await storage.get('test:key')
+	await storage.close()
+
+	# соединения, которые не удалось открыть, не считаются выданными
+	assert get_metric('redis_pool_in_use') == in_use
+	assert get_metric('redis_pool_errors_total') == errors + 3
+
+
+async def test_denylist_fail_open_while_paused(small_storage, pause_redis):
+	token_handler = TokenHandler(small_storage, negative_ttl=0, redis_timeout=0.1, failure_policy='open')
+	now = int(time.time())
+	revoked_token = get_token(now)
+	await token_handler.put_token_in_denylist(revoked_token)
+	failures = get_metric('token_denylist_redis_failures_total', {'policy': 'open'})
+	await pause_redis()
+
+	started_at = time.perf_counter()
+	await token_handler.check_if_token_is_valid(get_token(now))
+	assert time.perf_counter() - started_at < 0.2
+	assert get_metric('token_denylist_redis_failures_total', {'policy': 'open'}) == failures + 1
+
+	# токен, отзыв которого известен воркеру, отклоняется и без Redis
+	with pytest.raises(HTTPException) as error:
+		await token_handler.check_if_token_is_valid(revoked_token)
+	assert error.value.status_code == HTTPStatus.UNAUTHORIZED
+
+
+async def test_denylist_fail_closed_while_paused(small_storage, pause_redis):
+	token_handler = TokenHandler(small_storage, negative_ttl=0, redis_timeout=0.1, failure_policy='closed')
+	await pause_redis()
+
+	started_at = time.perf_counter()
+	with pytest.raises(HTTPException) as error:
+		await token_handler.check_if_token_is_valid(get_token(int(time.time())))
+
+	assert time.perf_counter() - started_at < 0.2
+	assert error.value.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+	assert error.value.headers['Retry-After'] == '1'
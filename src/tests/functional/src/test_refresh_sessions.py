@@ -0,0 +1,170 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import pytest_asyncio
+from sqlalchemy import select, update
+
+from db.redis import InMemoryStorage, RedisStorage
+from models.entity import RefreshSession
+from services.refresh_sessions import RedisRefreshSessionStore, RefreshRotation, RefreshSessionMirror
+from tests.functional.postgres_fixtures import async_session
+from tests.functional.settings import test_settings
+
+
+def make_refresh_claims() -> dict:
+	return {
+		'jti': str(uuid.uuid4()),
+		'exp': int((datetime.now() + timedelta(days=1)).timestamp()),
+	}
+
+
+@pytest_asyncio.fixture(scope='function')
+async def redis_storage():
+	storage = RedisStorage(host=test_settings.REDIS_HOST, port=test_settings.REDIS_PORT, decode_responses=True)
+	yield storage
+	await storage.close()
+
+
+@pytest_asyncio.fixture(scope='function', params=['redis', 'memory'])
+async def storage(request):
+	"""Хранилище сессий проверяется на Redis и на хранилище в памяти."""
+	if request.param == 'memory':
+		yield InMemoryStorage()
+		return
+
+	storage = RedisStorage(host=test_settings.REDIS_HOST, port=test_settings.REDIS_PORT, decode_responses=True)
+	yield storage
+	await storage.close()
+
+
+async def test_redis_store_rotates_session(create_fake_login, redis_storage, init_session):
+	fake_login = await create_fake_login()
+	user_id = str(fake_login['user'].id)
+	user_agent = fake_login['user_agent']
+	old_jti = fake_login['user_session'].refresh_jti
+
+	mirror = RefreshSessionMirror(async_session, flush_interval=60)
+	mirror.start()
+	store = RedisRefreshSessionStore(redis_storage, mirror)
+	try:
+		await store.put(user_id, user_agent, {'jti': old_jti, 'exp': make_refresh_claims()['exp']})
+		new_claims = make_refresh_claims()
+
+		assert (await store.rotate(user_id, user_agent, old_jti, new_claims)).status == 'rotated'
+		assert (await store.rotate(user_id, 'other-user-agent', new_claims['jti'], make_refresh_claims())).status == 'not_found'
+	finally:
+		await mirror.close()
+		await store.delete_all(user_id)
+
+	result = await init_session.execute(
+		select(RefreshSession.refresh_jti, RefreshSession.is_active).
+		where(RefreshSession.user_id == fake_login['user'].id).
+		order_by(RefreshSession.created_at)
+	)
+	assert result.all() == [(old_jti, False), (new_claims['jti'], True)]
+
+
+def make_rotation(user_id: str, user_agent: str, old_jti: str, refresh_claims: dict) -> RefreshRotation:
+	return RefreshRotation(
+		user_id,
+		user_agent,
+		old_jti,
+		refresh_claims['jti'],
+		datetime.utcnow(),
+		datetime.fromtimestamp(refresh_claims['exp']),
+	)
+
+
+async def test_mirror_writes_rotation_chain_in_one_batch(create_fake_login, init_session):
+	fake_login = await create_fake_login()
+	user_id = str(fake_login['user'].id)
+	old_jti = fake_login['user_session'].refresh_jti
+	first_claims, second_claims = make_refresh_claims(), make_refresh_claims()
+
+	mirror = RefreshSessionMirror(async_session, flush_interval=60)
+	mirror.start()
+	await mirror.put(make_rotation(user_id, fake_login['user_agent'], old_jti, first_claims))
+	await mirror.put(make_rotation(user_id, fake_login['user_agent'], first_claims['jti'], second_claims))
+	await mirror.close()
+
+	result = await init_session.execute(
+		select(RefreshSession.refresh_jti, RefreshSession.is_active, RefreshSession.replaced_by).
+		where(RefreshSession.user_id == fake_login['user'].id).
+		order_by(RefreshSession.created_at)
+	)
+	assert result.all() == [
+		(old_jti, False, first_claims['jti']),
+		(first_claims['jti'], False, second_claims['jti']),
+		(second_claims['jti'], True, None),
+	]
+
+
+async def test_mirror_skips_rotation_of_closed_session(create_fake_login, init_session):
+	fake_login = await create_fake_login()
+	user = fake_login['user']
+	old_jti = fake_login['user_session'].refresh_jti
+	# выход закрыл сессию в Postgres раньше, чем записалась ее ротация
+	await init_session.execute(update(RefreshSession).where(RefreshSession.user_id == user.id).values(is_active=False))
+	await init_session.commit()
+
+	mirror = RefreshSessionMirror(async_session, flush_interval=60)
+	mirror.start()
+	await mirror.put(make_rotation(str(user.id), fake_login['user_agent'], old_jti, make_refresh_claims()))
+	await mirror.close()
+
+	result = await init_session.execute(
+		select(RefreshSession.refresh_jti, RefreshSession.is_active).
+		where(RefreshSession.user_id == user.id)
+	)
+	assert result.all() == [(old_jti, False)]
+
+
+async def test_redis_store_delete(storage):
+	store = RedisRefreshSessionStore(storage)
+	user_id = str(uuid.uuid4())
+	claims = make_refresh_claims()
+	await store.put(user_id, 'first-user-agent', claims)
+	await store.put(user_id, 'second-user-agent', make_refresh_claims())
+
+	await store.delete(user_id, 'first-user-agent')
+	assert (await store.rotate(user_id, 'first-user-agent', claims['jti'], make_refresh_claims())).status == 'not_found'
+
+	await store.delete_all(user_id)
+	assert await storage.get(store._get_key(user_id)) is None
+
+
+async def test_redis_store_parallel_rotations_have_one_winner(storage):
+	store = RedisRefreshSessionStore(storage)
+	user_id = str(uuid.uuid4())
+	claims = make_refresh_claims()
+	await store.put(user_id, 'fake-user-agent', claims)
+	try:
+		results = await asyncio.gather(*(
+			store.rotate(user_id, 'fake-user-agent', claims['jti'], make_refresh_claims())
+			for _ in range(200)
+		))
+	finally:
+		await store.delete_all(user_id)
+
+	statuses = [result.status for result in results]
+	assert statuses.count('rotated') == 1
+	# проигравшие предъявили уже замененный токен
+	assert statuses.count('reused') == 199
+
+
+async def test_redis_store_detects_reuse(storage):
+	store = RedisRefreshSessionStore(storage)
+	user_id = str(uuid.uuid4())
+	old_claims, new_claims = make_refresh_claims(), make_refresh_claims()
+	await store.put(user_id, 'fake-user-agent', old_claims)
+	try:
+		await store.rotate(user_id, 'fake-user-agent', old_claims['jti'], new_claims)
+		result = await store.rotate(user_id, 'other-user-agent', old_claims['jti'], make_refresh_claims())
+
+		assert result == ('reused', 'fake-user-agent')
+		# цепочка устройства закрыта, новый токен владельца тоже не действует
+		result = await store.rotate(user_id, 'fake-user-agent', new_claims['jti'], make_refresh_claims())
+		assert result.status == 'not_found'
+	finally:
+		await store.delete_all(user_id)
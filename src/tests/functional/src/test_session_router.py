@@ -0,0 +1,83 @@
+import uuid
+
+import pytest_asyncio
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from db.postgres import Replica, SessionRouter
+from db.redis import InMemoryStorage
+from db.storage import PermissionsCache
+from services.user_services import UserService
+from tests.functional.postgres_fixtures import async_session
+from tests.functional.settings import test_settings
+
+
+# маршрутизация проверяется по адресу сервера, который выполнил запрос
+SERVER_ADDR_QUERY = text('SELECT inet_server_addr()')
+
+
+@pytest_asyncio.fixture(scope='function')
+async def replica_session_factory():
+	dsn = (
+		f'{test_settings.POSTGRES_SCHEME}://{test_settings.POSTGRES_USER}:'
+		f'{test_settings.POSTGRES_PASSWORD}@{test_settings.POSTGRES_REPLICA_HOST}:'
+		f'{test_settings.POSTGRES_REPLICA_PORT}/{test_settings.POSTGRES_DB}'
+	)
+	engine = create_async_engine(dsn)
+	yield async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+	await engine.dispose()
+
+
+async def get_server_addr(session: AsyncSession):
+	return (await session.execute(SERVER_ADDR_QUERY)).scalar()
+
+
+async def test_reads_go_to_primary_after_write(replica_session_factory):
+	router = SessionRouter(async_session(), Replica(replica_session_factory, max_lag=1, check_interval=60))
+	try:
+		primary_addr = await get_server_addr(router.primary)
+		replica_addr = await get_server_addr(await router.get_reader())
+		assert replica_addr != primary_addr
+
+		await router.primary.commit()
+
+		assert await router.get_reader() is router.primary
+	finally:
+		await router.close()
+
+
+async def test_lagging_replica_is_skipped(replica_session_factory):
+	# отставание не бывает отрицательным, поэтому реплика всегда считается отстающей
+	router = SessionRouter(async_session(), Replica(replica_session_factory, max_lag=-1, check_interval=60))
+	try:
+		assert await router.get_reader() is router.primary
+	finally:
+		await router.close()
+
+
+async def test_reads_go_to_primary_without_replicas():
+	router = SessionRouter(async_session())
+	try:
+		assert await router.get_reader() is router.primary
+	finally:
+		await router.close()
+
+
+async def test_cached_permissions_are_read_from_primary(replica_session_factory):
+	statements = []
+	replica_engine = replica_session_factory.kw['bind']
+	listener = lambda conn, cursor, statement, *args: statements.append(statement)  # noqa: E731
+	event.listen(replica_engine.sync_engine, 'before_cursor_execute', listener)
+
+	router = SessionRouter(async_session(), Replica(replica_session_factory, max_lag=1, check_interval=60))
+	permissions_cache = PermissionsCache(InMemoryStorage(), 60)
+	user_service = UserService(None, router.primary, None, permissions_cache, sessions=router)
+	try:
+		# реплика свежая, но привилегии, которые попадут в кеш, читаются с основного сервера
+		assert await router.get_reader() is not router.primary
+		assert await user_service.get_user_permissions(str(uuid.uuid4())) == []
+	finally:
+		event.remove(replica_engine.sync_engine, 'before_cursor_execute', listener)
+		await router.close()
+
+	assert not [statement for statement in statements if 'permission' in statement]
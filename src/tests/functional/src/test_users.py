@@ -1,10 +1,29 @@
+import asyncio
+import base64
+import json
+import sys
 from http import HTTPStatus
 
 import pytest
-from datetime import datetime
+from datetime import datetime, timedelta
 from http import HTTPStatus
 
+from fastapi import HTTPException
+from sqlalchemy import event, select
+
+from core.hashing import Argon2Hasher, PasswordHasher, hash_context
+from db.redis import RedisStorage
+from db.storage import TokenHandler
 from models.entity import User, RefreshSession, UserLoginHistory
+from services.tokens import RequestAuthJWT
+from services.user_services import UserService
+from services.history import ACTIVE_LOGIN_WINDOW, HistoryEvent, HistoryWriter
+from tests.functional.postgres_fixtures import async_session, engine
+from tests.functional.settings import test_settings
+
+
+# интервал записи истории входов по умолчанию с запасом
+HISTORY_WRITE_DELAY = 1.5
 
 
 @pytest.mark.parametrize(
@@ -213,6 +232,8 @@ async def test_get_one_history_user(
     }
     created_user = await make_post_request('users/signup', first_user)
     await make_post_request('users/signin', signin_data)
+    # история входов пишется в базу данных с задержкой
+    await asyncio.sleep(HISTORY_WRITE_DELAY)
 
     user_id = created_user.get('body').get('id')
 
@@ -522,3 +543,266 @@ async def test_negative_refresh_tokens(
 
     assert result.get('body').keys() == expected_response.keys()
     assert result.get('status') == status_code
+
+
+async def test_signin_query_count(create_superuser, init_session):
+    """Вход выполняет два запроса к базе данных и одну фиксацию транзакции."""
+    await create_superuser('superuser', 'password123')
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)  # noqa: E731
+    event.listen(engine.sync_engine, 'before_cursor_execute', listener)
+
+    password_hasher = PasswordHasher(hash_context)
+    storage = RedisStorage(host=test_settings.REDIS_HOST, port=test_settings.REDIS_PORT, decode_responses=True)
+    history_writer = HistoryWriter(async_session)
+    history_writer.start()
+    user_service = UserService(
+        TokenHandler(storage), init_session, password_hasher, None, history_writer=history_writer,
+    )
+    try:
+        token_pair = await user_service.signin(
+            'superuser', 'password123', 'test-user-agent', RequestAuthJWT(), max_sessions=5,
+        )
+    finally:
+        event.remove(engine.sync_engine, 'before_cursor_execute', listener)
+        password_hasher.shutdown()
+        await storage.close()
+        await history_writer.close()
+
+    assert len(statements) == 2
+    assert token_pair.access_claims['permissions'] == ['*.*']
+    session = (await init_session.execute(
+        select(RefreshSession).where(RefreshSession.refresh_jti == token_pair.refresh_claims['jti'])
+    )).scalar()
+    assert session.is_active
+
+
+async def test_get_history_user_by_cursor(
+    make_get_request,
+    create_fake_user_in_db,
+    create_fake_history_in_db,
+):
+    fake_user = User(
+        username='fake-user',
+        password='123456789',
+        email='foo@example.com',
+        first_name='Aliver',
+        last_name='Stone'
+    )
+    await create_fake_user_in_db(fake_user)
+    for i in range(5):
+        await create_fake_history_in_db(UserLoginHistory(user_id=fake_user.id, user_agent=f'user-agent-{i}'))
+
+    items, cursor = [], None
+    while True:
+        query_data = {'page_size': 2, 'cursor': cursor} if cursor else {'page_size': 2, 'with_total': 'true'}
+        result = await make_get_request(f'users/{fake_user.id}/get_history', query_data)
+        assert result.get('status') == HTTPStatus.OK
+        if not cursor:
+            assert result.get('body').get('total') == 5
+        items.extend(result.get('body').get('items'))
+        cursor = result.get('body').get('next_cursor')
+        if not cursor:
+            break
+
+    assert len(items) == 5
+    assert [item['user_agent'] for item in items] == [f'user-agent-{i}' for i in reversed(range(5))]
+
+
+async def test_history_writer_writes_batch(create_fake_user_in_db, init_session):
+    fake_user = User(
+        username='fake-user',
+        password='123456789',
+        email='foo@example.com',
+        first_name='Aliver',
+        last_name='Stone'
+    )
+    await create_fake_user_in_db(fake_user)
+    history_writer = HistoryWriter(async_session, batch_size=10, flush_interval=60)
+    history_writer.start()
+    for i in range(3):
+        await history_writer.put_login(str(fake_user.id), f'user-agent-{i}')
+    await history_writer.put_logout(str(fake_user.id), 'user-agent-0')
+    # close дописывает пачку, не дожидаясь интервала записи
+    await history_writer.close()
+
+    result = await init_session.execute(
+        select(UserLoginHistory).
+        where(UserLoginHistory.user_id == fake_user.id).
+        order_by(UserLoginHistory.user_agent)
+    )
+    history = result.scalars().all()
+
+    assert [item.user_agent for item in history] == [f'user-agent-{i}' for i in range(3)]
+    assert [item.logout_at is not None for item in history] == [True, False, False]
+
+
+async def test_logout_closes_only_latest_login(create_fake_user_in_db, create_fake_history_in_db, init_session):
+    users = [
+        User(username=f'fake-user-{i}', password='123456789', email=f'foo{i}@example.com')
+        for i in range(2)
+    ]
+    now = datetime.utcnow()
+    for user in users:
+        await create_fake_user_in_db(user)
+        for minutes_ago in (10, 5):
+            history = UserLoginHistory(user_id=user.id, user_agent='fake-user-agent')
+            history.login_at = now - timedelta(minutes=minutes_ago)
+            await create_fake_history_in_db(history)
+        await create_fake_history_in_db(UserLoginHistory(user_id=user.id, user_agent='other-user-agent'))
+
+    logout = HistoryEvent('logout', str(users[0].id), 'fake-user-agent', now)
+    result = await init_session.execute(HistoryWriter.get_logouts_statement([logout]))
+    await init_session.commit()
+
+    assert result.rowcount == 1
+    result = await init_session.execute(
+        select(UserLoginHistory.user_id, UserLoginHistory.user_agent, UserLoginHistory.login_at).
+        where(UserLoginHistory.logout_at.is_not(None))
+    )
+    assert result.all() == [(users[0].id, 'fake-user-agent', now - timedelta(minutes=5))]
+
+
+async def test_logout_skips_logins_older_than_active_window(create_fake_login, create_fake_history_in_db, init_session):
+    fake_login = await create_fake_login()
+    now = datetime.utcnow()
+    # вход старше времени жизни refresh токена уже не активен, выход его не закрывает
+    history = UserLoginHistory(user_id=fake_login['user'].id, user_agent='old-user-agent')
+    history.login_at = now - ACTIVE_LOGIN_WINDOW - timedelta(days=1)
+    await create_fake_history_in_db(history)
+
+    logout = HistoryEvent('logout', str(fake_login['user'].id), 'old-user-agent', now)
+    result = await init_session.execute(HistoryWriter.get_logouts_statement([logout]))
+    await init_session.commit()
+
+    assert result.rowcount == 0
+
+
+async def test_del_refresh_session_touches_only_user_sessions(create_fake_user_in_db, create_fake_session_in_db, init_session):
+    users = [
+        User(username=f'fake-user-{i}', password='123456789', email=f'foo{i}@example.com')
+        for i in range(2)
+    ]
+    for i, user in enumerate(users):
+        await create_fake_user_in_db(user)
+        await create_fake_session_in_db(RefreshSession(
+            user_id=user.id,
+            refresh_jti=f'refresh-jti-{i}',
+            user_agent='fake-user-agent',
+            expired_at=datetime.utcnow() + timedelta(days=1),
+            is_active=True,
+        ))
+    user_service = UserService(None, init_session, None, None)
+
+    await user_service.del_refresh_session_in_db(str(users[0].id), 'fake-user-agent')
+
+    result = await init_session.execute(
+        select(RefreshSession.user_id).where(RefreshSession.is_active.is_(True))
+    )
+    assert result.scalars().all() == [users[1].id]
+
+
+async def test_parallel_refresh_has_one_winner(create_fake_login, make_post_request):
+    fake_data = await create_fake_login()
+    headers = {
+        'Authorization': f'Bearer {fake_data["refresh_token"]}',
+        'User-Agent': fake_data['user_agent'],
+    }
+
+    results = await asyncio.gather(*(
+        make_post_request('users/refresh-tokens', headers=headers) for _ in range(200)
+    ))
+
+    statuses = [result.get('status') for result in results]
+    assert statuses.count(HTTPStatus.OK) == 1
+    assert statuses.count(HTTPStatus.UNAUTHORIZED) == 199
+
+
+async def test_refresh_token_reuse_revokes_device_session(create_fake_login, make_post_request):
+    fake_data = await create_fake_login()
+    headers = {
+        'Authorization': f'Bearer {fake_data["refresh_token"]}',
+        'User-Agent': fake_data['user_agent'],
+    }
+    first_result = await make_post_request('users/refresh-tokens', headers=headers)
+    assert first_result.get('status') == HTTPStatus.OK
+
+    reuse_result = await make_post_request('users/refresh-tokens', headers=headers)
+    assert reuse_result.get('status') == HTTPStatus.UNAUTHORIZED
+
+    # после повторного использования закрыта и сессия, полученная при первом обновлении
+    result = await make_post_request(
+        'users/refresh-tokens',
+        headers={
+            'Authorization': f'Bearer {first_result.get("body").get("refresh_token")}',
+            'User-Agent': fake_data['user_agent'],
+        },
+    )
+    assert result.get('status') == HTTPStatus.UNAUTHORIZED
+
+
+async def test_refresh_after_logout_is_not_reuse(create_fake_login, make_post_request):
+    fake_data = await create_fake_login()
+    other_device = await make_post_request(
+        'users/signin',
+        {'username': fake_data['user'].username, 'password': '123456789'},
+        headers={'User-Agent': 'other-user-agent'},
+    )
+    assert other_device.get('status') == HTTPStatus.OK
+
+    logout_result = await make_post_request(
+        'users/logout',
+        headers={
+            'Authorization': f'Bearer {fake_data["access_token"]}',
+            'User-Agent': fake_data['user_agent'],
+        },
+    )
+    assert logout_result.get('status') == HTTPStatus.OK
+
+    result = await make_post_request(
+        'users/refresh-tokens',
+        headers={
+            'Authorization': f'Bearer {fake_data["refresh_token"]}',
+            'User-Agent': fake_data['user_agent'],
+        },
+    )
+    assert result.get('status') == HTTPStatus.UNAUTHORIZED
+
+    # токен закрытой выходом сессии недействителен, но не считается повторным
+    # использованием: access токены других устройств не отозваны
+    result = await make_post_request(
+        'users/logout',
+        headers={
+            'Authorization': f'Bearer {other_device.get("body").get("access_token")}',
+            'User-Agent': 'other-user-agent',
+        },
+    )
+    assert result.get('status') == HTTPStatus.OK
+
+
+@pytest.mark.parametrize(
+    'cursor_value',
+    [
+        ['2024-01-01T00:00:00', 5],
+        [5, 'cf02ca78-9a5c-4d18-9ea9-682e1b0cc0da'],
+        ['2024-01-01T00:00:00'],
+        {'login_at': '2024-01-01T00:00:00'},
+        None,
+    ]
+)
+def test_decode_malformed_history_cursor(cursor_value):
+    cursor = base64.urlsafe_b64encode(json.dumps(cursor_value).encode()).decode()
+
+    with pytest.raises(HTTPException) as error:
+        UserService.decode_history_cursor(cursor)
+    assert error.value.status_code == HTTPStatus.BAD_REQUEST
+
+
+def test_argon2_hash_without_package(monkeypatch):
+    password_hash = Argon2Hasher().hash('password123')
+    monkeypatch.setitem(sys.modules, 'argon2', None)
+    monkeypatch.setitem(sys.modules, 'argon2.exceptions', None)
+
+    # сохраненный argon2 хеш без пакета дает понятную ошибку, а не ImportError
+    with pytest.raises(RuntimeError):
+        Argon2Hasher().verify(password_hash, 'password123')
@@ -15,12 +15,12 @@ from tests.functional.logger import logger
 BACKOFF_MAX_TIME = 60
 
 if __name__ == '__main__':
-	async def connect_to_postgres() -> asyncpg.connection.Connection:
+	async def connect_to_postgres(host: str, port: int) -> asyncpg.connection.Connection:
 		conn = await asyncpg.connect(
 			user=test_settings.POSTGRES_USER,
 			password=test_settings.POSTGRES_PASSWORD,
-			host=test_settings.POSTGRES_HOST,
-			port=test_settings.POSTGRES_PORT
+			host=host,
+			port=port
 		)
 		return conn
 
@@ -29,9 +29,13 @@ if __name__ == '__main__':
 		(asyncpg.PostgresConnectionError, asyncpg.PostgresSyntaxError),
 		max_time=BACKOFF_MAX_TIME
 	)
-	async def wait_for_postgres():
-		conn = await connect_to_postgres()
-		logger.info('PostgreSQL connect OK')
+	async def wait_for_postgres(host: str, port: int):
+		conn = await connect_to_postgres(host, port)
+		logger.info('PostgreSQL %s connect OK', host)
 		await conn.close()
 
-	asyncio.run(wait_for_postgres())
+	async def wait_for_databases():
+		await wait_for_postgres(test_settings.POSTGRES_HOST, test_settings.POSTGRES_PORT)
+		await wait_for_postgres(test_settings.POSTGRES_REPLICA_HOST, test_settings.POSTGRES_REPLICA_PORT)
+
+	asyncio.run(wait_for_databases())